@@ -0,0 +1,49 @@
+"""Composite (device_id, ts DESC) index on readings
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-16 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A partitioned readings table (create_all, revision 0003) already has
+    # the index, and CONCURRENTLY is not supported on partitioned tables
+    partitioned = op.get_bind().scalar(
+        sa.text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('readings')")
+    )
+    # CONCURRENTLY cannot run inside a transaction; avoids locking out ingest
+    with op.get_context().autocommit_block():
+        if not partitioned:
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_readings_device_ts "
+                "ON readings (device_id, ts DESC)"
+            )
+            # Single-column device_id index is a prefix of the composite one
+            op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_readings_device_id")
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_devices_last_seen_at "
+            "ON devices (last_seen_at)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_readings_device_id "
+            "ON readings (device_id)"
+        )
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_readings_device_ts")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_devices_last_seen_at")
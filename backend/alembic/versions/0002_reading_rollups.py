@@ -0,0 +1,52 @@
+"""Reading rollup tables (1 minute / 1 hour / 1 day)
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-16 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ROLLUP_TABLES = ["reading_rollups_1m", "reading_rollups_1h", "reading_rollups_1d"]
+
+
+def upgrade() -> None:
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    for name in ROLLUP_TABLES:
+        if name in existing:
+            continue
+        op.create_table(
+            name,
+            sa.Column("device_id", sa.String(255), sa.ForeignKey("devices.device_id", ondelete="CASCADE"), nullable=False),
+            sa.Column("bucket_start", sa.DateTime(), nullable=False),
+            sa.Column("count", sa.Integer(), nullable=False),
+            sa.Column("value_sum", sa.Float(), nullable=False),
+            sa.Column("value_sum_sq", sa.Float(), nullable=False),
+            sa.Column("value_min", sa.Numeric(10, 4), nullable=False),
+            sa.Column("value_max", sa.Numeric(10, 4), nullable=False),
+            sa.Column("first_ts", sa.DateTime(), nullable=False),
+            sa.Column("first_value", sa.Numeric(10, 4), nullable=False),
+            sa.Column("last_ts", sa.DateTime(), nullable=False),
+            sa.Column("last_value", sa.Numeric(10, 4), nullable=False),
+            sa.Column("temp_count", sa.Integer(), nullable=False),
+            sa.Column("temp_sum", sa.Float(), nullable=False),
+            sa.Column("temp_min", sa.Numeric(5, 2)),
+            sa.Column("temp_max", sa.Numeric(5, 2)),
+            sa.PrimaryKeyConstraint("device_id", "bucket_start"),
+        )
+    # Existing readings are not rolled up here; run `python -m app.cli rollups rebuild`
+
+
+def downgrade() -> None:
+    for name in reversed(ROLLUP_TABLES):
+        op.drop_table(name)
@@ -0,0 +1,103 @@
+"""Range-partition readings by month on ts
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-16 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = "id, device_id, ts, value, unit, temperature_c, event_id, created_at"
+
+
+def _relkind(bind) -> Union[str, None]:
+    return bind.scalar(sa.text("SELECT relkind FROM pg_class WHERE oid = to_regclass('readings')"))
+
+
+def _set_aside(bind, suffix: str) -> None:
+    """Rename readings and everything it owns that would clash with the new table."""
+    op.execute(f"ALTER TABLE readings RENAME TO readings{suffix}")
+    op.execute(f"ALTER SEQUENCE IF EXISTS readings_id_seq RENAME TO readings{suffix}_id_seq")
+    indexes = bind.scalars(sa.text(
+        "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = :table"
+    ), {"table": f"readings{suffix}"}).all()
+    for index in indexes:
+        op.execute(f'ALTER INDEX "{index}" RENAME TO "{index}{suffix}"')
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if _relkind(bind) != "r":
+        # Missing, or already partitioned by create_all
+        return
+
+    # Copies every row; on large tables run this in a maintenance window
+    _set_aside(bind, "_unpartitioned")
+    op.execute(
+        "CREATE TABLE readings ("
+        " id BIGSERIAL,"
+        " device_id VARCHAR(255) NOT NULL CONSTRAINT readings_device_id_fkey REFERENCES devices(device_id) ON DELETE CASCADE,"
+        " ts TIMESTAMP NOT NULL,"
+        " value NUMERIC(10, 4) NOT NULL,"
+        " unit VARCHAR(50) NOT NULL,"
+        " temperature_c NUMERIC(5, 2),"
+        " event_id UUID,"
+        " created_at TIMESTAMP DEFAULT now(),"
+        " PRIMARY KEY (id, ts)"
+        ") PARTITION BY RANGE (ts)"
+    )
+    op.execute("CREATE TABLE readings_default PARTITION OF readings DEFAULT")
+    months = bind.scalars(sa.text(
+        "SELECT DISTINCT date_trunc('month', ts) FROM readings_unpartitioned"
+    )).all()
+    for month in months:
+        op.execute(
+            f"CREATE TABLE readings_p{month:%Y_%m} PARTITION OF readings "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{month:%Y-%m-%d}'::timestamp + interval '1 month')"
+        )
+    op.execute(f"INSERT INTO readings ({COLUMNS}) SELECT {COLUMNS} FROM readings_unpartitioned")
+    op.execute("SELECT setval('readings_id_seq', max(id)) FROM readings HAVING max(id) IS NOT NULL")
+    op.execute("DROP TABLE readings_unpartitioned")
+
+    # Built after the copy; indexes on the parent cascade to every partition
+    op.execute("CREATE INDEX ix_readings_ts ON readings (ts)")
+    op.execute("CREATE INDEX idx_readings_device_ts ON readings (device_id, ts DESC)")
+    op.execute("CREATE UNIQUE INDEX uq_readings_event_id_ts ON readings (event_id, ts)")
+    # Upcoming months are created by the API on startup (app.services.partition_service)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if _relkind(bind) != "p":
+        return
+
+    _set_aside(bind, "_partitioned")
+    op.execute(
+        "CREATE TABLE readings ("
+        " id SERIAL PRIMARY KEY,"
+        " device_id VARCHAR(255) NOT NULL CONSTRAINT readings_device_id_fkey REFERENCES devices(device_id) ON DELETE CASCADE,"
+        " ts TIMESTAMP NOT NULL,"
+        " value NUMERIC(10, 4) NOT NULL,"
+        " unit VARCHAR(50) NOT NULL,"
+        " temperature_c NUMERIC(5, 2),"
+        " event_id UUID,"
+        " created_at TIMESTAMP DEFAULT now()"
+        ")"
+    )
+    op.execute(f"INSERT INTO readings ({COLUMNS}) SELECT {COLUMNS} FROM readings_partitioned")
+    op.execute("SELECT setval('readings_id_seq', max(id)) FROM readings HAVING max(id) IS NOT NULL")
+    op.execute("DROP TABLE readings_partitioned CASCADE")
+
+    op.execute("CREATE INDEX ix_readings_ts ON readings (ts)")
+    op.execute("CREATE INDEX idx_readings_device_ts ON readings (device_id, ts DESC)")
+    op.execute("CREATE UNIQUE INDEX ix_readings_event_id ON readings (event_id)")
@@ -0,0 +1,42 @@
+"""Alert events (threshold excursions)
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-16 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if "alert_events" in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        "alert_events",
+        sa.Column("id", sa.BigInteger(), primary_key=True, autoincrement=True),
+        sa.Column("device_id", sa.String(255), sa.ForeignKey("devices.device_id", ondelete="CASCADE"), nullable=False),
+        sa.Column("kind", sa.String(10), nullable=False),
+        sa.Column("threshold", sa.Numeric(10, 4), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=False),
+        sa.Column("ended_at", sa.DateTime()),
+        sa.Column("peak_value", sa.Numeric(10, 4), nullable=False),
+        sa.Column("readings", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+    )
+    op.execute("CREATE INDEX idx_alert_events_device_started ON alert_events (device_id, started_at DESC)")
+    op.execute("CREATE UNIQUE INDEX uq_alert_events_open ON alert_events (device_id, kind) WHERE ended_at IS NULL")
+    # Past readings are not evaluated here; run `python -m app.cli alerts rebuild`
+
+
+def downgrade() -> None:
+    op.drop_table("alert_events")
@@ -0,0 +1,41 @@
+"""Stored device status
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-16 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    columns = {c["name"] for c in sa.inspect(op.get_bind()).get_columns("devices")}
+    if "status" in columns:
+        return
+    op.add_column("devices", sa.Column("status", sa.String(10), nullable=False, server_default="OFFLINE"))
+    op.add_column("devices", sa.Column("status_changed_at", sa.DateTime()))
+    # Same thresholds as app.services.device_service; the API keeps it current from here on
+    op.execute("""
+        UPDATE devices SET status = CASE
+            WHEN last_seen_at > (now() AT TIME ZONE 'UTC') - interval '15 minutes' THEN 'OK'
+            WHEN last_seen_at > (now() AT TIME ZONE 'UTC') - interval '24 hours' THEN 'STALE'
+            ELSE 'OFFLINE'
+        END
+    """)
+    op.create_index("ix_devices_status", "devices", ["status"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_devices_status", table_name="devices")
+    op.drop_column("devices", "status_changed_at")
+    op.drop_column("devices", "status")
@@ -0,0 +1,44 @@
+"""Per-device SPC state (EWMA / CUSUM drift detection)
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if "device_spc" in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        "device_spc",
+        sa.Column("device_id", sa.String(255), sa.ForeignKey("devices.device_id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("target_ri", sa.Float()),
+        sa.Column("n", sa.BigInteger(), nullable=False),
+        sa.Column("mean", sa.Float(), nullable=False),
+        sa.Column("m2", sa.Float(), nullable=False),
+        sa.Column("ewma", sa.Float(), nullable=False),
+        sa.Column("cusum_pos", sa.Float(), nullable=False),
+        sa.Column("cusum_neg", sa.Float(), nullable=False),
+        sa.Column("first_ts", sa.DateTime(), nullable=False),
+        sa.Column("first_value", sa.Float(), nullable=False),
+        sa.Column("last_ts", sa.DateTime(), nullable=False),
+        sa.Column("last_value", sa.Float(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+    )
+    # Existing readings are not folded in here; run `python -m app.cli spc rebuild`
+
+
+def downgrade() -> None:
+    op.drop_table("device_spc")
@@ -0,0 +1,50 @@
+"""Alert event endpoints"""
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from datetime import datetime
+from typing import List, Optional
+
+from app.db.database import get_db
+from app.db.models import AlertEvent
+from app.services.alert_service import alert_event_response
+from app.utils.timestamps import to_utc_naive
+
+router = APIRouter()
+
+
+@router.get("/alerts")
+async def list_alerts(
+    device_id: Optional[List[str]] = Query(None, description="Only these devices (repeatable; default: all)"),
+    active: Optional[bool] = Query(None, description="true: only open excursions, false: only ended ones"),
+    start: Optional[datetime] = Query(None, description="Only excursions starting at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only excursions starting before this time"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    List threshold excursions, most recent first.
+    
+    An excursion starts when a reading goes beyond alert_low / alert_high
+    and ends when readings are back inside by ALERT_HYSTERESIS. Only
+    excursions lasting at least ALERT_MIN_DURATION_S are recorded.
+    peak_value and readings of an open excursion are filled in when it ends.
+    """
+    start = to_utc_naive(start)
+    end = to_utc_naive(end)
+    if start and end and start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    
+    query = select(AlertEvent).order_by(AlertEvent.started_at.desc(), AlertEvent.id.desc()).limit(limit)
+    if device_id:
+        query = query.where(AlertEvent.device_id.in_(device_id))
+    if active is not None:
+        query = query.where(AlertEvent.ended_at.is_(None) if active else AlertEvent.ended_at.isnot(None))
+    if start:
+        query = query.where(AlertEvent.started_at >= start)
+    if end:
+        query = query.where(AlertEvent.started_at < end)
+    
+    events = (await db.execute(query)).scalars().all()
+    return {"alerts": [alert_event_response(event) for event in events]}
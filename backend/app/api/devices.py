@@ -1,21 +1,49 @@
 """Device management endpoints"""
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Float, cast, desc, or_, select, true
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 from datetime import datetime, timedelta
 
-from app.db.database import get_db
-from app.db.models import Device, Reading
-from app.services.device_service import get_device_status
+from app.db.database import get_db, get_read_db
+from app.db.models import Device, DeviceSpc, Reading
+from app.middleware.auth import get_api_key
+from app.services.aggregate_service import (
+    MAX_AGGREGATE_BUCKETS,
+    aggregate_converted,
+    aggregate_readings,
+    downsample_readings,
+)
+from app.services.device_cache import device_cache
+from app.services.response_cache import response_cache
+from app.services.spc_service import SPC_COLUMNS, drifting_condition, spc_response
+from app.services.units import convert_columns
+from app.utils.http_cache import cached_json, conditional_get
+from app.utils.timestamps import parse_interval, to_utc_naive
 
 router = APIRouter()
 
+# Columns of GET /devices/{device_id}/readings, numerics cast to float in SQL
+_READING_COLUMNS = (
+    Reading.id,
+    Reading.ts,
+    cast(Reading.value, Float).label("value"),
+    Reading.unit,
+    cast(Reading.temperature_c, Float).label("temperature_c"),
+)
+_READING_FIELDS = tuple(c.key for c in _READING_COLUMNS)
+
 
 @router.get("/devices")
 async def list_devices(
-    db: Session = Depends(get_db)
+    request: Request,
+    status: Optional[Literal["OK", "STALE", "OFFLINE"]] = Query(None, description="Only return devices in this status"),
+    limit: int = Query(1000, ge=1, le=5000),
+    after: Optional[str] = Query(None, description="Pagination cursor: next_after from the previous page"),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     List all devices with status and latest reading.
@@ -25,76 +53,309 @@ async def list_devices(
     - Last seen timestamp
     - Latest reading value
     - Status: OK / STALE / OFFLINE
+    
+    Served by a single query: the latest reading comes from a LATERAL join
+    on the (device_id, ts) index and status is the stored column kept
+    current by the status tracker, so filtering by status is an index
+    lookup. Pages are ordered by device_id; pass next_after back as `after`
+    for the next page.
+    
+    Carries an ETag and Last-Modified of the fleet's data version: a poll
+    with a matching If-None-Match gets 304, and an unchanged page is served
+    from the response cache, both without a query. Rows are plain column
+    tuples (numerics cast to float in SQL) serialized with orjson.
     """
-    devices = db.query(Device).all()
-    
-    result = []
-    for device in devices:
-        # Get latest reading
-        latest_reading = db.query(Reading).filter(
-            Reading.device_id == device.device_id
-        ).order_by(desc(Reading.ts)).first()
-        
-        # Determine status
-        # Extract datetime value from SQLAlchemy instance
-        # At runtime, device.last_seen_at is already Optional[datetime]
-        last_seen: Optional[datetime] = device.last_seen_at  # type: ignore[assignment]
-        status = get_device_status(last_seen)
-        
-        device_data = {
-            "device_id": device.device_id,
-            "name": device.name,
-            "last_seen_at": device.last_seen_at.isoformat() if device.last_seen_at else None,
-            "status": status,
-            "target_ri": float(device.target_ri) if device.target_ri else None,
-            "alert_low": float(device.alert_low) if device.alert_low else None,
-            "alert_high": float(device.alert_high) if device.alert_high else None,
+    conditional = conditional_get(request, db=db)
+    if conditional and conditional.ready:
+        return conditional.ready
+    
+    latest = (
+        select(cast(Reading.value, Float).label("value"), Reading.unit, Reading.ts)
+        .where(Reading.device_id == Device.device_id)
+        .order_by(desc(Reading.ts))
+        .limit(1)
+        .lateral("latest")
+    )
+    query = (
+        select(
+            Device.device_id,
+            Device.name,
+            Device.last_seen_at,
+            Device.status,
+            cast(Device.target_ri, Float),
+            cast(Device.alert_low, Float),
+            cast(Device.alert_high, Float),
+            latest.c.value,
+            latest.c.unit,
+            latest.c.ts
+        )
+        .outerjoin(latest, true())
+        .order_by(Device.device_id)
+        .limit(limit)
+    )
+    if status:
+        query = query.where(Device.status == status)
+    if after:
+        query = query.where(Device.device_id > after)
+    
+    rows = (await db.execute(query)).all()
+    
+    # Datetimes are left to orjson, which writes them like isoformat()
+    result = [
+        {
+            "device_id": device_id,
+            "name": name,
+            "last_seen_at": last_seen_at,
+            "status": device_status,
+            "target_ri": target_ri,
+            "alert_low": alert_low,
+            "alert_high": alert_high,
+            "latest_reading": {"value": value, "unit": unit, "ts": ts} if ts is not None else None,
         }
-        
-        if latest_reading:
-            device_data["latest_reading"] = {
-                "value": float(latest_reading.value),
-                "unit": latest_reading.unit,
-                "ts": latest_reading.ts.isoformat()
-            }
-        else:
-            device_data["latest_reading"] = None
-        
-        result.append(device_data)
+        for device_id, name, last_seen_at, device_status, target_ri, alert_low, alert_high, value, unit, ts in rows
+    ]
     
-    return {"devices": result}
+    return cached_json(conditional, {
+        "devices": result,
+        "next_after": result[-1]["device_id"] if len(result) == limit else None
+    })
+
+
+@router.get("/devices/spc")
+async def list_device_spc(
+    drifting: Optional[bool] = Query(None, description="true: only devices flagged as drifting, false: only those in control"),
+    limit: int = Query(1000, ge=1, le=5000),
+    after: Optional[str] = Query(None, description="Pagination cursor: next_after from the previous page"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Statistical process control state of every device's RI readings.
+    
+    Per device: count, mean and standard deviation (Welford), EWMA and the
+    upper / lower CUSUM against target_ri, maintained at ingest. `drift` is
+    "high" or "low" once a CUSUM exceeds SPC_CUSUM_H or the EWMA is further
+    than SPC_EWMA_LIMIT from target_ri, usually well before readings cross
+    alert_low / alert_high; null while in control or without a target.
+    Devices without RI readings report n = 0. Served by a single query,
+    paged by device_id like GET /devices.
+    """
+    query = (
+        select(*SPC_COLUMNS)
+        .outerjoin(DeviceSpc, DeviceSpc.device_id == Device.device_id)
+        .order_by(Device.device_id)
+        .limit(limit)
+    )
+    if drifting is not None:
+        query = query.where(drifting_condition() if drifting else ~drifting_condition())
+    if after:
+        query = query.where(Device.device_id > after)
+    
+    result = [spc_response(row) for row in await db.execute(query)]
+    return {
+        "devices": result,
+        "next_after": result[-1]["device_id"] if len(result) == limit else None
+    }
+
+
+class DeviceUpdate(BaseModel):
+    name: Optional[str] = Field(None, max_length=255, description="Human-readable name")
+    target_ri: Optional[float] = Field(None, description="Target refractive index")
+    alert_low: Optional[float] = Field(None, description="Lower alert boundary")
+    alert_high: Optional[float] = Field(None, description="Upper alert boundary")
+
+
+@router.patch("/devices/{device_id}")
+async def update_device(
+    device_id: str,
+    update: DeviceUpdate,
+    db: AsyncSession = Depends(get_db),
+    api_key: Optional[str] = Depends(get_api_key)
+):
+    """
+    Update device configuration.
+    
+    Only fields present in the body change; send null to clear one. The
+    device's ingest cache entry is dropped so the new thresholds are used
+    by the next reading.
+    """
+    device = await db.get(Device, device_id)
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    
+    for field, value in update.model_dump(exclude_unset=True).items():
+        setattr(device, field, value)
+    if device.alert_low is not None and device.alert_high is not None and device.alert_low > device.alert_high:
+        raise HTTPException(status_code=400, detail="alert_low must not exceed alert_high")
+    
+    await db.commit()
+    device_cache.invalidate(device_id)
+    response_cache.bump(device_id)
+    
+    return {
+        "device_id": device.device_id,
+        "name": device.name,
+        "last_seen_at": device.last_seen_at.isoformat() if device.last_seen_at else None,
+        "status": device.status,
+        "target_ri": float(device.target_ri) if device.target_ri is not None else None,
+        "alert_low": float(device.alert_low) if device.alert_low is not None else None,
+        "alert_high": float(device.alert_high) if device.alert_high is not None else None,
+    }
 
 
 @router.get("/devices/{device_id}/readings")
 async def get_device_readings(
+    request: Request,
     device_id: str,
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db)
+    start: Optional[datetime] = Query(None, description="Only readings at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only readings before this time"),
+    after_ts: Optional[datetime] = Query(None, description="Cursor: ts of the last reading on the previous page"),
+    after_id: Optional[int] = Query(None, description="Cursor: id of the last reading on the previous page"),
+    layout: Literal["rows", "columns"] = Query("rows", description="rows: one object per reading; columns: one array per field"),
+    unit: Optional[Literal["RI", "Brix"]] = Query(None, description="Convert values to this unit (default: as stored)"),
+    compensate: bool = Query(False, description="Correct values to 20 °C using temperature_c"),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get reading history for a device.
     
-    Returns time-series data for charts/tables.
+    Returns time-series data for charts/tables, newest first: a list of
+    readings, or with layout=columns one array per field ({"ts": [...],
+    "value": [...], ...}) that chart libraries take as is.
+    
+    Pages are keyset-paginated on (ts, id): pass next_cursor's after_ts and
+    after_id to fetch the next page. Each page is an index range scan on
+    (device_id, ts DESC), so paging deep into history costs the same as the
+    first page.
+    
+    Conditional requests are answered from the device's data version like
+    GET /devices: 304 or a cached page without touching the database.
+    Readings are selected as column tuples, not ORM objects, and go to
+    orjson without per-row conversion.
+    
+    unit / compensate convert the value column of the page in one array
+    operation (see app.services.units).
     """
+    if (after_ts is None) != (after_id is None):
+        raise HTTPException(status_code=400, detail="after_ts and after_id must be given together")
+    
+    conditional = conditional_get(request, device_id, db)
+    if conditional and conditional.ready:
+        return conditional.ready
+    
     # Verify device exists
-    device = db.query(Device).filter(Device.device_id == device_id).first()
+    device = await db.get(Device, device_id)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
     
-    readings = db.query(Reading).filter(
-        Reading.device_id == device_id
-    ).order_by(desc(Reading.ts)).limit(limit).all()
+    query = select(*_READING_COLUMNS).where(Reading.device_id == device_id)
+    if start is not None:
+        query = query.where(Reading.ts >= to_utc_naive(start))
+    if end is not None:
+        query = query.where(Reading.ts < to_utc_naive(end))
+    if after_ts is not None:
+        after_ts = to_utc_naive(after_ts)
+        # ts <= after_ts bounds the index scan; the OR breaks ties on id
+        query = query.where(
+            Reading.ts <= after_ts,
+            or_(Reading.ts < after_ts, Reading.id < after_id)
+        )
     
-    return {
+    rows = (await db.execute(
+        query.order_by(desc(Reading.ts), desc(Reading.id)).limit(limit)
+    )).all()
+    
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = {"after_ts": rows[-1].ts, "after_id": rows[-1].id}
+    if rows and (unit is not None or compensate):
+        ids, ts, values, units, temperatures = zip(*rows)
+        values, units = convert_columns(values, units, temperatures, unit, compensate)
+        rows = list(zip(ids, ts, values, units, temperatures))
+    
+    if layout == "columns":
+        readings = {field: list(values) for field, values in zip(_READING_FIELDS, zip(*rows))} if rows else {
+            field: [] for field in _READING_FIELDS
+        }
+    else:
+        readings = [dict(zip(_READING_FIELDS, row)) for row in rows]
+    return cached_json(conditional, {
         "device_id": device_id,
-        "readings": [
-            {
-                "id": r.id,
-                "ts": r.ts.isoformat(),
-                "value": float(r.value),
-                "unit": r.unit,
-                "temperature_c": float(r.temperature_c) if r.temperature_c else None
-            }
-            for r in readings
-        ]
-    }
+        "readings": readings,
+        "next_cursor": next_cursor
+    })
+
+
+@router.get("/devices/{device_id}/readings/aggregate")
+async def get_device_readings_aggregate(
+    device_id: str,
+    bucket: str = Query("1h", description="Bucket width, e.g. 1m, 15m, 1h, 1d"),
+    start: Optional[datetime] = Query(None, description="Window start (default: 24 hours before end)"),
+    end: Optional[datetime] = Query(None, description="Window end, exclusive (default: now)"),
+    mode: Literal["buckets", "lttb"] = Query("buckets", description="buckets: per-bucket statistics; lttb: downsampled raw points"),
+    points: int = Query(1000, ge=3, le=10000, description="Maximum points returned in lttb mode"),
+    unit: Optional[Literal["RI", "Brix"]] = Query(None, description="Convert values to this unit (default: as stored)"),
+    compensate: bool = Query(False, description="Correct values to 20 °C using temperature_c"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Downsampled reading history for long time-range charts.
+    
+    - buckets: count and min/max/mean of value and temperature_c per time
+      bucket, computed in the database (from rollup tables when the bucket
+      and window line up with a rollup level)
+    - lttb: at most `points` raw readings chosen with Largest-Triangle-Three-Buckets,
+      preserving the visual shape of the series
+    
+    Payload size depends on the bucket count or `points`, not on the window length.
+    
+    With unit / compensate, values are converted per reading before
+    aggregating, so buckets are computed from raw readings (at most
+    LTTB_MAX_SOURCE_ROWS) instead of rollups.
+    """
+    end = to_utc_naive(end) if end else datetime.utcnow()
+    start = to_utc_naive(start) if start else end - timedelta(hours=24)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    
+    device = await db.get(Device, device_id)
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    
+    if mode == "lttb":
+        try:
+            data = await downsample_readings(db, device_id, start, end, points, unit, compensate)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return ORJSONResponse({
+            "device_id": device_id,
+            "mode": mode,
+            "start": start,
+            "end": end,
+            "points": data
+        })
+    
+    bucket_width = parse_interval(bucket)
+    if bucket_width is None:
+        raise HTTPException(status_code=400, detail=f"Invalid bucket: {bucket}. Use e.g. 1m, 15m, 1h, 1d")
+    if (end - start) / bucket_width > MAX_AGGREGATE_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Window spans more than {MAX_AGGREGATE_BUCKETS} buckets of {bucket}; use a wider bucket"
+        )
+    
+    if unit is not None or compensate:
+        try:
+            aggregate = await aggregate_converted(db, device_id, bucket_width, start, end, unit, compensate)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        aggregate = await aggregate_readings(db, device_id, bucket_width, start, end)
+    return ORJSONResponse({
+        "device_id": device_id,
+        "mode": mode,
+        "bucket": bucket,
+        "start": start,
+        "end": end,
+        **aggregate
+    })
@@ -0,0 +1,43 @@
+"""Bulk export endpoints"""
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+from typing import List, Literal, Optional
+
+from app.middleware.auth import get_api_key
+from app.services.export_service import EXPORT_FORMATS, export_readings, parquet_available
+from app.utils.timestamps import to_utc_naive
+
+router = APIRouter()
+
+
+@router.get("/readings/export")
+async def export_readings_endpoint(
+    format: Literal["ndjson", "csv", "parquet"] = Query("ndjson", description="Output format"),
+    device_id: Optional[List[str]] = Query(None, description="Devices to export (repeatable; default: all)"),
+    start: Optional[datetime] = Query(None, description="Only readings at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only readings before this time"),
+    unit: Optional[Literal["RI", "Brix"]] = Query(None, description="Convert values to this unit (default: as stored)"),
+    compensate: bool = Query(False, description="Correct values to 20 °C using temperature_c"),
+    api_key: Optional[str] = Depends(get_api_key)
+):
+    """
+    Stream full reading histories for audits and offline analysis.
+    
+    Rows are read through a server-side cursor and written to the response
+    as they are fetched, so memory use is constant however many rows match.
+    Output is grouped by device, oldest reading first.
+    """
+    start = to_utc_naive(start)
+    end = to_utc_naive(end)
+    if start and end and start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet export requires pyarrow on the server")
+    
+    return StreamingResponse(
+        export_readings(format, device_id, start, end, unit, compensate),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="readings.{format}"'}
+    )
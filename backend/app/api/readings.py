@@ -1,36 +1,79 @@
 """Reading ingestion endpoints"""
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from pydantic import BaseModel, Field
+from fastapi import APIRouter, Body, Depends, HTTPException, status
+from fastapi.responses import JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, Field, ValidationError, field_validator
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, List, Optional
+from time import perf_counter
 from uuid import UUID
+import os
 
 from app.db.database import get_db
 from app.db.models import Reading, Device
-from app.services.ingest_service import ingest_reading
+from app.services.ingest_buffer import INGEST_RETRY_AFTER_S, BufferFull, ingest_buffer
+from app.services.ingest_service import ingest_reading, ingest_readings_batch
+from app.services.metrics import batch_stages, reading_counts, single_stages
+from app.services.rate_limiter import Throttled, ingest_limiter
+from app.utils.body_decoding import DecodingRoute
+from app.utils.timestamps import to_utc_naive
 from app.utils.validate import validate_reading_payload
 from app.middleware.auth import get_api_key
 from typing import Optional
 
-router = APIRouter()
+# Bodies may be gzip/zstd compressed and JSON, MessagePack or CBOR (see app.utils.body_decoding)
+router = APIRouter(route_class=DecodingRoute)
+
+# Upper bound on items accepted by POST /readings:batch
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
 
 
 class ReadingPayload(BaseModel):
-    device_id: str = Field(..., description="Device identifier")
+    device_id: str = Field(..., min_length=1, max_length=255, description="Device identifier")
     ts: datetime = Field(..., description="Reading timestamp (ISO8601)")
     value: float = Field(..., description="Refractive index or Brix value")
     unit: str = Field(..., description="Unit: 'RI' or 'Brix'")
     temperature_c: Optional[float] = Field(None, description="Temperature in Celsius")
     event_id: Optional[UUID] = Field(None, description="Unique event ID for idempotency")
+    
+    @field_validator("ts")
+    @classmethod
+    def normalize_ts(cls, ts: datetime) -> datetime:
+        # Stored as naive UTC; offsets are converted rather than dropped
+        return to_utc_naive(ts)
 
 
-@router.post("/readings", status_code=status.HTTP_201_CREATED)
-async def create_reading(
+async def admitted_reading(
     payload: ReadingPayload,
-    db: Session = Depends(get_db),
     api_key: Optional[str] = Depends(get_api_key)
+) -> ReadingPayload:
+    """The reading of a POST /readings that passes the device and API key rate limits."""
+    await _admit(payload.device_id, api_key, uses_pool=not ingest_buffer.running)
+    return payload
+
+
+async def admitted_api_key(api_key: Optional[str] = Depends(get_api_key)) -> Optional[str]:
+    """The API key of a batch request that passes the API key rate limit (batches are not limited per device)."""
+    await _admit(None, api_key)
+    return api_key
+
+
+async def _admit(device_id: Optional[str], api_key: Optional[str], uses_pool: bool = True) -> None:
+    try:
+        await ingest_limiter.admit(device_id, api_key, uses_pool)
+    except Throttled as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+
+@router.post("/readings", status_code=status.HTTP_201_CREATED)
+async def create_reading(
+    payload: ReadingPayload = Depends(admitted_reading),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Ingest a device reading.
@@ -39,28 +82,124 @@ async def create_reading(
     - Enforces idempotency if event_id provided
     - Updates device last_seen_at
     - Returns created reading
+    
+    With INGEST_MODE=buffered the reading is queued instead and the
+    response is 202 with its event_id as acknowledgement (503 with
+    Retry-After when the queue is full).
+    
+    429 with Retry-After when the device or API key exceeds its rate
+    limit, or while the database pool is saturated (see
+    app.services.rate_limiter).
     """
     # Validate payload
+    clock = perf_counter()
     validation_error = validate_reading_payload(payload.unit, payload.value, payload.temperature_c)
+    single_stages.validation.lap(clock)
     if validation_error:
+        reading_counts.add("rejected")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=validation_error
         )
     
+    if ingest_buffer.running:
+        try:
+            return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=ingest_buffer.submit(payload))
+        except BufferFull as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e),
+                headers={"Retry-After": str(INGEST_RETRY_AFTER_S)}
+            )
+    
     try:
-        reading = ingest_reading(db, payload)
-        return {
-            "id": reading.id,
-            "device_id": reading.device_id,
-            "ts": reading.ts.isoformat(),
-            "value": float(reading.value),
-            "unit": reading.unit,
-            "temperature_c": float(reading.temperature_c) if reading.temperature_c else None,
-            "event_id": str(reading.event_id) if reading.event_id else None
-        }
+        return await ingest_reading(db, payload)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
+
+
+@router.post("/readings:batch")
+async def create_readings_batch(
+    items: List[Any] = Body(..., description="Array of reading payloads"),
+    api_key: Optional[str] = Depends(admitted_api_key),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Ingest many device readings in one request.
+    
+    - Validates every item independently
+    - Deduplicates event_ids in one set-based statement
+    - Updates each device's last_seen_at once
+    - Commits once for the whole batch
+    
+    Returns a result per item: created, duplicate, or rejected with a reason.
+    429 with Retry-After when the API key exceeds its rate limit or the
+    database pool is saturated; batches are not limited per device, so
+    a device catching up on its queue is not throttled.
+    """
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch of {len(items)} readings exceeds limit of {MAX_BATCH_SIZE}"
+        )
+    
+    clock = perf_counter()
+    results: List[Dict[str, Any]] = [{} for _ in items]
+    accepted: List[int] = []
+    payloads: List[ReadingPayload] = []
+    for i, item in enumerate(items):
+        try:
+            payload = ReadingPayload.model_validate(item)
+        except ValidationError as e:
+            results[i] = _rejected(i, item, _format_validation_error(e))
+            continue
+        
+        validation_error = validate_reading_payload(payload.unit, payload.value, payload.temperature_c)
+        if validation_error:
+            results[i] = _rejected(i, item, validation_error)
+            continue
+        
+        accepted.append(i)
+        payloads.append(payload)
+    batch_stages.validation.lap(clock)
+    reading_counts.add("rejected", len(items) - len(accepted))
+    
+    try:
+        for i, result in zip(accepted, await ingest_readings_batch(db, payloads)):
+            result["index"] = i
+            results[i] = result
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    return {
+        "created": sum(1 for r in results if r["status"] == "created"),
+        "duplicate": sum(1 for r in results if r["status"] == "duplicate"),
+        "rejected": sum(1 for r in results if r["status"] == "rejected"),
+        "results": results
+    }
+
+
+def _rejected(index: int, item: Any, reason: str) -> Dict[str, Any]:
+    event_id = item.get("event_id") if isinstance(item, dict) else None
+    if isinstance(event_id, bytes) and len(event_id) == 16:
+        event_id = UUID(bytes=event_id)  # binary UUID from a MessagePack body
+    return {
+        "index": index,
+        "status": "rejected",
+        "id": None,
+        "event_id": str(event_id) if event_id else None,
+        "reason": reason
+    }
+
+
+def _format_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc']) or 'body'}: {e['msg']}"
+        for e in error.errors()
+    )
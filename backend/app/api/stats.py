@@ -0,0 +1,37 @@
+"""Runtime statistics endpoints"""
+
+from fastapi import APIRouter
+
+from app.db.database import read_replica
+from app.services.alert_service import alert_tracker
+from app.services.device_cache import device_cache
+from app.services.idempotency import recent_events
+from app.services.ingest_buffer import ingest_buffer
+from app.services.live_hub import live_hub
+from app.services.rate_limiter import ingest_limiter
+from app.services.response_cache import response_cache
+from app.services.status_tracker import status_tracker
+from app.utils.body_decoding import supported_encodings
+
+router = APIRouter()
+
+
+@router.get("/stats")
+async def get_stats():
+    """
+    In-process counters for this worker.
+    
+    Each API worker keeps its own caches, so values differ between workers.
+    """
+    return {
+        "device_cache": device_cache.stats(),
+        "idempotency_cache": recent_events.stats(),
+        "ingest_buffer": ingest_buffer.stats(),
+        "rate_limiter": ingest_limiter.stats(),
+        "read_replica": read_replica.stats(),
+        "response_cache": response_cache.stats(),
+        "live_stream": live_hub.stats(),
+        "alerts": alert_tracker.stats(),
+        "status_tracker": status_tracker.stats(),
+        "ingest_encodings": supported_encodings(),
+    }
@@ -0,0 +1,62 @@
+"""Live push endpoints (Server-Sent Events)"""
+
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, List, Literal, Optional
+import asyncio
+import json
+
+from app.services.live_hub import LIVE_HEARTBEAT_S, Subscription, live_hub
+
+router = APIRouter()
+
+
+@router.get("/stream")
+async def stream_events(
+    device_id: Optional[List[str]] = Query(None, description="Devices to follow (repeatable; default: the whole fleet)"),
+    events: Optional[List[Literal["reading", "status"]]] = Query(None, description="Event types (repeatable; default: all)")
+):
+    """
+    Push newly stored readings and OK/STALE/OFFLINE transitions as they happen.
+    
+    A text/event-stream response (usable with the browser EventSource API)
+    carrying `reading` and `status` events. Events come from the ingest path
+    in memory, so open streams add no database queries. A `lagged` event
+    reports events dropped because the client read too slowly; refetch
+    state with GET /devices when it arrives.
+    """
+    subscription = live_hub.subscribe(
+        set(device_id) if device_id else None,
+        set(events) if events else {"reading", "status"}
+    )
+    return StreamingResponse(
+        _event_stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def _event_stream(subscription: Subscription) -> AsyncIterator[str]:
+    try:
+        # Reconnect delay for EventSource clients, in milliseconds
+        yield "retry: 3000\n\n"
+        reported = 0
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), LIVE_HEARTBEAT_S)
+            except asyncio.TimeoutError:
+                # Comment line: keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                return
+            if subscription.dropped > reported:
+                yield _sse("lagged", {"dropped": subscription.dropped - reported})
+                reported = subscription.dropped
+            yield _sse(event["type"], event)
+    finally:
+        live_hub.unsubscribe(subscription)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
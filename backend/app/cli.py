@@ -0,0 +1,144 @@
+"""
+Command-line maintenance tools
+
+Usage:
+    python -m app.cli rollups rebuild [--device-id ID] [--start TS] [--end TS]
+    python -m app.cli alerts rebuild [--device-id ID] [--start TS] [--end TS]
+    python -m app.cli spc rebuild [--device-id ID] [--start TS]
+    python -m app.cli partitions maintain [--retention-months N] [--retention-action drop|detach]
+    python -m app.cli partitions list
+    python -m app.cli export [--format ndjson|csv|parquet] [--device-id ID ...]
+                             [--start TS] [--end TS] [--unit RI|Brix] [--compensate] [--output PATH]
+"""
+
+import argparse
+import asyncio
+import sys
+from datetime import datetime
+
+from app.db.database import AsyncSessionLocal, async_engine
+from app.services.alert_service import rebuild_alerts
+from app.services.export_service import export_readings, parquet_available
+from app.services.partition_service import apply_retention, ensure_partitions, list_partitions
+from app.services.rollup_service import rebuild_rollups
+from app.services.spc_service import rebuild_spc
+from app.utils.timestamps import to_utc_naive
+
+
+def _timestamp(value: str) -> datetime:
+    return to_utc_naive(datetime.fromisoformat(value.replace("Z", "+00:00")))
+
+
+async def _rollups_rebuild(args: argparse.Namespace) -> None:
+    async with AsyncSessionLocal() as db:
+        written = await rebuild_rollups(db, args.device_id, args.start, args.end)
+    for level, rows in written.items():
+        print(f"  rollup_{level}: {rows} bucket(s) written")
+
+
+async def _alerts_rebuild(args: argparse.Namespace) -> None:
+    async with AsyncSessionLocal() as db:
+        totals = await rebuild_alerts(db, args.device_id, args.start, args.end)
+    print(f"  {totals['devices']} device(s), {totals['readings']} reading(s) scanned, {totals['events']} alert event(s) written")
+
+
+async def _spc_rebuild(args: argparse.Namespace) -> None:
+    async with AsyncSessionLocal() as db:
+        totals = await rebuild_spc(db, args.device_id, args.start)
+    print(f"  {totals['devices']} device(s), {totals['readings']} reading(s) scanned")
+
+
+async def _partitions_maintain(args: argparse.Namespace) -> None:
+    async with AsyncSessionLocal() as db:
+        created = await ensure_partitions(db)
+        retired = await apply_retention(db, months=args.retention_months, action=args.retention_action)
+    for name in created:
+        print(f"  created {name}")
+    for name in retired:
+        print(f"  retired {name}")
+
+
+async def _partitions_list(args: argparse.Namespace) -> None:
+    async with AsyncSessionLocal() as db:
+        for partition in await list_partitions(db):
+            bounds = f"{partition.start} .. {partition.end}" if partition.start else "DEFAULT"
+            print(f"  {partition.name}: {bounds}")
+
+
+async def _export(args: argparse.Namespace) -> None:
+    if args.format == "parquet" and not parquet_available():
+        sys.exit("Parquet export requires pyarrow")
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        async for chunk in export_readings(args.format, args.device_id, args.start, args.end, args.unit, args.compensate):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+        else:
+            out.flush()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="RefractIQ maintenance tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    rollups = commands.add_parser("rollups", help="Reading rollup tables")
+    rollup_commands = rollups.add_subparsers(dest="action", required=True)
+    rebuild = rollup_commands.add_parser("rebuild", help="Regenerate rollups from raw readings")
+    rebuild.add_argument("--device-id", help="Only this device (default: all)")
+    rebuild.add_argument("--start", type=_timestamp, help="ISO8601 start (widened to whole days)")
+    rebuild.add_argument("--end", type=_timestamp, help="ISO8601 end, exclusive (widened to whole days)")
+    rebuild.set_defaults(handler=_rollups_rebuild)
+    
+    alerts = commands.add_parser("alerts", help="Alert events")
+    alert_commands = alerts.add_subparsers(dest="action", required=True)
+    reevaluate = alert_commands.add_parser(
+        "rebuild",
+        help="Re-evaluate stored readings against current alert limits",
+        description="Re-evaluate stored readings against current alert limits. Running API workers keep "
+        "the open excursion of each device in memory: restart them afterwards so they load the rebuilt events."
+    )
+    reevaluate.add_argument("--device-id", help="Only this device (default: all with limits)")
+    reevaluate.add_argument("--start", type=_timestamp, help="ISO8601 start, inclusive")
+    reevaluate.add_argument("--end", type=_timestamp, help="ISO8601 end, exclusive")
+    reevaluate.set_defaults(handler=_alerts_rebuild)
+    
+    spc = commands.add_parser("spc", help="Statistical process control state")
+    spc_commands = spc.add_subparsers(dest="action", required=True)
+    recompute = spc_commands.add_parser("rebuild", help="Recompute SPC state from stored readings")
+    recompute.add_argument("--device-id", help="Only this device (default: all)")
+    recompute.add_argument("--start", type=_timestamp, help="ISO8601 start: state covers readings from here on (default: all)")
+    recompute.set_defaults(handler=_spc_rebuild)
+    
+    partitions = commands.add_parser("partitions", help="Monthly readings partitions")
+    partition_commands = partitions.add_subparsers(dest="action", required=True)
+    maintain = partition_commands.add_parser("maintain", help="Create upcoming partitions and apply retention")
+    maintain.add_argument("--retention-months", type=int, help="Override READINGS_RETENTION_MONTHS")
+    maintain.add_argument("--retention-action", choices=["drop", "detach"], help="Override READINGS_RETENTION_ACTION")
+    maintain.set_defaults(handler=_partitions_maintain)
+    partition_commands.add_parser("list", help="Show attached partitions").set_defaults(handler=_partitions_list)
+    
+    export = commands.add_parser("export", help="Stream readings to a file or stdout")
+    export.add_argument("--format", choices=["ndjson", "csv", "parquet"], default="ndjson")
+    export.add_argument("--device-id", action="append", help="Device to export (repeatable; default: all)")
+    export.add_argument("--start", type=_timestamp, help="ISO8601 start, inclusive")
+    export.add_argument("--end", type=_timestamp, help="ISO8601 end, exclusive")
+    export.add_argument("--unit", choices=["RI", "Brix"], help="Convert values to this unit (default: as stored)")
+    export.add_argument("--compensate", action="store_true", help="Correct values to 20 °C using temperature_c")
+    export.add_argument("--output", "-o", help="Output path (default: stdout)")
+    export.set_defaults(handler=_export)
+    
+    args = parser.parse_args()
+    
+    async def run() -> None:
+        try:
+            await args.handler(args)
+        finally:
+            await async_engine.dispose()
+    
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
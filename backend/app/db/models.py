@@ -1,7 +1,8 @@
 """SQLAlchemy models"""
 
-from sqlalchemy import Column, String, Numeric, DateTime, ForeignKey, Integer
+from sqlalchemy import BigInteger, Column, String, Numeric, DateTime, Float, ForeignKey, Integer, Index, PrimaryKeyConstraint, text
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import declared_attr
 from sqlalchemy.sql import func
 from datetime import datetime
 import uuid
@@ -11,10 +12,13 @@ from app.db.database import Base
 
 class Device(Base):
     __tablename__ = "devices"
-
+    
     device_id = Column(String(255), primary_key=True)
     name = Column(String(255))
-    last_seen_at = Column(DateTime)
+    last_seen_at = Column(DateTime, index=True)
+    # OK / STALE / OFFLINE, maintained by app.services.status_tracker
+    status = Column(String(10), nullable=False, server_default="OFFLINE", index=True)
+    status_changed_at = Column(DateTime)
     # Refractometry target and alert boundaries
     target_ri = Column(Numeric(10, 4))  # Target Refractive Index value
     alert_low = Column(Numeric(10, 4))  # Lower alert boundary (warrants investigation)
@@ -23,13 +27,147 @@ class Device(Base):
 
 
 class Reading(Base):
+    """
+    Raw reading, range-partitioned by month on ts.
+    
+    Partitions (readings_pYYYY_MM plus readings_default) are created and
+    retired by app.services.partition_service. Postgres requires the
+    partition key in every unique index, hence the (id, ts) primary key and
+    the (event_id, ts) idempotency index.
+    """
     __tablename__ = "readings"
-
-    id = Column(Integer, primary_key=True, index=True)
-    device_id = Column(String(255), ForeignKey("devices.device_id", ondelete="CASCADE"), nullable=False, index=True)
-    ts = Column(DateTime, nullable=False, index=True)
+    __table_args__ = {"postgresql_partition_by": "RANGE (ts)"}
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    device_id = Column(String(255), ForeignKey("devices.device_id", ondelete="CASCADE"), nullable=False)
+    ts = Column(DateTime, primary_key=True, nullable=False, index=True)
     value = Column(Numeric(10, 4), nullable=False)
     unit = Column(String(50), nullable=False)
     temperature_c = Column(Numeric(5, 2))
-    event_id = Column(UUID(as_uuid=True), unique=True, index=True)
+    event_id = Column(UUID(as_uuid=True))
     created_at = Column(DateTime, server_default=func.now())
+
+
+# Per-device history, newest first (also serves the latest-reading lookup)
+Index("idx_readings_device_ts", Reading.device_id, Reading.ts.desc())
+# Idempotency; also serves event_id lookups across partitions
+Index("uq_readings_event_id_ts", Reading.event_id, Reading.ts, unique=True)
+
+
+class ReadingRollupMixin:
+    """
+    Per-device aggregate of readings over one time bucket.
+    
+    Holds mergeable statistics only (counts, sums, extremes, first/last), so
+    finer buckets combine exactly into coarser ones.
+    """
+
+    @declared_attr
+    def device_id(cls):
+        return Column(String(255), ForeignKey("devices.device_id", ondelete="CASCADE"), nullable=False)
+
+    @declared_attr
+    def __table_args__(cls):
+        # Key order matters: per-device range scans use the primary key index
+        return (PrimaryKeyConstraint("device_id", "bucket_start"),)
+    
+    bucket_start = Column(DateTime, nullable=False)
+    count = Column(Integer, nullable=False)
+    value_sum = Column(Float, nullable=False)
+    value_sum_sq = Column(Float, nullable=False)
+    value_min = Column(Numeric(10, 4), nullable=False)
+    value_max = Column(Numeric(10, 4), nullable=False)
+    first_ts = Column(DateTime, nullable=False)
+    first_value = Column(Numeric(10, 4), nullable=False)
+    last_ts = Column(DateTime, nullable=False)
+    last_value = Column(Numeric(10, 4), nullable=False)
+    # Temperature is optional per reading, so it keeps its own count
+    temp_count = Column(Integer, nullable=False)
+    temp_sum = Column(Float, nullable=False)
+    temp_min = Column(Numeric(5, 2))
+    temp_max = Column(Numeric(5, 2))
+
+
+class ReadingRollup1m(ReadingRollupMixin, Base):
+    __tablename__ = "reading_rollups_1m"
+
+
+class ReadingRollup1h(ReadingRollupMixin, Base):
+    __tablename__ = "reading_rollups_1h"
+
+
+class ReadingRollup1d(ReadingRollupMixin, Base):
+    __tablename__ = "reading_rollups_1d"
+
+
+class AlertEvent(Base):
+    """
+    One excursion of a device's readings beyond alert_low / alert_high.
+    
+    Written by app.services.alert_service: at ingest once the excursion has
+    lasted ALERT_MIN_DURATION_S, or by a batch re-evaluation. ended_at is
+    NULL while the excursion is still open.
+    """
+    __tablename__ = "alert_events"
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    device_id = Column(String(255), ForeignKey("devices.device_id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String(10), nullable=False)  # "high" or "low"
+    threshold = Column(Numeric(10, 4), nullable=False)  # limit in force when it started
+    started_at = Column(DateTime, nullable=False)
+    ended_at = Column(DateTime)
+    peak_value = Column(Numeric(10, 4), nullable=False)
+    readings = Column(Integer, nullable=False)  # readings beyond the limit (or inside the hysteresis band)
+    created_at = Column(DateTime, server_default=func.now())
+
+
+# Per-device history, newest first
+Index("idx_alert_events_device_started", AlertEvent.device_id, AlertEvent.started_at.desc())
+# At most one open excursion per device and side, also across API workers
+Index(
+    "uq_alert_events_open", AlertEvent.device_id, AlertEvent.kind,
+    unique=True, postgresql_where=text("ended_at IS NULL")
+)
+
+
+class DeviceSpc(Base):
+    """
+    Running statistical process control state of a device's RI readings.
+    
+    Maintained by app.services.spc_service in the ingest transaction: every
+    column is a mergeable summary (Welford count / mean / M2, EWMA, two-sided
+    CUSUM against target_ri), so a batch of readings is folded in with one
+    upsert. Readings are folded in arrival order; `python -m app.cli spc
+    rebuild` recomputes the state in timestamp order.
+    """
+    __tablename__ = "device_spc"
+    
+    device_id = Column(String(255), ForeignKey("devices.device_id", ondelete="CASCADE"), primary_key=True)
+    target_ri = Column(Float)  # target the CUSUMs accumulate against; NULL: CUSUMs stay 0
+    n = Column(BigInteger, nullable=False)
+    mean = Column(Float, nullable=False)
+    m2 = Column(Float, nullable=False)  # sum of squared deviations from mean
+    ewma = Column(Float, nullable=False)
+    cusum_pos = Column(Float, nullable=False)  # upper CUSUM (drift above target)
+    cusum_neg = Column(Float, nullable=False)  # lower CUSUM (drift below target)
+    first_ts = Column(DateTime, nullable=False)
+    first_value = Column(Float, nullable=False)
+    last_ts = Column(DateTime, nullable=False)
+    last_value = Column(Float, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+
+class RateLimitBucket(Base):
+    """
+    Ingest token bucket shared by all API workers (RATE_LIMIT_BACKEND=postgres).
+    
+    A bucket is stored as the time it will be full again, which is all a
+    token bucket needs once its rate and burst are known; rows past that
+    time are equivalent to no row and are deleted periodically. UNLOGGED:
+    buckets are not worth WAL traffic and start full after a crash.
+    """
+    __tablename__ = "rate_limit_buckets"
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+    
+    key = Column(String(255), primary_key=True)  # "device:<device_id>" ("device#<hash>" if too long) or "key:<API key hash>"
+    full_at = Column(DateTime, nullable=False)
@@ -4,22 +4,76 @@ CREATE TABLE IF NOT EXISTS devices (
     device_id VARCHAR(255) PRIMARY KEY,
     name VARCHAR(255),
     last_seen_at TIMESTAMP,
+    status VARCHAR(10) NOT NULL DEFAULT 'OFFLINE',
+    status_changed_at TIMESTAMP,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Range-partitioned by month on ts; partitions are managed by the API
+-- (app/services/partition_service.py)
 CREATE TABLE IF NOT EXISTS readings (
-    id SERIAL PRIMARY KEY,
+    id BIGSERIAL,
     device_id VARCHAR(255) NOT NULL REFERENCES devices(device_id) ON DELETE CASCADE,
     ts TIMESTAMP NOT NULL,
     value NUMERIC(10, 4) NOT NULL,
     unit VARCHAR(50) NOT NULL,
     temperature_c NUMERIC(5, 2),
-    event_id UUID UNIQUE,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    event_id UUID,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, ts)
+) PARTITION BY RANGE (ts);
+
+CREATE TABLE IF NOT EXISTS readings_default PARTITION OF readings DEFAULT;
+
+-- Index for last-seen queries
+CREATE INDEX IF NOT EXISTS idx_devices_last_seen_at ON devices(last_seen_at);
+
+-- Index for status filtering on the device list
+CREATE INDEX IF NOT EXISTS ix_devices_status ON devices(status);
 
 -- Index for efficient time-series queries
 CREATE INDEX IF NOT EXISTS idx_readings_device_ts ON readings(device_id, ts DESC);
 
--- Index for idempotency checks
-CREATE INDEX IF NOT EXISTS idx_readings_event_id ON readings(event_id) WHERE event_id IS NOT NULL;
+-- Index for idempotency checks (unique indexes must include the partition key)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_readings_event_id_ts ON readings(event_id, ts);
+
+-- Threshold excursions (app/services/alert_service.py)
+CREATE TABLE IF NOT EXISTS alert_events (
+    id BIGSERIAL PRIMARY KEY,
+    device_id VARCHAR(255) NOT NULL REFERENCES devices(device_id) ON DELETE CASCADE,
+    kind VARCHAR(10) NOT NULL,
+    threshold NUMERIC(10, 4) NOT NULL,
+    started_at TIMESTAMP NOT NULL,
+    ended_at TIMESTAMP,
+    peak_value NUMERIC(10, 4) NOT NULL,
+    readings INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_alert_events_device_started ON alert_events(device_id, started_at DESC);
+
+-- At most one open excursion per device and side
+CREATE UNIQUE INDEX IF NOT EXISTS uq_alert_events_open ON alert_events(device_id, kind) WHERE ended_at IS NULL;
+
+-- Running SPC state per device: Welford mean/variance, EWMA, two-sided CUSUM (app/services/spc_service.py)
+CREATE TABLE IF NOT EXISTS device_spc (
+    device_id VARCHAR(255) PRIMARY KEY REFERENCES devices(device_id) ON DELETE CASCADE,
+    target_ri DOUBLE PRECISION,
+    n BIGINT NOT NULL,
+    mean DOUBLE PRECISION NOT NULL,
+    m2 DOUBLE PRECISION NOT NULL,
+    ewma DOUBLE PRECISION NOT NULL,
+    cusum_pos DOUBLE PRECISION NOT NULL,
+    cusum_neg DOUBLE PRECISION NOT NULL,
+    first_ts TIMESTAMP NOT NULL,
+    first_value DOUBLE PRECISION NOT NULL,
+    last_ts TIMESTAMP NOT NULL,
+    last_value DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+
+-- Ingest token buckets shared by API workers (RATE_LIMIT_BACKEND=postgres; app/services/rate_limiter.py)
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_buckets (
+    key VARCHAR(255) PRIMARY KEY,
+    full_at TIMESTAMP NOT NULL
+);
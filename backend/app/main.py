@@ -3,28 +3,71 @@ Refractometry IoT Backend API
 FastAPI service for device telemetry ingestion and querying
 """
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
+import asyncio
 
-from app.api import readings, devices
-from app.db.database import engine, Base
+from app.api import readings, devices, alerts, export, stats, stream
+from app.db.database import DB_MAX_OVERFLOW, DB_POOL_SIZE, AsyncSessionLocal, async_engine, Base, read_replica
+from app.services.device_cache import LAST_SEEN_FLUSH_INTERVAL_S, flush_last_seen, run_last_seen_flusher
+from app.services.ingest_buffer import INGEST_MODE, ingest_buffer
+from app.services.live_hub import live_hub
+from app.services.metrics import METRICS_ENABLED, MetricsMiddleware, register_pool, render as render_metrics
+from app.services.status_tracker import status_tracker
+from app.services.partition_service import (
+    PARTITION_MAINTENANCE_INTERVAL_S,
+    ensure_partitions,
+    run_partition_maintenance,
+)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: create tables
-    Base.metadata.create_all(bind=engine)
+    # Startup: create tables and the reading partitions ingest needs
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        await ensure_partitions(db)
+    tasks = []
+    if PARTITION_MAINTENANCE_INTERVAL_S > 0:
+        tasks.append(asyncio.create_task(run_partition_maintenance()))
+    if LAST_SEEN_FLUSH_INTERVAL_S > 0:
+        tasks.append(asyncio.create_task(run_last_seen_flusher()))
+    if read_replica.enabled:
+        # Dashboard reads start on the replica only once it has been checked
+        await read_replica.check()
+        tasks.append(asyncio.create_task(read_replica.run()))
+    await live_hub.start()
+    await status_tracker.start()
+    if INGEST_MODE == "buffered":
+        ingest_buffer.start()
     yield
-    # Shutdown: cleanup if needed
-    pass
+    # Shutdown: write queued readings, stop status tracking, end live streams, stop background work,
+    # write deferred last_seen_at values, close pooled connections (primary and replica)
+    await ingest_buffer.drain()
+    await status_tracker.stop()
+    await live_hub.stop()
+    for task in tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    async with AsyncSessionLocal() as db:
+        await flush_last_seen(db)
+    await async_engine.dispose()
+    if read_replica.enabled:
+        await read_replica.engine.dispose()
 
 
 app = FastAPI(
     title="RefractIQ API",
     description="IoT telemetry platform for refractometry instrumentation - Real-time monitoring, alerting, and data visualization",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # orjson for every endpoint that returns plain data; hot read endpoints
+    # build their ORJSONResponse directly and skip jsonable_encoder too
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware for web frontend
@@ -52,13 +95,24 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=cors_origins,
     allow_credentials=True,
-    allow_methods=["GET", "POST"],  # Only allow necessary methods
+    allow_methods=["GET", "POST", "PATCH"],  # Only allow necessary methods
     allow_headers=["Content-Type", "X-API-Key"],  # Only allow necessary headers
 )
 
+# Prometheus metrics (METRICS_ENABLED); outermost, so request latency includes the other middleware
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    register_pool("primary", async_engine.pool, DB_POOL_SIZE + DB_MAX_OVERFLOW)
+    if read_replica.enabled:
+        register_pool("replica", read_replica.engine.pool, DB_POOL_SIZE + DB_MAX_OVERFLOW)
+
 # Include routers
 app.include_router(readings.router, prefix="/api/v1", tags=["readings"])
 app.include_router(devices.router, prefix="/api/v1", tags=["devices"])
+app.include_router(alerts.router, prefix="/api/v1", tags=["alerts"])
+app.include_router(export.router, prefix="/api/v1", tags=["export"])
+app.include_router(stats.router, prefix="/api/v1", tags=["stats"])
+app.include_router(stream.router, prefix="/api/v1", tags=["stream"])
 
 
 @app.get("/health")
@@ -67,6 +121,14 @@ async def health():
     return {"status": "healthy"}
 
 
+if METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """Prometheus exposition of this worker's metrics"""
+        body, content_type = render_metrics()
+        return Response(body, headers={"Content-Type": content_type})
+
+
 @app.get("/")
 async def root():
     return {
@@ -0,0 +1,225 @@
+"""Time-bucketed aggregation and downsampling of readings"""
+
+from sqlalchemy import Float, Integer, Interval, cast, func, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import os
+
+from app.db.models import Reading
+from app.services.downsample import lttb
+from app.services.rollup_service import ROLLUP_ORIGIN, RollupLevel, coarsest_level
+from app.services.units import convert
+
+# Buckets are aligned to this origin, so e.g. 1h buckets start on the hour
+# (shared with the rollup tables so their buckets nest exactly)
+BUCKET_ORIGIN = ROLLUP_ORIGIN
+
+# Guards against tiny buckets over huge windows
+MAX_AGGREGATE_BUCKETS = int(os.getenv("MAX_AGGREGATE_BUCKETS", "10000"))
+# Raw rows LTTB mode (and bucket mode with unit conversion) may load for one request
+LTTB_MAX_SOURCE_ROWS = int(os.getenv("LTTB_MAX_SOURCE_ROWS", "500000"))
+
+
+async def aggregate_readings(
+    db: AsyncSession,
+    device_id: str,
+    bucket: timedelta,
+    start: datetime,
+    end: datetime
+) -> Dict[str, Any]:
+    """
+    Aggregate readings in [start, end) into fixed-width time buckets.
+    
+    Reads from the coarsest rollup level that covers the request exactly
+    (bucket a multiple of the level, window aligned to it), so cost scales
+    with the number of rollup buckets; otherwise groups raw readings with
+    date_bin. Returns the source used and count plus min/max/mean/stddev of
+    value and min/max/mean of temperature_c per non-empty bucket, oldest first.
+    """
+    level = coarsest_level(bucket, start, end)
+    query = _raw_query(device_id, bucket, start, end) if level is None else _rollup_query(level, device_id, bucket, start, end)
+    
+    return {
+        "source": "readings" if level is None else f"rollup_{level.name}",
+        "buckets": [
+            {
+                "bucket_start": row[0],
+                "count": row[1],
+                "value": {"min": row[2], "max": row[3], "mean": row[4], "stddev": row[5]},
+                "temperature_c": {"min": row[6], "max": row[7], "mean": row[8]}
+            }
+            for row in await db.execute(query)
+        ]
+    }
+
+
+def _raw_query(device_id: str, bucket: timedelta, start: datetime, end: datetime):
+    bucket_start = func.date_bin(literal(bucket, Interval()), Reading.ts, BUCKET_ORIGIN).label("bucket_start")
+    return (
+        select(
+            bucket_start,
+            func.count(),
+            cast(func.min(Reading.value), Float),
+            cast(func.max(Reading.value), Float),
+            cast(func.avg(Reading.value), Float),
+            cast(func.stddev_pop(Reading.value), Float),
+            cast(func.min(Reading.temperature_c), Float),
+            cast(func.max(Reading.temperature_c), Float),
+            cast(func.avg(Reading.temperature_c), Float)
+        )
+        .where(Reading.device_id == device_id, Reading.ts >= start, Reading.ts < end)
+        .group_by(bucket_start)
+        .order_by(bucket_start)
+    )
+
+
+def _rollup_query(level: RollupLevel, device_id: str, bucket: timedelta, start: datetime, end: datetime):
+    c = level.model.__table__.c
+    bucket_start = func.date_bin(literal(bucket, Interval()), c.bucket_start, BUCKET_ORIGIN).label("bucket_start")
+    count = func.sum(c.count)
+    mean = func.sum(c.value_sum) / count
+    variance = func.sum(c.value_sum_sq) / count - mean * mean
+    return (
+        select(
+            bucket_start,
+            cast(count, Integer),
+            cast(func.min(c.value_min), Float),
+            cast(func.max(c.value_max), Float),
+            mean,
+            # Clamp tiny negative rounding error before the square root
+            func.sqrt(func.greatest(variance, 0.0)),
+            cast(func.min(c.temp_min), Float),
+            cast(func.max(c.temp_max), Float),
+            func.sum(c.temp_sum) / func.nullif(func.sum(c.temp_count), 0)
+        )
+        .where(c.device_id == device_id, c.bucket_start >= start, c.bucket_start < end)
+        .group_by(bucket_start)
+        .order_by(bucket_start)
+    )
+
+
+async def aggregate_converted(
+    db: AsyncSession,
+    device_id: str,
+    bucket: timedelta,
+    start: datetime,
+    end: datetime,
+    unit: Optional[str],
+    compensate: bool
+) -> Dict[str, Any]:
+    """
+    aggregate_readings() over values converted to `unit` and/or compensated to 20 °C.
+    
+    Conversion is per reading, so rollups cannot be used: the window's raw
+    readings are loaded as arrays, converted in one pass and bucketed with
+    NumPy (reduceat over the bucket boundaries of the ts-sorted series).
+    Raises ValueError if the window holds more than LTTB_MAX_SOURCE_ROWS rows.
+    """
+    ts, v, t = await _load_converted(db, device_id, start, end, unit, compensate, "use a narrower window")
+    if len(ts) == 0:
+        return {"source": "readings", "buckets": []}
+    
+    width = bucket // timedelta(microseconds=1)
+    origin = np.datetime64(BUCKET_ORIGIN, "us").astype(np.int64)
+    index = (ts - origin) // width
+    starts = np.flatnonzero(np.diff(index, prepend=index[0] - 1))
+    count = np.diff(np.append(starts, len(v)))
+    mean = np.add.reduceat(v, starts) / count
+    stddev = np.sqrt(np.add.reduceat(np.square(v - np.repeat(mean, count)), starts) / count)
+    has_t = ~np.isnan(t)
+    t_count = np.add.reduceat(has_t.astype(np.int64), starts)
+    t_sum = np.add.reduceat(np.where(has_t, t, 0.0), starts)
+    
+    columns = zip(
+        (BUCKET_ORIGIN + bucket * int(i) for i in index[starts].tolist()),
+        count.tolist(),
+        np.minimum.reduceat(v, starts).tolist(),
+        np.maximum.reduceat(v, starts).tolist(),
+        mean.tolist(),
+        stddev.tolist(),
+        # fmin / fmax skip NaN (readings without a temperature)
+        _nan_to_none(np.fmin.reduceat(t, starts)),
+        _nan_to_none(np.fmax.reduceat(t, starts)),
+        _nan_to_none(np.divide(t_sum, t_count, out=np.full(len(starts), np.nan), where=t_count > 0)),
+    )
+    return {
+        "source": "readings",
+        "buckets": [
+            {
+                "bucket_start": bucket_start,
+                "count": n,
+                "value": {"min": v_min, "max": v_max, "mean": v_mean, "stddev": v_stddev},
+                "temperature_c": {"min": t_min, "max": t_max, "mean": t_mean}
+            }
+            for bucket_start, n, v_min, v_max, v_mean, v_stddev, t_min, t_max, t_mean in columns
+        ]
+    }
+
+
+async def downsample_readings(
+    db: AsyncSession,
+    device_id: str,
+    start: datetime,
+    end: datetime,
+    points: int,
+    unit: Optional[str] = None,
+    compensate: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Reduce readings in [start, end) to at most `points` points with LTTB.
+    
+    Values are converted to `unit` / compensated to 20 °C first when asked.
+    Raises ValueError if the window holds more than LTTB_MAX_SOURCE_ROWS rows.
+    """
+    ts, y, _ = await _load_converted(db, device_id, start, end, unit, compensate, "narrow it or use bucket mode")
+    if len(ts) == 0:
+        return []
+    
+    x = ts.astype(np.float64)
+    selected = lttb(x, y, points)
+    return [
+        {"ts": ts, "value": value}
+        for ts, value in zip(ts[selected].astype("datetime64[us]").tolist(), y[selected].tolist())
+    ]
+
+
+async def _load_converted(
+    db: AsyncSession,
+    device_id: str,
+    start: datetime,
+    end: datetime,
+    unit: Optional[str],
+    compensate: bool,
+    hint: str
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(epoch microseconds, value, temperature_c with NaN for none) arrays of a window, oldest first."""
+    converting = unit is not None or compensate
+    columns = [Reading.ts, cast(Reading.value, Float)]
+    if converting:
+        columns += [Reading.unit, cast(Reading.temperature_c, Float)]
+    rows = (await db.execute(
+        select(*columns)
+        .where(Reading.device_id == device_id, Reading.ts >= start, Reading.ts < end)
+        .order_by(Reading.ts)
+        .limit(LTTB_MAX_SOURCE_ROWS + 1)
+    )).all()
+    if len(rows) > LTTB_MAX_SOURCE_ROWS:
+        raise ValueError(f"Window has more than {LTTB_MAX_SOURCE_ROWS} readings; {hint}")
+    if not rows:
+        empty = np.empty(0, dtype=np.float64)
+        return np.empty(0, dtype=np.int64), empty, empty
+    
+    columns = list(zip(*rows))
+    ts = np.array(columns[0], dtype="datetime64[us]").astype(np.int64)
+    v = np.array(columns[1], dtype=np.float64)
+    if not converting:
+        return ts, v, np.full(len(v), np.nan)
+    t = np.array(columns[3], dtype=np.float64)
+    v, _ = convert(v, np.array(columns[2]), t, unit, compensate)
+    return ts, v, t
+
+
+def _nan_to_none(values: np.ndarray) -> List[Optional[float]]:
+    return [None if value != value else value for value in values.tolist()]
@@ -0,0 +1,380 @@
+"""Alert evaluation of readings against device alert_low / alert_high"""
+
+from sqlalchemy import BigInteger, Float, cast, delete, func, insert, select, update
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple, TYPE_CHECKING
+import logging
+import os
+
+import numpy as np
+
+from app.db.database import AsyncSessionLocal
+from app.db.models import AlertEvent, Device, Reading
+from app.services.device_cache import device_cache
+from app.services.excursions import find_excursions
+from app.services.partition_service import add_months, month_start
+
+if TYPE_CHECKING:
+    from app.api.readings import ReadingPayload
+
+logger = logging.getLogger(__name__)
+
+# Evaluate readings against alert limits during ingest
+ALERTS_ENABLED = os.getenv("ALERTS_ENABLED", "true").lower() == "true"
+# An excursion ends only once the value is back inside the limit by this much (RI)
+ALERT_HYSTERESIS = float(os.getenv("ALERT_HYSTERESIS", "0.0005"))
+# Excursions shorter than this are not recorded
+ALERT_MIN_DURATION_S = float(os.getenv("ALERT_MIN_DURATION_S", "60"))
+
+# Alert limits are refractive indices; other units are not evaluated
+ALERT_UNIT = "RI"
+
+Limits = Tuple[Optional[float], Optional[float]]  # (alert_low, alert_high)
+
+
+class _Excursion:
+    """In-progress excursion of one device, as seen by this worker."""
+    
+    __slots__ = ("kind", "threshold", "started_at", "peak_value", "readings", "event_id")
+
+    def __init__(self, kind: str, threshold: float, started_at: datetime, peak_value: float, readings: int = 1, event_id: Optional[int] = None):
+        self.kind = kind
+        self.threshold = threshold
+        self.started_at = started_at
+        self.peak_value = peak_value
+        self.readings = readings
+        self.event_id = event_id  # alert_events.id once recorded
+
+
+class AlertTracker:
+    """
+    Streaming counterpart of find_excursions for ingest.
+    
+    Keeps the open excursion of each device in memory, so a reading inside
+    the limits costs no query. The database is only written on transitions:
+    when an excursion reaches the minimum duration (row inserted, ended_at
+    NULL) and when it ends (ended_at set). The open excursion of a device
+    is loaded once per worker, the first time the device is evaluated.
+    Readings older than the newest one evaluated for the device are skipped
+    (backfills are handled by rebuild_alerts). A rebuild in another process
+    is not seen until the worker restarts, except that ending an excursion
+    whose row it replaced ends the rebuilt open row instead.
+    """
+
+    def __init__(self, hysteresis: float, min_duration: timedelta):
+        self.hysteresis = hysteresis
+        self.min_duration = min_duration
+        self._open: Dict[str, Optional[_Excursion]] = {}
+        self._last_ts: Dict[str, datetime] = {}
+        self.evaluated = 0
+        self.started = 0
+        self.ended = 0
+
+    def needs(self, device_id: str, limits: Optional[Limits]) -> bool:
+        """False when a reading of the device cannot change anything (no limits, nothing open)."""
+        return limits != (None, None) or self._open.get(device_id, True) is not None
+
+    def forget(self, device_id: Optional[str] = None) -> None:
+        """Drop in-memory state (all devices when None); it is reloaded on the next reading."""
+        if device_id is None:
+            self._open.clear()
+            self._last_ts.clear()
+        else:
+            self._open.pop(device_id, None)
+            self._last_ts.pop(device_id, None)
+
+    async def observe(self, db: AsyncSession, device_id: str, limits: Limits, ts: datetime, value: float) -> None:
+        """Evaluate one reading; writes to db on transitions (caller commits)."""
+        low, high = limits
+        if device_id not in self._open:
+            self._open[device_id] = await self._load(db, device_id)
+        last_ts = self._last_ts.get(device_id)
+        if last_ts is not None and ts < last_ts:
+            return
+        self._last_ts[device_id] = ts
+        self.evaluated += 1
+        
+        current = self._open[device_id]
+        if current is not None:
+            limit = high if current.kind == "high" else low
+            if limit is None:
+                back_inside = True  # limit removed since the excursion started
+            elif current.kind == "high":
+                back_inside = value <= limit - self.hysteresis
+            else:
+                back_inside = value >= limit + self.hysteresis
+            
+            if not back_inside:
+                current.readings += 1
+                if (value > current.peak_value) == (current.kind == "high"):
+                    current.peak_value = value
+                if current.event_id is None and ts - current.started_at >= self.min_duration:
+                    await self._record(db, device_id, current, None)
+                return
+            
+            if current.event_id is not None:
+                ended = await db.execute(
+                    update(AlertEvent)
+                    .where(AlertEvent.id == current.event_id)
+                    .values(ended_at=ts, peak_value=current.peak_value, readings=current.readings)
+                )
+                if ended.rowcount == 0:
+                    # The row was replaced by rebuild_alerts (run by another process)
+                    # since this worker loaded it: end the open row of the same kind
+                    peak = func.greatest if current.kind == "high" else func.least
+                    await db.execute(
+                        update(AlertEvent)
+                        .where(
+                            AlertEvent.device_id == device_id,
+                            AlertEvent.kind == current.kind,
+                            AlertEvent.ended_at.is_(None),
+                            AlertEvent.started_at <= ts
+                        )
+                        .values(
+                            ended_at=ts,
+                            peak_value=peak(AlertEvent.peak_value, current.peak_value),
+                            readings=func.greatest(AlertEvent.readings, current.readings)
+                        )
+                    )
+                self.ended += 1
+            elif ts - current.started_at >= self.min_duration:
+                await self._record(db, device_id, current, ts)
+            self._open[device_id] = None
+        
+        # The reading that ends one excursion may start one on the other side
+        if high is not None and value > high:
+            current = _Excursion("high", high, ts, value)
+        elif low is not None and value < low:
+            current = _Excursion("low", low, ts, value)
+        else:
+            return
+        self._open[device_id] = current
+        if self.min_duration <= timedelta(0):
+            await self._record(db, device_id, current, None)
+
+    async def _load(self, db: AsyncSession, device_id: str) -> Optional[_Excursion]:
+        row = (await db.execute(
+            select(AlertEvent).where(AlertEvent.device_id == device_id, AlertEvent.ended_at.is_(None))
+        )).scalars().first()
+        if row is None:
+            return None
+        return _Excursion(row.kind, float(row.threshold), row.started_at, float(row.peak_value), row.readings, row.id)
+
+    async def _record(self, db: AsyncSession, device_id: str, excursion: _Excursion, ended_at: Optional[datetime]) -> None:
+        values = {
+            "device_id": device_id,
+            "kind": excursion.kind,
+            "threshold": excursion.threshold,
+            "started_at": excursion.started_at,
+            "ended_at": ended_at,
+            "peak_value": excursion.peak_value,
+            "readings": excursion.readings,
+        }
+        if ended_at is not None:
+            await db.execute(insert(AlertEvent).values(**values))
+            self.started += 1
+            self.ended += 1
+            return
+        
+        event_id = await db.scalar(
+            pg_insert(AlertEvent).values(**values)
+            .on_conflict_do_nothing(
+                index_elements=[AlertEvent.device_id, AlertEvent.kind],
+                index_where=AlertEvent.ended_at.is_(None)
+            )
+            .returning(AlertEvent.id)
+        )
+        if event_id is None:
+            # Another worker recorded this excursion first; continue with its row
+            event_id = await db.scalar(
+                select(AlertEvent.id)
+                .where(AlertEvent.device_id == device_id, AlertEvent.kind == excursion.kind, AlertEvent.ended_at.is_(None))
+            )
+        else:
+            self.started += 1
+        excursion.event_id = event_id
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": ALERTS_ENABLED,
+            "tracked_devices": len(self._open),
+            "open": sum(1 for e in self._open.values() if e is not None),
+            "evaluated": self.evaluated,
+            "started": self.started,
+            "ended": self.ended,
+        }
+
+
+alert_tracker = AlertTracker(ALERT_HYSTERESIS, timedelta(seconds=ALERT_MIN_DURATION_S))
+
+
+async def evaluate_alerts(payloads: Iterable["ReadingPayload"]) -> None:
+    """
+    Run newly committed readings through the alert tracker.
+    
+    Limits come from the device cache. Readings of devices without limits
+    and without an open excursion are skipped without any I/O; the tracker
+    writes (in its own transaction) only when an excursion starts or ends.
+    Failures are logged, never raised, so ingest is not affected.
+    """
+    if not ALERTS_ENABLED:
+        return
+    
+    candidates = []
+    for payload in payloads:
+        if payload.unit != ALERT_UNIT:
+            continue
+        cached = device_cache.peek(payload.device_id)
+        limits = (cached.alert_low, cached.alert_high) if cached else None
+        if alert_tracker.needs(payload.device_id, limits):
+            candidates.append((payload, limits))
+    if not candidates:
+        return
+    
+    try:
+        async with AsyncSessionLocal() as db:
+            missing = {payload.device_id for payload, limits in candidates if limits is None}
+            fetched: Dict[str, Limits] = {}
+            if missing:
+                rows = await db.execute(
+                    select(Device.device_id, Device.alert_low, Device.alert_high).where(Device.device_id.in_(missing))
+                )
+                fetched = {device_id: (_float(low), _float(high)) for device_id, low, high in rows}
+            
+            for payload, limits in sorted(candidates, key=lambda c: c[0].ts):
+                limits = limits or fetched.get(payload.device_id, (None, None))
+                await alert_tracker.observe(db, payload.device_id, limits, payload.ts, payload.value)
+            await db.commit()
+    except Exception:
+        # In-memory state may now be ahead of the table; reload it next time
+        alert_tracker.forget()
+        logger.exception("Alert evaluation failed")
+
+
+async def rebuild_alerts(
+    db: AsyncSession,
+    device_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> Dict[str, int]:
+    """
+    Re-evaluate stored readings against the current alert limits.
+    
+    For each device with limits, readings in [start, end) are loaded into
+    NumPy arrays and scanned with find_excursions; alert events starting in
+    the window are replaced by the result. Excursions already open before
+    `start` are not seen. Commits per device; returns readings scanned and
+    events written.
+    """
+    query = select(Device.device_id, Device.alert_low, Device.alert_high).where(
+        (Device.alert_low.isnot(None)) | (Device.alert_high.isnot(None))
+    )
+    if device_id is not None:
+        query = query.where(Device.device_id == device_id)
+    devices = (await db.execute(query.order_by(Device.device_id))).all()
+    
+    totals = {"devices": 0, "readings": 0, "events": 0}
+    for device_id, low, high in devices:
+        t, v = await load_series(db, device_id, start, end)
+        events = _events_from_series(device_id, t, v, _float(low), _float(high))
+        
+        window = [AlertEvent.device_id == device_id]
+        if start is not None:
+            window.append(AlertEvent.started_at >= start)
+        if end is not None:
+            window.append(AlertEvent.started_at < end)
+        await db.execute(delete(AlertEvent).where(*window))
+        if events:
+            await db.execute(insert(AlertEvent), events)
+        await db.commit()
+        alert_tracker.forget(device_id)
+        
+        totals["devices"] += 1
+        totals["readings"] += len(v)
+        totals["events"] += len(events)
+    return totals
+
+
+async def load_series(
+    db: AsyncSession,
+    device_id: str,
+    start: Optional[datetime],
+    end: Optional[datetime]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """(epoch microseconds, value) arrays of a device's RI readings, oldest first."""
+    condition = [Reading.device_id == device_id, Reading.unit == ALERT_UNIT]
+    first, last = (await db.execute(select(func.min(Reading.ts), func.max(Reading.ts)).where(*condition))).one()
+    if first is None:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    start = max(start, first) if start else first
+    end = min(end, last + timedelta(microseconds=1)) if end else last + timedelta(microseconds=1)
+    
+    # One month (partition) per query, each returned as two arrays: decoding
+    # arrays is several times cheaper than building a result row per reading
+    epoch_us = cast(func.extract("epoch", Reading.ts) * 1_000_000, BigInteger)
+    t_parts, v_parts = [], []
+    month = month_start(start)
+    while month < end:
+        window_start, window_end = max(start, month), min(end, add_months(month, 1))
+        t, v = (await db.execute(
+            select(
+                func.array_agg(aggregate_order_by(epoch_us, Reading.ts, Reading.id)),
+                func.array_agg(aggregate_order_by(cast(Reading.value, Float), Reading.ts, Reading.id))
+            )
+            .where(*condition, Reading.ts >= window_start, Reading.ts < window_end)
+        )).one()
+        if t:
+            t_parts.append(np.array(t, dtype=np.int64))
+            v_parts.append(np.array(v, dtype=np.float64))
+        month = add_months(month, 1)
+    if not t_parts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    return np.concatenate(t_parts), np.concatenate(v_parts)
+
+
+def _events_from_series(
+    device_id: str,
+    t: np.ndarray,
+    v: np.ndarray,
+    low: Optional[float],
+    high: Optional[float]
+) -> List[Dict[str, Any]]:
+    excursions = find_excursions(
+        t, v, low, high, ALERT_HYSTERESIS, int(ALERT_MIN_DURATION_S * 1_000_000)
+    )
+    return [
+        {
+            "device_id": device_id,
+            "kind": e.kind,
+            "threshold": high if e.kind == "high" else low,
+            "started_at": _datetime(t[e.start]),
+            "ended_at": _datetime(t[e.end]) if e.end is not None else None,
+            "peak_value": float(v[e.peak]),
+            "readings": e.readings,
+        }
+        for e in excursions
+    ]
+
+
+def alert_event_response(event: AlertEvent) -> Dict[str, Any]:
+    """Client-facing shape of an alert event."""
+    return {
+        "id": event.id,
+        "device_id": event.device_id,
+        "kind": event.kind,
+        "threshold": float(event.threshold),
+        "started_at": event.started_at.isoformat(),
+        "ended_at": event.ended_at.isoformat() if event.ended_at else None,
+        "peak_value": float(event.peak_value),
+        "readings": event.readings,
+    }
+
+
+def _datetime(microseconds: np.int64) -> datetime:
+    return datetime(1970, 1, 1) + timedelta(microseconds=int(microseconds))
+
+
+def _float(value: Any) -> Optional[float]:
+    return float(value) if value is not None else None
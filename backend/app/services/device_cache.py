@@ -0,0 +1,180 @@
+"""In-process registry of known devices for the ingest path"""
+
+from sqlalchemy import DateTime, String, column, func, update, values
+from sqlalchemy.ext.asyncio import AsyncSession
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, NamedTuple, Optional
+import asyncio
+import logging
+import os
+import time
+
+from app.db.database import AsyncSessionLocal
+from app.db.models import Device
+from app.services.response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+# Maximum devices held; least recently used entries are evicted first
+DEVICE_CACHE_SIZE = int(os.getenv("DEVICE_CACHE_SIZE", "10000"))
+# Seconds before an entry is re-read from the database (picks up external edits)
+DEVICE_CACHE_TTL_S = float(os.getenv("DEVICE_CACHE_TTL_S", "300"))
+# last_seen_at is written during ingest only when it advances by more than this
+LAST_SEEN_GRANULARITY_S = float(os.getenv("LAST_SEEN_GRANULARITY_S", "60"))
+# Seconds between batched writes of smaller last_seen_at advances (0 disables the task)
+LAST_SEEN_FLUSH_INTERVAL_S = float(os.getenv("LAST_SEEN_FLUSH_INTERVAL_S", "10"))
+
+
+class CachedDevice(NamedTuple):
+    device_id: str
+    last_seen_at: Optional[datetime]  # as stored in devices, not the newest reading
+    target_ri: Optional[float]
+    alert_low: Optional[float]
+    alert_high: Optional[float]
+    expires_at: float  # time.monotonic() deadline
+
+
+class DeviceCache:
+    """
+    Bounded LRU/TTL cache of devices known to exist in the database.
+    
+    A hit means ingest can skip the device SELECT. last_seen_at advances
+    smaller than the granularity are held as pending and written later by
+    flush_last_seen() in one batched UPDATE. Only call put() for rows that
+    are committed, so a hit always implies the device row exists.
+    """
+
+    def __init__(self, max_size: int, ttl: float, granularity: timedelta):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.granularity = granularity
+        self._entries: "OrderedDict[str, CachedDevice]" = OrderedDict()
+        self._pending: Dict[str, datetime] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, device_id: str) -> Optional[CachedDevice]:
+        entry = self._entries.get(device_id)
+        if entry is None or entry.expires_at <= time.monotonic():
+            if entry is not None:
+                del self._entries[device_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(device_id)
+        self.hits += 1
+        return entry
+
+    def peek(self, device_id: str) -> Optional[CachedDevice]:
+        """Entry as held, without LRU/TTL handling or hit counting (for follow-up work after ingest)."""
+        return self._entries.get(device_id)
+    
+    def put(self, device: Any) -> None:
+        """Cache a committed Device (or a row with the same attributes)."""
+        self._entries[device.device_id] = CachedDevice(
+            device.device_id,
+            device.last_seen_at,
+            _float(device.target_ri),
+            _float(device.alert_low),
+            _float(device.alert_high),
+            time.monotonic() + self.ttl
+        )
+        self._entries.move_to_end(device.device_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def needs_write(self, entry: CachedDevice, ts: datetime) -> bool:
+        """Whether ts moves last_seen_at far enough to be written with the reading."""
+        return entry.last_seen_at is None or ts - entry.last_seen_at > self.granularity
+
+    def written(self, device_id: str, ts: datetime) -> None:
+        """Record a committed last_seen_at write."""
+        entry = self._entries.get(device_id)
+        if entry is not None and (entry.last_seen_at is None or ts > entry.last_seen_at):
+            self._entries[device_id] = entry._replace(last_seen_at=ts)
+        pending = self._pending.get(device_id)
+        if pending is not None and pending <= ts:
+            del self._pending[device_id]
+
+    def defer(self, device_id: str, ts: datetime) -> None:
+        """Hold a small last_seen_at advance for the next flush."""
+        current = self._pending.get(device_id)
+        if current is None or ts > current:
+            self._pending[device_id] = ts
+
+    def take_pending(self) -> Dict[str, datetime]:
+        pending, self._pending = self._pending, {}
+        return pending
+
+    def invalidate(self, device_id: str) -> None:
+        if self._entries.pop(device_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._pending.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "pending_last_seen": len(self._pending),
+        }
+
+
+device_cache = DeviceCache(DEVICE_CACHE_SIZE, DEVICE_CACHE_TTL_S, timedelta(seconds=LAST_SEEN_GRANULARITY_S))
+
+
+async def flush_last_seen(db: AsyncSession, cache: DeviceCache = device_cache) -> int:
+    """
+    Write pending last_seen_at advances in one UPDATE. Commits; returns devices updated.
+    
+    Uses GREATEST so a flush never moves last_seen_at backwards past a
+    newer value written by another worker.
+    """
+    pending = cache.take_pending()
+    if not pending:
+        return 0
+    
+    source = values(column("device_id", String), column("ts", DateTime), name="pending").data(
+        sorted(pending.items())
+    )
+    try:
+        await db.execute(
+            update(Device)
+            .where(Device.device_id == source.c.device_id)
+            .values(last_seen_at=func.greatest(Device.last_seen_at, source.c.ts))
+        )
+        await db.commit()
+    except Exception:
+        for device_id, ts in pending.items():
+            cache.defer(device_id, ts)
+        raise
+    for device_id, ts in pending.items():
+        cache.written(device_id, ts)
+        response_cache.bump(device_id)
+    return len(pending)
+
+
+async def run_last_seen_flusher(interval: float = LAST_SEEN_FLUSH_INTERVAL_S) -> None:
+    """Background task: flush pending last_seen_at advances every `interval` seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with AsyncSessionLocal() as db:
+                await flush_last_seen(db)
+        except Exception:
+            logger.exception("last_seen_at flush failed")
+
+
+def _float(value: Any) -> Optional[float]:
+    return float(value) if value is not None else None
@@ -3,24 +3,30 @@
 from datetime import datetime, timedelta
 from typing import Optional
 
+# Age thresholds for OK / STALE / OFFLINE
+OK_WINDOW = timedelta(minutes=15)
+STALE_WINDOW = timedelta(hours=24)
 
-def get_device_status(last_seen_at: Optional[datetime]) -> str:
+
+def get_device_status(last_seen_at: Optional[datetime], now: Optional[datetime] = None) -> str:
     """
     Determine device status based on last_seen_at.
     
     - OK: seen within last 15 minutes
     - STALE: seen within last 24 hours but > 15 minutes
     - OFFLINE: not seen in last 24 hours or never
+    
+    The stored devices.status is kept equal to this by app.services.status_tracker.
     """
     if not last_seen_at:
         return "OFFLINE"
     
-    now = datetime.utcnow()
+    now = now or datetime.utcnow()
     age = now - last_seen_at
     
-    if age < timedelta(minutes=15):
+    if age < OK_WINDOW:
         return "OK"
-    elif age < timedelta(hours=24):
+    elif age < STALE_WINDOW:
         return "STALE"
     else:
         return "OFFLINE"
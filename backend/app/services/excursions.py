@@ -0,0 +1,80 @@
+"""Threshold excursion detection over reading arrays"""
+
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+
+class Excursion(NamedTuple):
+    kind: str  # "high" or "low"
+    start: int  # index of the first reading beyond the limit
+    end: Optional[int]  # index of the reading that ended it; None while still open
+    peak: int  # index of the most extreme reading
+    readings: int  # readings from start up to (excluding) end
+
+
+def find_excursions(
+    t: np.ndarray,
+    v: np.ndarray,
+    low: Optional[float],
+    high: Optional[float],
+    hysteresis: float,
+    min_duration: int
+) -> List[Excursion]:
+    """
+    Excursions of v beyond [low, high], oldest first.
+    
+    Args:
+        t: Monotonically non-decreasing timestamps (integer, e.g. epoch microseconds)
+        v: Values at each t
+        low, high: Alert limits (None: that side is not checked)
+        hysteresis: An excursion only ends once v is back inside the limit by this much
+        min_duration: Excursions spanning less than this (in units of t) are dropped
+    
+    An excursion starts at the first reading beyond a limit and ends at the
+    first reading back inside limit -/+ hysteresis. Its span runs to that
+    ending reading (or to the last reading while still open). Each side is
+    evaluated independently with array operations; only the per-excursion
+    bookkeeping is a Python loop.
+    """
+    found = []
+    if high is not None:
+        found += _runs("high", t, v, high, hysteresis, min_duration)
+    if low is not None:
+        # The low side is the high side of the negated series
+        found += _runs("low", t, -v, -low, hysteresis, min_duration)
+    found.sort(key=lambda e: e.start)
+    return found
+
+
+def _runs(kind: str, t: np.ndarray, v: np.ndarray, limit: float, hysteresis: float, min_duration: int) -> List[Excursion]:
+    n = len(v)
+    if n == 0:
+        return []
+    
+    enter = v > limit
+    leave = v <= limit - hysteresis
+    # Hysteresis latch: each reading takes the state of the most recent
+    # enter/leave signal at or before it (readings in the band keep the state)
+    signal = np.where(enter | leave, np.arange(n), -1)
+    latest = np.maximum.accumulate(signal)
+    active = (latest >= 0) & enter[np.maximum(latest, 0)]
+    
+    edges = np.diff(np.concatenate(([0], active.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    stops = np.flatnonzero(edges == -1)  # first inactive index after each run (n when open)
+    
+    last = np.minimum(stops, n - 1)
+    spans = t[last] - t[starts]
+    keep = spans >= min_duration
+    
+    excursions = []
+    for start, stop in zip(starts[keep].tolist(), stops[keep].tolist()):
+        excursions.append(Excursion(
+            kind,
+            start,
+            stop if stop < n else None,
+            start + int(np.argmax(v[start:stop])),
+            stop - start
+        ))
+    return excursions
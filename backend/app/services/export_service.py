@@ -0,0 +1,192 @@
+"""Streaming bulk export of readings (NDJSON / CSV / Parquet)"""
+
+from sqlalchemy import Float, cast, select
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+import csv
+import io
+import json
+import os
+
+from app.db.database import read_replica
+from app.db.models import Device, Reading
+from app.services.units import convert_columns
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+    pq = None
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "5000"))
+
+EXPORT_COLUMNS = ["id", "device_id", "ts", "value", "unit", "temperature_c", "event_id"]
+
+EXPORT_FORMATS: Dict[str, str] = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def parquet_available() -> bool:
+    return pq is not None
+
+
+async def export_readings(
+    fmt: str,
+    device_ids: Optional[List[str]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    unit: Optional[str] = None,
+    compensate: bool = False
+) -> AsyncIterator[bytes]:
+    """
+    Stream readings as encoded chunks of `fmt` ("ndjson", "csv" or "parquet").
+    
+    Devices are exported one after another, each oldest first, through a
+    server-side cursor, so memory stays bounded by EXPORT_FETCH_SIZE rows
+    however many readings match. Opens its own session because the stream
+    outlives the request handler. With unit / compensate, the value and
+    unit columns of each fetched batch are converted in one array operation.
+    """
+    encoder = {"ndjson": _ndjson, "csv": _csv, "parquet": _parquet}[fmt]
+    batches = _row_batches(device_ids, start, end)
+    if unit is not None or compensate:
+        batches = _converted(batches, unit, compensate)
+    async for chunk in encoder(batches):
+        if chunk:
+            yield chunk
+
+
+async def _row_batches(
+    device_ids: Optional[List[str]],
+    start: Optional[datetime],
+    end: Optional[datetime]
+) -> AsyncIterator[Sequence[Any]]:
+    async with read_replica.session() as db:
+        if device_ids is None:
+            device_ids = list(await db.scalars(select(Device.device_id).order_by(Device.device_id)))
+        
+        for device_id in device_ids:
+            # device_id equality + ts order is a range scan of (device_id, ts DESC)
+            query = (
+                select(
+                    Reading.id,
+                    Reading.device_id,
+                    Reading.ts,
+                    cast(Reading.value, Float),
+                    Reading.unit,
+                    cast(Reading.temperature_c, Float),
+                    Reading.event_id
+                )
+                .where(Reading.device_id == device_id)
+                .order_by(Reading.ts, Reading.id)
+                .execution_options(yield_per=EXPORT_FETCH_SIZE)
+            )
+            if start is not None:
+                query = query.where(Reading.ts >= start)
+            if end is not None:
+                query = query.where(Reading.ts < end)
+            
+            result = await db.stream(query)
+            async for partition in result.partitions():
+                yield partition
+
+
+async def _converted(
+    batches: AsyncIterator[Sequence[Any]],
+    unit: Optional[str],
+    compensate: bool
+) -> AsyncIterator[Sequence[Any]]:
+    async for rows in batches:
+        ids, device_ids, ts, values, units, temperatures, event_ids = zip(*rows)
+        values, units = convert_columns(values, units, temperatures, unit, compensate)
+        yield list(zip(ids, device_ids, ts, values, units, temperatures, event_ids))
+
+
+async def _ndjson(batches: AsyncIterator[Sequence[Any]]) -> AsyncIterator[bytes]:
+    async for rows in batches:
+        yield "".join(
+            json.dumps({
+                "id": row[0],
+                "device_id": row[1],
+                "ts": row[2].isoformat(),
+                "value": row[3],
+                "unit": row[4],
+                "temperature_c": row[5],
+                "event_id": str(row[6]) if row[6] else None,
+            }) + "\n"
+            for row in rows
+        ).encode()
+
+
+async def _csv(batches: AsyncIterator[Sequence[Any]]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    async for rows in batches:
+        writer.writerows(
+            (row[0], row[1], row[2].isoformat(), row[3], row[4], row[5], row[6] or "")
+            for row in rows
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back in chunks."""
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def _parquet(batches: AsyncIterator[Sequence[Any]]) -> AsyncIterator[bytes]:
+    if pq is None:
+        raise RuntimeError("Parquet export requires pyarrow")
+    
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("device_id", pa.string()),
+        ("ts", pa.timestamp("us")),
+        ("value", pa.float64()),
+        ("unit", pa.string()),
+        ("temperature_c", pa.float64()),
+        ("event_id", pa.string()),
+    ])
+    sink = _ChunkSink()
+    # Each fetched batch becomes one row group, written out as soon as it is encoded
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        async for rows in batches:
+            columns = list(zip(*rows))
+            columns[6] = [str(e) if e else None for e in columns[6]]
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
@@ -0,0 +1,61 @@
+"""In-memory filter of recently ingested event_ids"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from uuid import UUID
+import os
+
+# Recent event_ids remembered per worker (0 disables the filter)
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "20000"))
+
+
+class RecentEvents:
+    """
+    Bounded LRU map of event_id -> stored reading (response shape).
+    
+    Store-and-forward devices replay whole queues after reconnecting, so
+    most duplicates are events this worker stored moments ago. A hit
+    answers the replay with the original reading without a database
+    round trip. A set or Bloom filter is not enough here because a
+    duplicate must return the original reading, not just be detected.
+    Only committed readings are recorded.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[UUID, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, event_id: UUID) -> Optional[Dict[str, Any]]:
+        reading = self._entries.get(event_id)
+        if reading is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(event_id)
+        self.hits += 1
+        return reading
+
+    def add(self, event_id: UUID, reading: Dict[str, Any]) -> None:
+        if self.max_size <= 0:
+            return
+        self._entries[event_id] = reading
+        self._entries.move_to_end(event_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+        }
+
+
+recent_events = RecentEvents(IDEMPOTENCY_CACHE_SIZE)
@@ -0,0 +1,213 @@
+"""Write-behind ingest: queue single readings and store them in micro-batches"""
+
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+from app.db.database import AsyncSessionLocal
+from app.services.ingest_service import ingest_reading, ingest_readings_batch
+
+if TYPE_CHECKING:
+    from app.api.readings import ReadingPayload
+
+logger = logging.getLogger(__name__)
+
+# "sync" stores each POST /readings in its own transaction; "buffered" queues it
+INGEST_MODE = os.getenv("INGEST_MODE", "sync").lower()
+# Readings held in memory before POST /readings answers 503
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+# A micro-batch is written when it reaches this many rows...
+INGEST_FLUSH_ROWS = int(os.getenv("INGEST_FLUSH_ROWS", "500"))
+# ...or this many milliseconds after its first reading arrived
+INGEST_FLUSH_INTERVAL_MS = int(os.getenv("INGEST_FLUSH_INTERVAL_MS", "50"))
+# Retry-After sent with 503 when the queue is full
+INGEST_RETRY_AFTER_S = int(os.getenv("INGEST_RETRY_AFTER_S", "1"))
+
+# SQLSTATE classes that pass on their own: connection exception, transaction
+# rollback (deadlock, serialization), insufficient resources, operator
+# intervention (server shutting down), system error
+_TRANSIENT_SQLSTATE_CLASSES = ("08", "40", "53", "57", "58")
+
+
+def _permanent(exc: Exception) -> bool:
+    """Whether writing the same readings again would fail the same way, i.e. the rows are bad rather than the database unavailable."""
+    if isinstance(exc, ValueError):
+        return True
+    if not isinstance(exc, DBAPIError) or exc.connection_invalidated:
+        return False
+    if isinstance(exc, (OperationalError, InterfaceError)):
+        return False
+    sqlstate = getattr(exc.orig, "sqlstate", None) or ""
+    return sqlstate[:2] not in _TRANSIENT_SQLSTATE_CLASSES
+
+
+class BufferFull(Exception):
+    """The ingest queue is full or shutting down; the client should retry later."""
+
+
+class IngestBuffer:
+    """
+    Bounded queue of accepted readings drained by one background writer.
+    
+    Readings are acknowledged as soon as they are queued; the writer
+    stores them with ingest_readings_batch, so one transaction is shared
+    by up to INGEST_FLUSH_ROWS readings. Every queued reading carries an
+    event_id (assigned here when the device sent none), which is the
+    acknowledgement token and keeps retried flushes idempotent.
+    """
+
+    def __init__(self, max_size: int, flush_rows: int, flush_interval: float):
+        self.max_size = max_size
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._closed = True
+        self.accepted = 0
+        self.rejected_full = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.failures = 0
+        self.last_flush_ms: Optional[float] = None
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return not self._closed
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(self.max_size)
+        self._closed = False
+        self._writer = asyncio.create_task(self._run())
+
+    def submit(self, payload: "ReadingPayload") -> Dict[str, Any]:
+        """Queue a validated reading; returns the acknowledgement."""
+        if self._closed:
+            raise BufferFull("Ingest buffer is not accepting readings")
+        if payload.event_id is None:
+            payload.event_id = uuid.uuid4()
+        try:
+            self._queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.rejected_full += 1
+            raise BufferFull("Ingest buffer is full")
+        self.accepted += 1
+        return {
+            "status": "accepted",
+            "device_id": payload.device_id,
+            "ts": payload.ts.isoformat(),
+            "event_id": str(payload.event_id),
+        }
+
+    async def drain(self) -> None:
+        """Stop accepting readings, write everything queued, stop the writer."""
+        if self._writer is None:
+            return
+        self._closed = True
+        await self._queue.join()
+        self._writer.cancel()
+        try:
+            await self._writer
+        except asyncio.CancelledError:
+            pass
+        self._writer = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.flush_rows:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            await self._flush(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _flush(self, batch: List["ReadingPayload"]) -> None:
+        started = time.perf_counter()
+        delay = 0.5
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    results = await ingest_readings_batch(db, batch)
+                self.duplicates += sum(1 for r in results if r["status"] == "duplicate")
+                self.rows_written += sum(1 for r in results if r["status"] == "created")
+                break
+            except Exception as e:
+                if _permanent(e):
+                    # A reading the database rejects (integrity, a value too long for
+                    # its column, ...): isolate the offending readings
+                    logger.exception("Micro-batch of %d readings failed; storing individually", len(batch))
+                    await self._flush_individually(batch)
+                    break
+                # Database unavailable: keep the batch and retry; the full queue
+                # pushes back on clients with 503 meanwhile
+                self.failures += 1
+                logger.exception("Micro-batch write failed; retrying in %.1fs", delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10.0)
+        
+        elapsed = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.last_flush_ms = elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+        self._total_flush_ms += elapsed
+
+    async def _flush_individually(self, batch: List["ReadingPayload"]) -> None:
+        for payload in batch:
+            delay = 0.5
+            while True:
+                try:
+                    async with AsyncSessionLocal() as db:
+                        await ingest_reading(db, payload)
+                    self.rows_written += 1
+                    break
+                except Exception as e:
+                    if _permanent(e):
+                        self.dropped += 1
+                        logger.exception("Dropping reading %s from %s", payload.event_id, payload.device_id)
+                        break
+                    self.failures += 1
+                    logger.exception("Write of reading %s failed; retrying in %.1fs", payload.event_id, delay)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 10.0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": INGEST_MODE,
+            "depth": self._queue.qsize() if self._queue else 0,
+            "max_size": self.max_size,
+            "accepted": self.accepted,
+            "rejected_full": self.rejected_full,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "duplicates": self.duplicates,
+            "dropped": self.dropped,
+            "write_failures": self.failures,
+            "rows_per_flush": (self.rows_written + self.duplicates) / self.flushes if self.flushes else None,
+            "last_flush_ms": self.last_flush_ms,
+            "max_flush_ms": self.max_flush_ms,
+            "mean_flush_ms": self._total_flush_ms / self.flushes if self.flushes else None,
+        }
+
+
+ingest_buffer = IngestBuffer(INGEST_QUEUE_SIZE, INGEST_FLUSH_ROWS, INGEST_FLUSH_INTERVAL_MS / 1000)
@@ -1,63 +1,383 @@
 """Reading ingestion service with idempotency"""
 
-from sqlalchemy.orm import Session
+from sqlalchemy import String, column, func, insert, select, text, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
-from typing import TYPE_CHECKING
+from datetime import datetime
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+from uuid import UUID
 
 from app.db.models import Reading, Device
+from app.services.alert_service import ALERT_UNIT, evaluate_alerts
+from app.services.device_cache import device_cache
+from app.services.idempotency import recent_events
+from app.services.live_hub import live_hub
+from app.services.metrics import batch_stages, reading_counts, single_stages
+from app.services.response_cache import response_cache
+from app.services.rollup_service import RollupInput, update_rollups
+from app.services.spc_service import SPC_ENABLED, SpcInput, update_spc
+from app.services.status_tracker import status_tracker
 
 if TYPE_CHECKING:
     from app.api.readings import ReadingPayload
 
+# Columns supplied by ingest, in _reading_row order
+INSERT_COLUMNS = (
+    Reading.device_id, Reading.ts, Reading.value, Reading.unit, Reading.temperature_c, Reading.event_id
+)
+# Columns of a stored reading returned to clients
+READING_COLUMNS = (Reading.id,) + INSERT_COLUMNS
 
-def ingest_reading(db: Session, payload: "ReadingPayload") -> Reading:
+
+def _insert_unless_stored_sql() -> str:
+    stored = ", ".join(c.key for c in READING_COLUMNS)
+    columns = ", ".join(c.key for c in INSERT_COLUMNS)
+    new_row = ", ".join(
+        f"CAST(:{c.key} AS {c.type.compile(dialect=postgresql.dialect())})" for c in INSERT_COLUMNS
+    )
+    return (
+        f"WITH existing AS (SELECT {stored} FROM readings WHERE event_id = CAST(:event_id AS UUID) LIMIT 1), "
+        f"inserted AS (INSERT INTO readings ({columns}) SELECT {new_row} WHERE NOT EXISTS (SELECT 1 FROM existing) "
+        f"ON CONFLICT (event_id, ts) DO NOTHING RETURNING {stored}) "
+        f"SELECT 'created' AS status, {stored} FROM inserted "
+        f"UNION ALL SELECT 'duplicate', {stored} FROM existing"
+    )
+
+
+# Textual for the same reason as the rollup upsert: the postgresql insert()
+# construct is never statement-cached, and this runs once per reading
+_INSERT_UNLESS_STORED = text(_insert_unless_stored_sql()).columns(
+    column("status", String), *[c.expression for c in READING_COLUMNS]
+)
+
+
+async def ingest_reading(db: AsyncSession, payload: "ReadingPayload") -> Dict[str, Any]:
     """
     Ingest a reading with idempotency support.
     
-    - Creates/updates device record
-    - Inserts reading
-    - Handles duplicate event_id gracefully
+    - Answers replays of recently stored event_ids from memory
+    - Creates/updates device record (skipping the lookup for cached devices)
+    - Inserts the reading, or finds the stored one, in a single statement
+    - Folds it into the rollup tables and the device's SPC state in the same transaction
+    - Bumps the device's data version (ETags, response cache) after commit
+    - Publishes a newly stored reading to live subscribers
+    - Reports it to the status tracker (a device coming back turns OK)
+    - Evaluates it against the device's alert limits
+    
+    Returns the stored reading (the original one for a duplicate event_id)
+    in response shape.
     """
+    clock = perf_counter()
+    if payload.event_id:
+        recent = recent_events.get(payload.event_id)
+        if recent:
+            reading_counts.add("duplicate")
+            return recent
+    clock = single_stages.dedupe.lap(clock)
+    
     # Ensure device exists
-    device = db.query(Device).filter(Device.device_id == payload.device_id).first()
-    if not device:
-        device = Device(
-            device_id=payload.device_id,
-            name=f"Device {payload.device_id}",
-            last_seen_at=payload.ts
+    cached = device_cache.get(payload.device_id)
+    device = None
+    write_last_seen = cached is None or device_cache.needs_write(cached, payload.ts)
+    if cached is None:
+        device = await db.get(Device, payload.device_id)
+        if not device:
+            device = Device(
+                device_id=payload.device_id,
+                name=_default_name(payload.device_id),
+                last_seen_at=payload.ts
+            )
+            db.add(device)
+        elif device.last_seen_at is None or payload.ts > device.last_seen_at:
+            device.last_seen_at = payload.ts  # type: ignore[assignment]
+    elif write_last_seen:
+        await db.execute(
+            update(Device)
+            .where(Device.device_id == payload.device_id)
+            .values(last_seen_at=func.greatest(Device.last_seen_at, payload.ts))
         )
-        db.add(device)
+    
+    try:
+        await db.flush()
+        clock = single_stages.device_lookup.lap(clock)
+        status, row = await _insert_reading(db, payload)
+        clock = single_stages.insert.lap(clock)
+        if status == "duplicate":
+            # Idempotent: discard the device update, return the original reading
+            await db.rollback()
+            reading = reading_response(row)
+            recent_events.add(payload.event_id, reading)
+            reading_counts.add("duplicate")
+            return reading
+        
+        await update_rollups(db, [_rollup_input(payload)])
+        clock = single_stages.rollups.lap(clock)
+        if SPC_ENABLED and payload.unit == ALERT_UNIT:
+            target_ri = cached.target_ri if cached is not None else _float(device.target_ri)
+            await update_spc(db, [_spc_input(payload, target_ri)])
+            clock = single_stages.spc.lap(clock)
+        await db.commit()
+        clock = single_stages.commit.lap(clock)
+    except IntegrityError as e:
+        await db.rollback()
+        raise ValueError(f"Failed to insert reading: {str(e)}")
+    
+    # Only committed rows are cached
+    if device is not None:
+        device_cache.put(device)
+    elif write_last_seen:
+        device_cache.written(payload.device_id, payload.ts)
     else:
-        # Update last_seen_at with new timestamp
-        device.last_seen_at = payload.ts  # type: ignore[assignment]
+        device_cache.defer(payload.device_id, payload.ts)
     
-    # Check for duplicate event_id if provided
+    reading = reading_response(row)
     if payload.event_id:
-        existing = db.query(Reading).filter(Reading.event_id == payload.event_id).first()
-        if existing:
-            # Idempotent: return existing reading
-            return existing
-    
-    # Create new reading
-    reading = Reading(
-        device_id=payload.device_id,
-        ts=payload.ts,
-        value=payload.value,
-        unit=payload.unit,
-        temperature_c=payload.temperature_c,
-        event_id=payload.event_id
-    )
+        recent_events.add(payload.event_id, reading)
+    response_cache.bump(payload.device_id)
+    live_hub.publish_reading(reading)
+    status_tracker.observe(payload.device_id, payload.ts)
+    clock = single_stages.publish.lap(clock)
+    await evaluate_alerts([payload])
+    single_stages.alerts.lap(clock)
+    reading_counts.add("created")
+    return reading
+
+
+async def _insert_reading(db: AsyncSession, payload: "ReadingPayload") -> Tuple[str, Any]:
+    """
+    Insert one reading; returns ("created" | "duplicate", stored row).
+    
+    With an event_id this is one statement: a CTE looks the event up and
+    the INSERT only runs when it is not stored yet, with ON CONFLICT
+    (event_id, ts) DO NOTHING covering concurrent inserts.
+    """
+    if payload.event_id is None:
+        row = (await db.execute(
+            insert(Reading).values(**_reading_row(payload)).returning(*READING_COLUMNS)
+        )).one()
+        return "created", row
+    
+    result = (await db.execute(_INSERT_UNLESS_STORED, _reading_row(payload))).first()
+    if result is None:
+        # Lost a race with a concurrent insert of the same event
+        row = (await db.execute(
+            select(*READING_COLUMNS).where(Reading.event_id == payload.event_id).limit(1)
+        )).one()
+        return "duplicate", row
+    return result.status, result
+
+
+async def _stored_by_event_id(db: AsyncSession, event_ids: List[UUID]) -> Dict[UUID, Dict[str, Any]]:
+    rows = await db.execute(select(*READING_COLUMNS).where(Reading.event_id.in_(event_ids)))
+    return {row.event_id: reading_response(row) for row in rows}
+
+
+async def ingest_readings_batch(db: AsyncSession, payloads: List["ReadingPayload"]) -> List[Dict[str, Any]]:
+    """
+    Ingest a batch of already-validated readings in a single transaction.
+    
+    - Upserts each device once, moving last_seen_at to the newest ts in the batch
+      (cached devices with only a small advance are deferred to the next flush)
+    - Resolves already stored event_ids from memory, then with one query
+    - Inserts the rest with INSERT ... ON CONFLICT (event_id, ts) DO NOTHING
+    - Folds the newly stored readings into the rollup tables and SPC state
+    - Commits once, then bumps data versions, publishes the new readings to live subscribers,
+      reports the devices to the status tracker and evaluates alert limits
+    
+    Returns one result per payload, in input order, with status
+    "created" or "duplicate" and the reading id.
+    """
+    if not payloads:
+        return []
+    clock = perf_counter()
+    
+    # Repeated event_ids inside the batch resolve to their first occurrence
+    first_index: Dict[UUID, int] = {}
+    repeats: Dict[int, int] = {}
+    keyed: List[int] = []
+    unkeyed: List[int] = []
+    for i, payload in enumerate(payloads):
+        if payload.event_id is None:
+            unkeyed.append(i)
+        elif payload.event_id in first_index:
+            repeats[i] = first_index[payload.event_id]
+        else:
+            first_index[payload.event_id] = i
+            keyed.append(i)
+    
+    newest_ts: Dict[str, datetime] = {}
+    for payload in payloads:
+        current = newest_ts.get(payload.device_id)
+        if current is None or payload.ts > current:
+            newest_ts[payload.device_id] = payload.ts
+    # Cached devices whose last_seen_at barely moves skip the upsert
+    upsert: Dict[str, datetime] = {}
+    deferred: Dict[str, datetime] = {}
+    for device_id, ts in newest_ts.items():
+        cached = device_cache.get(device_id)
+        if cached is None or device_cache.needs_write(cached, ts):
+            upsert[device_id] = ts
+        else:
+            deferred[device_id] = ts
     
+    results: List[Dict[str, Any]] = [{} for _ in payloads]
+    devices = []
+    existing: Dict[UUID, Dict[str, Any]] = {}
+    created: Dict[UUID, Dict[str, Any]] = {}
+    unkeyed_created: List[Dict[str, Any]] = []
     try:
-        db.add(reading)
-        db.commit()
-        db.refresh(reading)
-        return reading
+        if upsert:
+            # One upsert per device; sorted so concurrent batches lock rows in the same order
+            device_stmt = pg_insert(Device).values([
+                {"device_id": device_id, "name": _default_name(device_id), "last_seen_at": ts}
+                for device_id, ts in sorted(upsert.items())
+            ])
+            device_stmt = device_stmt.on_conflict_do_update(
+                index_elements=[Device.device_id],
+                set_={"last_seen_at": func.greatest(Device.last_seen_at, device_stmt.excluded.last_seen_at)}
+            ).returning(
+                Device.device_id, Device.last_seen_at, Device.target_ri, Device.alert_low, Device.alert_high
+            )
+            devices = (await db.execute(device_stmt)).all()
+        clock = batch_stages.device_lookup.lap(clock)
+        
+        if keyed:
+            # Recent replays are answered from memory; the unique index is per
+            # (event_id, ts) because readings is partitioned on ts, so the
+            # remaining event_ids are looked up before inserting
+            for i in keyed:
+                recent = recent_events.get(payloads[i].event_id)
+                if recent:
+                    existing[payloads[i].event_id] = recent
+            lookup = [payloads[i].event_id for i in keyed if payloads[i].event_id not in existing]
+            if lookup:
+                existing.update(await _stored_by_event_id(db, lookup))
+            clock = batch_stages.dedupe.lap(clock)
+            fresh = [i for i in keyed if payloads[i].event_id not in existing]
+            if fresh:
+                rows = (await db.execute(
+                    pg_insert(Reading)
+                    .on_conflict_do_nothing(index_elements=[Reading.event_id, Reading.ts])
+                    .returning(*READING_COLUMNS),
+                    [_reading_row(payloads[i]) for i in fresh]
+                )).all()
+                created = {row.event_id: reading_response(row) for row in rows}
+            
+            # Lost a race with a concurrent insert of the same event
+            raced = [payloads[i].event_id for i in fresh if payloads[i].event_id not in created]
+            if raced:
+                existing.update(await _stored_by_event_id(db, raced))
+            
+            for i in keyed:
+                event_id = payloads[i].event_id
+                if event_id in created:
+                    results[i] = _result(i, "created", created[event_id]["id"], event_id)
+                else:
+                    results[i] = _result(i, "duplicate", existing[event_id]["id"], event_id)
+        
+        if unkeyed:
+            rows = (await db.execute(
+                pg_insert(Reading).returning(*READING_COLUMNS, sort_by_parameter_order=True),
+                [_reading_row(payloads[i]) for i in unkeyed]
+            )).all()
+            for i, row in zip(unkeyed, rows):
+                results[i] = _result(i, "created", row.id, None)
+                unkeyed_created.append(reading_response(row))
+        clock = batch_stages.insert.lap(clock)
+        
+        await update_rollups(db, [
+            _rollup_input(payloads[i]) for i in keyed + unkeyed if results[i]["status"] == "created"
+        ])
+        clock = batch_stages.rollups.lap(clock)
+        if SPC_ENABLED:
+            targets = {row.device_id: _float(row.target_ri) for row in devices}
+            for device_id in deferred:
+                cached = device_cache.peek(device_id)
+                targets[device_id] = cached.target_ri if cached is not None else None
+            await update_spc(db, [
+                _spc_input(payloads[i], targets.get(payloads[i].device_id))
+                for i in keyed + unkeyed
+                if results[i]["status"] == "created" and payloads[i].unit == ALERT_UNIT
+            ])
+            clock = batch_stages.spc.lap(clock)
+        await db.commit()
+        clock = batch_stages.commit.lap(clock)
     except IntegrityError as e:
-        db.rollback()
-        # Handle race condition: event_id collision
-        if payload.event_id:
-            existing = db.query(Reading).filter(Reading.event_id == payload.event_id).first()
-            if existing:
-                return existing
-        raise ValueError(f"Failed to insert reading: {str(e)}")
+        await db.rollback()
+        raise ValueError(f"Failed to insert readings: {str(e)}")
+    
+    for event_id, reading in {**existing, **created}.items():
+        recent_events.add(event_id, reading)
+    for device in devices:
+        device_cache.put(device)
+    for device_id, ts in deferred.items():
+        device_cache.defer(device_id, ts)
+    for reading in [*created.values(), *unkeyed_created]:
+        response_cache.bump(reading["device_id"])
+        live_hub.publish_reading(reading)
+    for device_id, ts in newest_ts.items():
+        status_tracker.observe(device_id, ts)
+    clock = batch_stages.publish.lap(clock)
+    await evaluate_alerts(payloads[i] for i in keyed + unkeyed if results[i]["status"] == "created")
+    batch_stages.alerts.lap(clock)
+    
+    for i, first in repeats.items():
+        results[i] = _result(i, "duplicate", results[first]["id"], payloads[i].event_id)
+    
+    stored = len(created) + len(unkeyed_created)
+    reading_counts.add("created", stored)
+    reading_counts.add("duplicate", len(payloads) - stored)
+    return results
+
+
+def _reading_row(payload: "ReadingPayload") -> Dict[str, Any]:
+    return {
+        "device_id": payload.device_id,
+        "ts": payload.ts,
+        "value": payload.value,
+        "unit": payload.unit,
+        "temperature_c": payload.temperature_c,
+        "event_id": payload.event_id,
+    }
+
+
+def reading_response(row: Any) -> Dict[str, Any]:
+    """Client-facing shape of a stored reading."""
+    return {
+        "id": row.id,
+        "device_id": row.device_id,
+        "ts": row.ts.isoformat(),
+        "value": float(row.value),
+        "unit": row.unit,
+        "temperature_c": float(row.temperature_c) if row.temperature_c is not None else None,
+        "event_id": str(row.event_id) if row.event_id else None,
+    }
+
+
+def _rollup_input(payload: "ReadingPayload") -> RollupInput:
+    return (payload.device_id, payload.ts, payload.value, payload.temperature_c)
+
+
+def _spc_input(payload: "ReadingPayload", target_ri: Optional[float]) -> SpcInput:
+    return (payload.device_id, payload.ts, payload.value, target_ri)
+
+
+def _default_name(device_id: str) -> str:
+    # Name of a device registered by its first reading, cut to fit devices.name
+    return f"Device {device_id}"[:255]
+
+
+def _float(value: Any) -> Optional[float]:
+    return float(value) if value is not None else None
+
+
+def _result(index: int, status: str, reading_id: Any, event_id: Any) -> Dict[str, Any]:
+    return {
+        "index": index,
+        "status": status,
+        "id": reading_id,
+        "event_id": str(event_id) if event_id else None,
+    }
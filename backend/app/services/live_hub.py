@@ -0,0 +1,219 @@
+"""In-process fan-out of new readings and device status changes to live subscribers"""
+
+from typing import Any, Dict, List, Optional, Set
+import asyncio
+import json
+import logging
+import os
+import uuid
+
+from app.db.database import async_engine
+from app.services.response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per subscriber; a client that falls further behind loses events
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "1000"))
+# Seconds between keepalive comments on idle streams
+LIVE_HEARTBEAT_S = float(os.getenv("LIVE_HEARTBEAT_S", "15"))
+# "true" relays events between API workers with Postgres LISTEN/NOTIFY
+LIVE_NOTIFY = os.getenv("LIVE_NOTIFY", "false").lower() == "true"
+LIVE_NOTIFY_CHANNEL = os.getenv("LIVE_NOTIFY_CHANNEL", "refract_live")
+
+# NOTIFY payloads are limited to 8000 bytes; events are packed up to this size
+_NOTIFY_MAX_BYTES = 7500
+
+
+class Subscription:
+    """One live client: a bounded queue of events, optionally limited to some devices."""
+
+    def __init__(self, device_ids: Optional[Set[str]], event_types: Set[str], max_size: int):
+        self.device_ids = device_ids  # None: the whole fleet
+        self.event_types = event_types
+        self.queue: asyncio.Queue = asyncio.Queue(max_size)
+        self.dropped = 0
+
+    def wants(self, event: Dict[str, Any]) -> bool:
+        return event["type"] in self.event_types and (
+            self.device_ids is None or event["device_id"] in self.device_ids
+        )
+
+    def offer(self, event: Optional[Dict[str, Any]]) -> bool:
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            # A slow client loses events rather than holding up ingest
+            self.dropped += 1
+            return False
+
+    def close(self) -> None:
+        """Make the stream finish: None is queued, displacing the oldest event if full."""
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class LiveHub:
+    """
+    Broadcasts ingest events to subscribers of this worker.
+    
+    Publishing never touches the database: ingest hands over the stored
+    reading (the status tracker its transitions) and the hub fans it out
+    from memory. With LIVE_NOTIFY, events are also relayed to the other
+    workers over one LISTEN/NOTIFY connection per worker.
+    """
+
+    def __init__(self, max_queue: int, notify: bool, channel: str):
+        self.max_queue = max_queue
+        self.notify = notify
+        self.channel = channel
+        self._origin = uuid.uuid4().hex
+        self._subscribers: Set[Subscription] = set()
+        self._outbox: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.relayed_in = 0
+        self.relayed_out = 0
+        self.notify_connected = False
+
+    async def start(self) -> None:
+        """Start the NOTIFY relay when enabled."""
+        if self.notify:
+            self._outbox = asyncio.Queue(self.max_queue)
+            self._tasks.append(asyncio.create_task(self._run_relay()))
+
+    async def stop(self) -> None:
+        """Stop background tasks and end every open stream."""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        for subscription in list(self._subscribers):
+            subscription.close()
+        self._subscribers.clear()
+
+    def subscribe(self, device_ids: Optional[Set[str]], event_types: Set[str]) -> Subscription:
+        subscription = Subscription(device_ids, event_types, self.max_queue)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscribers.discard(subscription)
+
+    def publish_reading(self, reading: Dict[str, Any]) -> None:
+        """Announce a newly stored reading (response shape). Never blocks."""
+        self.publish({"type": "reading", "device_id": reading["device_id"], "reading": reading})
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        """Announce an event (a dict with type and device_id) here and to other workers. Never blocks."""
+        self._broadcast(event)
+        if self._outbox is not None:
+            try:
+                self._outbox.put_nowait(event)
+            except asyncio.QueueFull:
+                self.dropped += 1
+
+    def _broadcast(self, event: Dict[str, Any]) -> None:
+        self.published += 1
+        for subscription in self._subscribers:
+            if subscription.wants(event):
+                if subscription.offer(event):
+                    self.delivered += 1
+                else:
+                    self.dropped += 1
+
+    async def _run_relay(self) -> None:
+        """Hold one LISTEN connection; send this worker's events, receive the others'."""
+        delay = 1.0
+        while True:
+            try:
+                async with async_engine.connect() as conn:
+                    raw = (await conn.get_raw_connection()).driver_connection
+                    closed = asyncio.Event()
+                    raw.add_termination_listener(lambda _: closed.set())
+                    await raw.add_listener(self.channel, self._on_notify)
+                    self.notify_connected = True
+                    delay = 1.0
+                    sender = asyncio.create_task(self._send_notifications(raw))
+                    waiter = asyncio.create_task(closed.wait())
+                    try:
+                        done, _ = await asyncio.wait({sender, waiter}, return_when=asyncio.FIRST_COMPLETED)
+                    finally:
+                        sender.cancel()
+                        waiter.cancel()
+                        self.notify_connected = False
+                        if not raw.is_closed():
+                            # The connection goes back to the pool
+                            await raw.remove_listener(self.channel, self._on_notify)
+                    if sender in done:
+                        sender.result()
+                    raise ConnectionError("LISTEN connection closed")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.notify_connected = False
+                logger.exception("LISTEN/NOTIFY relay failed; reconnecting in %.0fs", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    async def _send_notifications(self, raw) -> None:
+        while True:
+            events = [await self._outbox.get()]
+            while not self._outbox.empty():
+                events.append(self._outbox.get_nowait())
+            for payload in _pack(self._origin, events):
+                await raw.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+            self.relayed_out += len(events)
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        message = json.loads(payload)
+        if message["origin"] == self._origin:
+            return
+        for event in message["events"]:
+            self.relayed_in += 1
+            # Another worker's change: cached responses here are stale too
+            response_cache.bump(event["device_id"])
+            self._broadcast(event)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "notify": self.notify,
+            "notify_connected": self.notify_connected,
+            "relayed_in": self.relayed_in,
+            "relayed_out": self.relayed_out,
+        }
+
+
+def _pack(origin: str, events: List[Dict[str, Any]]) -> List[str]:
+    """Split events into NOTIFY payloads under the size limit."""
+    payloads = []
+    chunk: List[str] = []
+    size = 0
+    for event in events:
+        encoded = json.dumps(event, separators=(",", ":"))
+        if chunk and size + len(encoded) > _NOTIFY_MAX_BYTES:
+            payloads.append(_envelope(origin, chunk))
+            chunk, size = [], 0
+        chunk.append(encoded)
+        size += len(encoded) + 1
+    if chunk:
+        payloads.append(_envelope(origin, chunk))
+    return payloads
+
+
+def _envelope(origin: str, encoded: List[str]) -> str:
+    return f'{{"origin":"{origin}","events":[{",".join(encoded)}]}}'
+
+
+live_hub = LiveHub(LIVE_QUEUE_SIZE, LIVE_NOTIFY, LIVE_NOTIFY_CHANNEL)
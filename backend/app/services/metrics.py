@@ -0,0 +1,192 @@
+"""Prometheus metrics: per-route request counts and latency, ingest stage timings and throttling, DB pool usage"""
+
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import os
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:  # metrics are disabled without prometheus_client
+    REGISTRY = None
+
+# "false" turns all instrumentation into no-ops and removes GET /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true" and REGISTRY is not None
+
+# Seconds; from sub-millisecond cache hits to slow batch commits
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_BUCKETS = (0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+
+INGEST_STAGES = ("validation", "dedupe", "device_lookup", "insert", "rollups", "spc", "commit", "publish", "alerts")
+READING_RESULTS = ("created", "duplicate", "rejected")
+# Which limit refused an ingest request (app.services.rate_limiter)
+THROTTLE_REASONS = ("device", "api_key", "pool")
+
+
+class Stage:
+    """
+    A pre-bound histogram child for one stage of one ingest path.
+    
+    lap(started) records the time since `started` and returns the current
+    time, so consecutive stages chain without allocating anything.
+    """
+
+    def __init__(self, child):
+        self._observe = child.observe
+
+    def lap(self, started: float) -> float:
+        now = perf_counter()
+        self._observe(now - started)
+        return now
+
+
+class NoStage:
+    def lap(self, started: float) -> float:
+        return started
+
+
+class IngestStages:
+    def __init__(self, histogram: Optional["Histogram"], path: str):
+        for stage in INGEST_STAGES:
+            setattr(self, stage, Stage(histogram.labels(path, stage)) if histogram is not None else NoStage())
+
+
+class OutcomeCounts:
+    """A counter's children for a fixed set of labels, pre-bound."""
+
+    def __init__(self, counter: Optional["Counter"], outcomes: Tuple[str, ...]):
+        self._inc = {
+            result: counter.labels(result).inc if counter is not None else _ignore
+            for result in outcomes
+        }
+
+    def add(self, result: str, amount: int = 1) -> None:
+        if amount:
+            self._inc[result](amount)
+
+
+class RequestMetrics:
+    """
+    Request counts and latency per route template, method and status.
+    
+    Children are created on the first request for a label combination and
+    then reused, so a request costs two dictionary lookups.
+    """
+
+    def __init__(self):
+        self._requests = Counter(
+            "refract_http_requests_total", "HTTP requests", ["route", "method", "status"]
+        )
+        self._latency = Histogram(
+            "refract_http_request_duration_seconds", "HTTP request latency", ["route", "method"],
+            buckets=LATENCY_BUCKETS
+        )
+        self._observe: Dict[Tuple[str, str], Callable[[float], None]] = {}
+        self._count: Dict[Tuple[str, str, int], Callable[[], None]] = {}
+
+    def record(self, route: str, method: str, status: int, seconds: float) -> None:
+        observe = self._observe.get((route, method))
+        if observe is None:
+            observe = self._observe[(route, method)] = self._latency.labels(route, method).observe
+        observe(seconds)
+        count = self._count.get((route, method, status))
+        if count is None:
+            count = self._count[(route, method, status)] = self._requests.labels(route, method, str(status)).inc
+        count()
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request under its route template (e.g. /api/v1/devices/{device_id})."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            request_metrics.record(
+                route.path if route is not None else "unmatched", scope["method"], status, perf_counter() - started
+            )
+
+
+class PoolCollector:
+    """Connection pool usage of one or more engines, read at scrape time."""
+
+    def __init__(self):
+        self.pools: List[Tuple[str, Any, int]] = []  # (name, pool, capacity)
+
+    def collect(self):
+        connections = GaugeMetricFamily(
+            "refract_db_pool_connections", "Pooled database connections by state", labels=["pool", "state"]
+        )
+        capacity = GaugeMetricFamily(
+            "refract_db_pool_capacity", "Most connections the pool opens (pool_size + max_overflow)", labels=["pool"]
+        )
+        utilization = GaugeMetricFamily(
+            "refract_db_pool_utilization", "Checked-out connections / capacity", labels=["pool"]
+        )
+        for name, pool, size in self.pools:
+            connections.add_metric([name, "checked_out"], pool.checkedout())
+            connections.add_metric([name, "idle"], pool.checkedin())
+            connections.add_metric([name, "overflow"], max(pool.overflow(), 0))
+            capacity.add_metric([name], size)
+            utilization.add_metric([name], pool.checkedout() / size if size else 0.0)
+        yield connections
+        yield capacity
+        yield utilization
+
+
+_pool_collector: Optional[PoolCollector] = None
+
+
+def register_pool(name: str, pool, capacity: int) -> None:
+    global _pool_collector
+    if not METRICS_ENABLED:
+        return
+    if _pool_collector is None:
+        # One collector for all pools: metric names may be registered only once
+        _pool_collector = PoolCollector()
+        REGISTRY.register(_pool_collector)
+    _pool_collector.pools.append((name, pool, capacity))
+
+
+def render() -> Tuple[bytes, str]:
+    """Exposition body and content type for GET /metrics."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def _ignore(amount: int = 1) -> None:
+    pass
+
+
+if METRICS_ENABLED:
+    _stage_seconds = Histogram(
+        "refract_ingest_stage_seconds", "Time spent per ingest stage", ["path", "stage"], buckets=STAGE_BUCKETS
+    )
+    _readings = Counter("refract_readings_total", "Readings by ingest outcome", ["result"])
+    _throttled = Counter("refract_ingest_throttled_total", "Ingest requests refused with 429, by limit", ["reason"])
+    request_metrics = RequestMetrics()
+else:
+    _stage_seconds = None
+    _readings = None
+    _throttled = None
+    request_metrics = None
+
+single_stages = IngestStages(_stage_seconds, "single")
+batch_stages = IngestStages(_stage_seconds, "batch")
+reading_counts = OutcomeCounts(_readings, READING_RESULTS)
+throttle_counts = OutcomeCounts(_throttled, THROTTLE_REASONS)
@@ -0,0 +1,228 @@
+"""Monthly partitioning and retention for the readings table"""
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+import asyncio
+import logging
+import os
+import re
+
+from app.db.database import AsyncSessionLocal
+from app.db.models import ReadingRollup1d
+from app.services.response_cache import response_cache
+from app.services.rollup_service import rebuild_rollups
+
+logger = logging.getLogger(__name__)
+
+# Months of empty partitions kept ready ahead of the current one
+PARTITION_PREMAKE_MONTHS = int(os.getenv("PARTITION_PREMAKE_MONTHS", "3"))
+# Raw readings older than this many whole months are retired (0 keeps everything)
+READINGS_RETENTION_MONTHS = int(os.getenv("READINGS_RETENTION_MONTHS", "0"))
+# "drop" deletes retired partitions; "detach" keeps them as standalone tables for archiving
+READINGS_RETENTION_ACTION = os.getenv("READINGS_RETENTION_ACTION", "drop").lower()
+# Seconds between background maintenance runs (0 disables the background task)
+PARTITION_MAINTENANCE_INTERVAL_S = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL_S", "3600"))
+
+PARENT_TABLE = "readings"
+DEFAULT_PARTITION = "readings_default"
+
+# Serializes maintenance across API workers and the CLI
+_MAINTENANCE_LOCK = 0x52454144  # "READ"
+
+_BOUND_PATTERN = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+class Partition(NamedTuple):
+    name: str
+    start: Optional[datetime]  # None for the default partition
+    end: Optional[datetime]
+
+
+def month_start(ts: datetime) -> datetime:
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARENT_TABLE}_p{month:%Y_%m}"
+
+
+async def list_partitions(db: AsyncSession) -> List[Partition]:
+    """Attached partitions of readings, monthly ones oldest first, default last."""
+    rows = await db.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = CAST(:parent AS regclass)"
+    ), {"parent": PARENT_TABLE})
+    
+    partitions = []
+    default = None
+    for name, bound in rows:
+        match = _BOUND_PATTERN.search(bound)
+        if match:
+            partitions.append(Partition(
+                name, datetime.fromisoformat(match.group(1)), datetime.fromisoformat(match.group(2))
+            ))
+        else:
+            default = Partition(name, None, None)
+    partitions.sort(key=lambda p: p.start)
+    if default:
+        partitions.append(default)
+    return partitions
+
+
+async def ensure_partitions(db: AsyncSession, now: Optional[datetime] = None) -> List[str]:
+    """
+    Create missing monthly partitions. Commits; returns the names created.
+    
+    Covers the current month through PARTITION_PREMAKE_MONTHS ahead, plus
+    every month that has rows in the default partition (late or backfilled
+    readings), whose rows are moved into their new partition.
+    """
+    now = now or datetime.utcnow()
+    await _lock(db)
+    await db.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT"
+    ))
+    
+    existing = {p.start for p in await list_partitions(db) if p.start is not None}
+    current = month_start(now)
+    wanted = {add_months(current, n) for n in range(PARTITION_PREMAKE_MONTHS + 1)}
+    stray = await db.scalars(text(
+        f"SELECT DISTINCT date_trunc('month', ts) FROM {DEFAULT_PARTITION}"
+    ))
+    wanted.update(stray)
+    
+    created = []
+    for month in sorted(wanted - existing):
+        await _create_partition(db, month)
+        created.append(partition_name(month))
+    await db.commit()
+    return created
+
+
+async def create_partitions(db: AsyncSession, start: datetime, end: datetime) -> List[str]:
+    """
+    Create the monthly partitions covering [start, end), e.g. before a bulk backfill.
+    
+    Rows then go straight to their partition instead of through the
+    default one. Commits; returns the names created.
+    """
+    await _lock(db)
+    existing = {p.start for p in await list_partitions(db) if p.start is not None}
+    created = []
+    month = month_start(start)
+    while month < end:
+        if month not in existing:
+            await _create_partition(db, month)
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    await db.commit()
+    return created
+
+
+async def _create_partition(db: AsyncSession, month: datetime) -> None:
+    name = partition_name(month)
+    start, end = _literal(month), _literal(add_months(month, 1))
+    has_stray = await db.scalar(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE ts >= {start} AND ts < {end})"
+    ))
+    if not has_stray:
+        await db.execute(text(
+            f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} FOR VALUES FROM ({start}) TO ({end})"
+        ))
+        return
+    
+    # A new partition may not overlap rows held by the default partition,
+    # so build it standalone, move the rows over, then attach it
+    await db.execute(text(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS)"))
+    await db.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE ts >= {start} AND ts < {end} RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ))
+    await db.execute(text(
+        f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM ({start}) TO ({end})"
+    ))
+
+
+async def apply_retention(
+    db: AsyncSession,
+    now: Optional[datetime] = None,
+    months: Optional[int] = None,
+    action: Optional[str] = None
+) -> List[str]:
+    """
+    Retire monthly partitions that ended more than `months` whole months ago.
+    
+    A partition is only retired once the daily rollups account for every
+    reading in it; otherwise its rollups are rebuilt first, so the aggregate
+    endpoint keeps serving the period after the raw rows are gone. Retiring
+    is a metadata operation (DROP or DETACH), not a DELETE. Commits per
+    partition; returns the names retired.
+    """
+    months = READINGS_RETENTION_MONTHS if months is None else months
+    action = action or READINGS_RETENTION_ACTION
+    if action not in ("drop", "detach"):
+        raise ValueError(f"Unknown retention action: {action}")
+    if months <= 0:
+        return []
+    
+    cutoff = add_months(month_start(now or datetime.utcnow()), -months)
+    retired = []
+    for partition in await list_partitions(db):
+        if partition.end is None or partition.end > cutoff:
+            continue
+        
+        raw = await db.scalar(text(f"SELECT count(*) FROM {partition.name}"))
+        rolled = await db.scalar(
+            select(func.coalesce(func.sum(ReadingRollup1d.count), 0))
+            .where(ReadingRollup1d.bucket_start >= partition.start, ReadingRollup1d.bucket_start < partition.end)
+        )
+        if raw != rolled:
+            await rebuild_rollups(db, start=partition.start, end=partition.end)
+        
+        await _lock(db)
+        await db.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {partition.name}"))
+        if action == "drop":
+            await db.execute(text(f"DROP TABLE {partition.name}"))
+        await db.commit()
+        retired.append(partition.name)
+    if retired:
+        response_cache.bump_all()
+    return retired
+
+
+async def maintain_partitions(db: AsyncSession, now: Optional[datetime] = None) -> Dict[str, List[str]]:
+    """Create upcoming partitions, then apply the retention policy."""
+    return {
+        "created": await ensure_partitions(db, now),
+        "retired": await apply_retention(db, now),
+    }
+
+
+async def run_partition_maintenance(interval: int = PARTITION_MAINTENANCE_INTERVAL_S) -> None:
+    """Background task: run maintain_partitions every `interval` seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await maintain_partitions(db)
+            if result["created"] or result["retired"]:
+                logger.info("Partition maintenance: %s", result)
+        except Exception:
+            logger.exception("Partition maintenance failed")
+
+
+async def _lock(db: AsyncSession) -> None:
+    await db.execute(select(func.pg_advisory_xact_lock(_MAINTENANCE_LOCK)))
+
+
+def _literal(ts: datetime) -> str:
+    # DDL partition bounds cannot be bind parameters
+    return f"'{ts:%Y-%m-%d %H:%M:%S}'"
@@ -0,0 +1,241 @@
+"""Ingest admission: per-device and per-API-key token buckets, load shedding under DB pool pressure"""
+
+from collections import OrderedDict
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from time import monotonic
+from typing import Any, Dict, NamedTuple, Optional
+import hashlib
+import math
+import os
+
+from app.db.database import DB_MAX_OVERFLOW, DB_POOL_SIZE, async_engine
+from app.services.metrics import THROTTLE_REASONS, throttle_counts
+
+# "false" admits every ingest request
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Sustained POST /readings requests per second per device (0 disables the device limit)
+RATE_LIMIT_DEVICE_RATE = float(os.getenv("RATE_LIMIT_DEVICE_RATE", "1"))
+# Requests a device may send back to back before its rate applies
+RATE_LIMIT_DEVICE_BURST = int(os.getenv("RATE_LIMIT_DEVICE_BURST", "20"))
+# Sustained ingest requests (single and batch) per second per API key (0 disables the key limit)
+RATE_LIMIT_KEY_RATE = float(os.getenv("RATE_LIMIT_KEY_RATE", "0"))
+RATE_LIMIT_KEY_BURST = int(os.getenv("RATE_LIMIT_KEY_BURST", "1000"))
+# "memory": buckets per API worker; "postgres": buckets shared by all workers, one more query per request
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+# Buckets the memory backend keeps before dropping the least recently used
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000"))
+# Refuse ingest with 429 while this fraction of the worker's DB pool is checked out (0 disables)
+INGEST_SHED_POOL_UTILIZATION = float(os.getenv("INGEST_SHED_POOL_UTILIZATION", "1.0"))
+# Retry-After (seconds) sent with requests refused under pool pressure
+INGEST_SHED_RETRY_AFTER_S = int(os.getenv("INGEST_SHED_RETRY_AFTER_S", "1"))
+
+# Absorbs float rounding of repeated 1 / rate steps, so a full burst is always admitted
+_SLACK_S = 1e-6
+# Seconds between deletions of full buckets from the shared table
+_SWEEP_INTERVAL_S = 60.0
+# Length of rate_limit_buckets.key; longer device keys are hashed to fit
+_MAX_KEY_LENGTH = 255
+
+_REFUSALS = {
+    "device": "Rate limit exceeded for this device",
+    "api_key": "Rate limit exceeded for this API key",
+    "pool": "Server is overloaded",
+}
+
+
+class Limit(NamedTuple):
+    """A bucket refilled with `rate` tokens per second, holding up to `burst`; a request takes one token."""
+    rate: float
+    burst: int
+
+    @property
+    def interval(self) -> float:
+        return 1.0 / self.rate
+
+    @property
+    def tolerance(self) -> float:
+        # How far past now full_at may be with a token left
+        return (self.burst - 1) / self.rate + _SLACK_S
+
+
+class Throttled(Exception):
+    """An ingest request refused by a rate limit or to shed load; retry after `retry_after` seconds."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(_REFUSALS[reason])
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))  # Retry-After takes whole seconds
+
+
+class MemoryBuckets:
+    """
+    Token buckets of this worker, as key -> time the bucket is full again.
+    
+    That one float is the whole bucket: it holds burst - (full_at - now) *
+    rate tokens, so a request is admitted while full_at - now is within
+    (burst - 1) / rate, and taking a token moves full_at 1 / rate later.
+    Buckets move to the end when used, so the least recently used come
+    first; those already full are equivalent to no entry and are dropped
+    as they reach the front, as is the oldest beyond max_size.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._full_at: "OrderedDict[str, float]" = OrderedDict()
+        self.evicted = 0
+
+    async def take(self, key: str, limit: Limit) -> float:
+        """Take a token; returns 0 on success, else the seconds until one is available."""
+        now = monotonic()
+        buckets = self._full_at
+        full_at = max(buckets.get(key, now), now)
+        wait = full_at - now - limit.tolerance
+        buckets[key] = full_at if wait > 0 else full_at + limit.interval
+        buckets.move_to_end(key)
+        while buckets:
+            if next(iter(buckets.values())) > now and len(buckets) <= self.max_size:
+                break
+            buckets.popitem(last=False)
+            self.evicted += 1
+        return max(wait, 0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "buckets": len(self._full_at), "max_buckets": self.max_size, "evicted": self.evicted}
+
+
+# Same arithmetic as MemoryBuckets on the database clock. A refused
+# request leaves its row untouched and returns nothing.
+_TAKE = text(
+    "INSERT INTO rate_limit_buckets AS b (key, full_at) "
+    "VALUES (:key, now() AT TIME ZONE 'UTC' + make_interval(secs => :interval)) "
+    "ON CONFLICT (key) DO UPDATE "
+    "SET full_at = greatest(b.full_at, now() AT TIME ZONE 'UTC') + make_interval(secs => :interval) "
+    "WHERE b.full_at <= now() AT TIME ZONE 'UTC' + make_interval(secs => :tolerance) "
+    "RETURNING full_at"
+)
+_WAIT = text(
+    "SELECT extract(epoch FROM full_at - now() AT TIME ZONE 'UTC') - :tolerance "
+    "FROM rate_limit_buckets WHERE key = :key"
+)
+_SWEEP = text("DELETE FROM rate_limit_buckets WHERE full_at < now() AT TIME ZONE 'UTC'")
+
+
+class PostgresBuckets:
+    """
+    Token buckets in the rate_limit_buckets table, shared by every API worker.
+    
+    A token is taken with one INSERT ... ON CONFLICT DO UPDATE, so
+    concurrent workers serialize on the bucket's row. Full buckets are
+    deleted every _SWEEP_INTERVAL_S by whichever worker gets there.
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self._swept_at = monotonic()
+        self.swept = 0
+
+    async def take(self, key: str, limit: Limit) -> float:
+        """Take a token; returns 0 on success, else the seconds until one is available."""
+        async with self.engine.begin() as conn:
+            taken = await conn.execute(_TAKE, {"key": key, "interval": limit.interval, "tolerance": limit.tolerance})
+            wait = 0.0
+            if taken.first() is None:
+                wait = float((await conn.execute(_WAIT, {"key": key, "tolerance": limit.tolerance})).scalar_one())
+            if monotonic() - self._swept_at > _SWEEP_INTERVAL_S:
+                self._swept_at = monotonic()
+                self.swept += (await conn.execute(_SWEEP)).rowcount
+        return max(wait, 0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "postgres", "swept": self.swept}
+
+
+class IngestLimiter:
+    """
+    Admission check in front of the ingest endpoints.
+    
+    In order: shed load while the DB pool is at INGEST_SHED_POOL_UTILIZATION
+    (an admitted request would only queue for a connection, for up to
+    DB_POOL_TIMEOUT), then take a token from the API key's bucket and from
+    the device's. A request the device bucket refuses has still spent its
+    API key token. API keys are bucketed by hash, never stored.
+    """
+
+    def __init__(
+        self,
+        backend,  # MemoryBuckets, PostgresBuckets, or anything with their take() and stats()
+        device_limit: Optional[Limit],
+        key_limit: Optional[Limit],
+        shed_utilization: float,
+        pool,
+        pool_capacity: int,
+        enabled: bool = True
+    ):
+        self.backend = backend
+        self.device_limit = device_limit
+        self.key_limit = key_limit
+        self.shed_utilization = shed_utilization
+        self.pool = pool
+        self.pool_capacity = pool_capacity
+        self.enabled = enabled
+        self.admitted = 0
+        self.throttled = dict.fromkeys(THROTTLE_REASONS, 0)
+
+    async def admit(self, device_id: Optional[str], api_key: Optional[str], uses_pool: bool = True) -> None:
+        """
+        Raise Throttled unless the request may proceed.
+        
+        device_id is None for requests not limited per device (batches);
+        uses_pool=False skips shedding for requests that will not touch the
+        database (buffered ingest).
+        """
+        if not self.enabled:
+            return
+        if uses_pool and self.shed_utilization > 0 and (
+            self.pool.checkedout() >= self.shed_utilization * self.pool_capacity
+        ):
+            self._refuse("pool", INGEST_SHED_RETRY_AFTER_S)
+        if api_key is not None and self.key_limit is not None:
+            key = "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:32]
+            wait = await self.backend.take(key, self.key_limit)
+            if wait:
+                self._refuse("api_key", wait)
+        if device_id is not None and self.device_limit is not None:
+            key = "device:" + device_id
+            if len(key) > _MAX_KEY_LENGTH:
+                key = "device#" + hashlib.sha256(device_id.encode()).hexdigest()
+            wait = await self.backend.take(key, self.device_limit)
+            if wait:
+                self._refuse("device", wait)
+        self.admitted += 1
+
+    def _refuse(self, reason: str, retry_after: float) -> None:
+        self.throttled[reason] += 1
+        throttle_counts.add(reason)
+        raise Throttled(reason, retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "admitted": self.admitted,
+            "throttled": dict(self.throttled),
+            "pool_checked_out": self.pool.checkedout(),
+            "pool_capacity": self.pool_capacity,
+            **self.backend.stats(),
+        }
+
+
+def _limit(rate: float, burst: int) -> Optional[Limit]:
+    return Limit(rate, max(burst, 1)) if rate > 0 else None
+
+
+ingest_limiter = IngestLimiter(
+    PostgresBuckets(async_engine) if RATE_LIMIT_BACKEND == "postgres" else MemoryBuckets(RATE_LIMIT_MAX_BUCKETS),
+    _limit(RATE_LIMIT_DEVICE_RATE, RATE_LIMIT_DEVICE_BURST),
+    _limit(RATE_LIMIT_KEY_RATE, RATE_LIMIT_KEY_BURST),
+    INGEST_SHED_POOL_UTILIZATION,
+    async_engine.pool,
+    DB_POOL_SIZE + DB_MAX_OVERFLOW,
+    enabled=RATE_LIMIT_ENABLED
+)
@@ -0,0 +1,112 @@
+"""Per-device data versions and a short-lived cache of rendered responses"""
+
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+import os
+import time
+import uuid
+
+# "false" disables ETags, conditional GETs and the response cache
+HTTP_CACHE = os.getenv("HTTP_CACHE", "true").lower() == "true"
+# Rendered responses kept per worker; least recently used entries are evicted first
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+# Seconds a rendered response is reused while its data version is unchanged
+RESPONSE_CACHE_TTL_S = float(os.getenv("RESPONSE_CACHE_TTL_S", "5"))
+
+
+class DataVersion(NamedTuple):
+    tag: str  # changes whenever the data changes; never repeats for other data
+    modified_at: datetime  # naive UTC time of the last change seen by this worker
+
+
+class CachedResponse(NamedTuple):
+    tag: str
+    body: bytes
+    expires_at: float  # time.monotonic() deadline
+
+
+class ResponseCache:
+    """
+    Data versions for device endpoints plus rendered JSON bodies keyed by URL.
+    
+    Each device has a counter that is bumped after every committed change
+    to its readings or row (ingest, status transitions, PATCH, relayed
+    events from other workers); the fleet counter moves with any device.
+    Version tags carry a per-process epoch, so a tag is never reused after
+    a restart or by another worker for different data. A cached body is
+    served only while its version tag is still current, which makes the
+    bump the invalidation; the TTL bounds how long a body survives changes
+    this worker cannot see.
+    """
+
+    def __init__(self, enabled: bool, max_size: int, ttl: float):
+        self.enabled = enabled
+        self.max_size = max_size
+        self.ttl = ttl
+        self._epoch = uuid.uuid4().hex[:8]
+        self._generation = 0
+        self._fleet = 0
+        self._started_at = datetime.utcnow()  # stands in for devices this worker saw no change of
+        self._fleet_modified = self._started_at
+        self._devices: Dict[str, Tuple[int, datetime]] = {}
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def version(self, device_id: Optional[str] = None) -> DataVersion:
+        """Current version of one device's data, or of the whole fleet (None)."""
+        if device_id is None:
+            counter, modified_at = self._fleet, self._fleet_modified
+        else:
+            counter, modified_at = self._devices.get(device_id, (0, self._started_at))
+        return DataVersion(f"{self._epoch}.{self._generation}.{counter}", modified_at)
+
+    def bump(self, device_id: str) -> None:
+        """Record a committed change to a device's data."""
+        now = datetime.utcnow()
+        counter, _ = self._devices.get(device_id, (0, now))
+        self._devices[device_id] = (counter + 1, now)
+        self._fleet += 1
+        self._fleet_modified = now
+
+    def bump_all(self) -> None:
+        """Record a change that may affect any device (e.g. dropped partitions)."""
+        self._generation += 1
+        self._fleet_modified = self._started_at = datetime.utcnow()
+        self._devices.clear()
+        self._entries.clear()
+
+    def get(self, key: str, tag: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None or entry.tag != tag or entry.expires_at <= time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.body
+
+    def put(self, key: str, tag: str, body: bytes) -> None:
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        self._entries[key] = CachedResponse(tag, body, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "versioned_devices": len(self._devices),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+            "not_modified": self.not_modified,
+        }
+
+
+response_cache = ResponseCache(HTTP_CACHE, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL_S)
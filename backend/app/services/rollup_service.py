@@ -0,0 +1,273 @@
+"""Incrementally maintained reading rollups (1 minute / 1 hour / 1 day)"""
+
+from sqlalchemy import Float, Interval, cast, delete, func, literal, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import aggregate_order_by, array_agg, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple, Type
+
+from app.db.models import Reading, ReadingRollupMixin, ReadingRollup1m, ReadingRollup1h, ReadingRollup1d
+
+# Bucket alignment shared with date_bin queries
+ROLLUP_ORIGIN = datetime(2000, 1, 1)
+
+
+class RollupLevel(NamedTuple):
+    name: str
+    model: Type[ReadingRollupMixin]
+    width: timedelta
+
+
+# Finest first; each level is rebuilt from the one before it
+ROLLUP_LEVELS: List[RollupLevel] = [
+    RollupLevel("1m", ReadingRollup1m, timedelta(minutes=1)),
+    RollupLevel("1h", ReadingRollup1h, timedelta(hours=1)),
+    RollupLevel("1d", ReadingRollup1d, timedelta(days=1)),
+]
+
+# (device_id, ts, value, temperature_c) of a stored reading
+RollupInput = Tuple[str, datetime, float, Optional[float]]
+
+
+def bucket_floor(ts: datetime, width: timedelta) -> datetime:
+    """Start of the bucket of the given width containing ts."""
+    return ts - (ts - ROLLUP_ORIGIN) % width
+
+
+def coarsest_level(bucket: timedelta, start: datetime, end: datetime) -> Optional[RollupLevel]:
+    """
+    Coarsest rollup level that can answer an aggregate query exactly.
+    
+    The requested bucket must be a whole number of level buckets and the
+    window must start and end on level bucket boundaries.
+    """
+    for level in reversed(ROLLUP_LEVELS):
+        if (
+            bucket % level.width == timedelta(0)
+            and bucket_floor(start, level.width) == start
+            and bucket_floor(end, level.width) == end
+        ):
+            return level
+    return None
+
+
+async def update_rollups(db: AsyncSession, readings: Iterable[RollupInput]) -> None:
+    """
+    Fold newly stored readings into every rollup level.
+    
+    Readings are pre-aggregated per (device, bucket) and written as one
+    INSERT ... ON CONFLICT DO UPDATE per level, all sent as a single
+    statement. Must run in the transaction that inserted the readings.
+    """
+    readings = list(readings)
+    if not readings:
+        return
+    
+    params: Dict[str, List[Any]] = {}
+    for level in ROLLUP_LEVELS:
+        rows = _fold(readings, level.width)
+        for c in level.model.__table__.columns:
+            params[f"{c.key}_{level.name}"] = [row[c.key] for row in rows]
+    await db.execute(_UPSERT_ROLLUPS, params)
+
+
+def _fold(readings: List[RollupInput], width: timedelta) -> List[Dict[str, Any]]:
+    buckets: Dict[Tuple[str, datetime], Dict[str, Any]] = {}
+    for device_id, ts, value, temperature_c in readings:
+        # Match the NUMERIC(10,4) / NUMERIC(5,2) precision of stored readings
+        value = round(value, 4)
+        key = (device_id, bucket_floor(ts, width))
+        b = buckets.get(key)
+        if b is None:
+            b = buckets[key] = {
+                "device_id": device_id, "bucket_start": key[1], "count": 0,
+                "value_sum": 0.0, "value_sum_sq": 0.0, "value_min": value, "value_max": value,
+                "first_ts": ts, "first_value": value, "last_ts": ts, "last_value": value,
+                "temp_count": 0, "temp_sum": 0.0, "temp_min": None, "temp_max": None,
+            }
+        b["count"] += 1
+        b["value_sum"] += value
+        b["value_sum_sq"] += value * value
+        b["value_min"] = min(b["value_min"], value)
+        b["value_max"] = max(b["value_max"], value)
+        if ts < b["first_ts"]:
+            b["first_ts"], b["first_value"] = ts, value
+        if ts >= b["last_ts"]:
+            b["last_ts"], b["last_value"] = ts, value
+        if temperature_c is not None:
+            temperature_c = round(temperature_c, 2)
+            b["temp_count"] += 1
+            b["temp_sum"] += temperature_c
+            b["temp_min"] = temperature_c if b["temp_min"] is None else min(b["temp_min"], temperature_c)
+            b["temp_max"] = temperature_c if b["temp_max"] is None else max(b["temp_max"], temperature_c)
+    # Sorted so concurrent transactions lock bucket rows in the same order
+    return [buckets[key] for key in sorted(buckets)]
+
+
+# Merge of an incoming bucket (EXCLUDED) into a stored one (t)
+_MERGE = {
+    "count": "t.count + EXCLUDED.count",
+    "value_sum": "t.value_sum + EXCLUDED.value_sum",
+    "value_sum_sq": "t.value_sum_sq + EXCLUDED.value_sum_sq",
+    "value_min": "least(t.value_min, EXCLUDED.value_min)",
+    "value_max": "greatest(t.value_max, EXCLUDED.value_max)",
+    "first_ts": "least(t.first_ts, EXCLUDED.first_ts)",
+    "first_value": "CASE WHEN EXCLUDED.first_ts < t.first_ts THEN EXCLUDED.first_value ELSE t.first_value END",
+    "last_ts": "greatest(t.last_ts, EXCLUDED.last_ts)",
+    "last_value": "CASE WHEN EXCLUDED.last_ts >= t.last_ts THEN EXCLUDED.last_value ELSE t.last_value END",
+    "temp_count": "t.temp_count + EXCLUDED.temp_count",
+    "temp_sum": "t.temp_sum + EXCLUDED.temp_sum",
+    "temp_min": "least(t.temp_min, EXCLUDED.temp_min)",
+    "temp_max": "greatest(t.temp_max, EXCLUDED.temp_max)",
+}
+
+
+def _upsert_sql(level: RollupLevel) -> str:
+    table = level.model.__table__
+    columns = ", ".join(c.key for c in table.columns)
+    # One array parameter per column, so the SQL is the same for any number of buckets
+    arrays = ", ".join(
+        f"CAST(:{c.key}_{level.name} AS {c.type.compile(dialect=postgresql.dialect())}[])" for c in table.columns
+    )
+    merge = ", ".join(f"{key} = {expression}" for key, expression in _MERGE.items())
+    return (
+        f"INSERT INTO {table.name} AS t ({columns}) SELECT * FROM unnest({arrays}) "
+        f"ON CONFLICT (device_id, bucket_start) DO UPDATE SET {merge}"
+    )
+
+
+def _upsert_rollups_sql() -> str:
+    *finer, coarsest = ROLLUP_LEVELS
+    ctes = ", ".join(f"upsert_{level.name} AS ({_upsert_sql(level)})" for level in finer)
+    return f"WITH {ctes} {_upsert_sql(coarsest)}"
+
+
+# Textual so SQLAlchemy caches its compiled form; the ON CONFLICT clause of
+# the postgresql insert() construct opts out of the statement cache, which
+# cost a fresh compile of the whole statement on every reading
+_UPSERT_ROLLUPS = text(_upsert_rollups_sql())
+
+
+async def rebuild_rollups(
+    db: AsyncSession,
+    device_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> Dict[str, int]:
+    """
+    Regenerate rollups from raw readings.
+    
+    The range is widened to whole days so every level is rebuilt over
+    complete buckets. The 1m level is computed from readings, each coarser
+    level from the level below it. Nothing before the oldest stored reading
+    is touched, so rollups of partitions retired by retention survive.
+    Commits once; returns rows written per level.
+    """
+    oldest = await db.scalar(
+        select(func.min(Reading.ts)).where(*_window(Reading.device_id, Reading.ts, device_id, None, None))
+    )
+    if oldest is None:
+        return {level.name: 0 for level in ROLLUP_LEVELS}
+    if start is None or start < oldest:
+        start = oldest
+    
+    day = ROLLUP_LEVELS[-1].width
+    if start is not None:
+        start = bucket_floor(start, day)
+    if end is not None and bucket_floor(end, day) != end:
+        end = bucket_floor(end, day) + day
+    
+    written: Dict[str, int] = {}
+    source = None
+    for level in ROLLUP_LEVELS:
+        table = level.model.__table__
+        await db.execute(
+            delete(table).where(*_window(table.c.device_id, table.c.bucket_start, device_id, start, end))
+        )
+        
+        if source is None:
+            query = _rollup_from_readings(level.width).where(
+                *_window(Reading.device_id, Reading.ts, device_id, start, end)
+            )
+        else:
+            query = _rollup_from_level(source, level.width).where(
+                *_window(source.c.device_id, source.c.bucket_start, device_id, start, end)
+            )
+        result = await db.execute(
+            pg_insert(table).from_select([c.key for c in query.selected_columns], query)
+        )
+        written[level.name] = result.rowcount
+        source = table
+    
+    await db.commit()
+    return written
+
+
+def _window(device_column, ts_column, device_id: Optional[str], start: Optional[datetime], end: Optional[datetime]) -> list:
+    conditions = []
+    if device_id is not None:
+        conditions.append(device_column == device_id)
+    if start is not None:
+        conditions.append(ts_column >= start)
+    if end is not None:
+        conditions.append(ts_column < end)
+    return conditions
+
+
+def _rollup_from_readings(width: timedelta):
+    bucket = func.date_bin(literal(width, Interval()), Reading.ts, ROLLUP_ORIGIN)
+    value = cast(Reading.value, Float)
+    return (
+        select(
+            Reading.device_id,
+            bucket.label("bucket_start"),
+            func.count().label("count"),
+            func.sum(value).label("value_sum"),
+            func.sum(value * value).label("value_sum_sq"),
+            func.min(Reading.value).label("value_min"),
+            func.max(Reading.value).label("value_max"),
+            func.min(Reading.ts).label("first_ts"),
+            _first(Reading.value, Reading.ts).label("first_value"),
+            func.max(Reading.ts).label("last_ts"),
+            _last(Reading.value, Reading.ts).label("last_value"),
+            func.count(Reading.temperature_c).label("temp_count"),
+            func.coalesce(func.sum(cast(Reading.temperature_c, Float)), 0.0).label("temp_sum"),
+            func.min(Reading.temperature_c).label("temp_min"),
+            func.max(Reading.temperature_c).label("temp_max"),
+        )
+        .group_by(Reading.device_id, bucket)
+    )
+
+
+def _rollup_from_level(source, width: timedelta):
+    c = source.c
+    bucket = func.date_bin(literal(width, Interval()), c.bucket_start, ROLLUP_ORIGIN)
+    return (
+        select(
+            c.device_id,
+            bucket.label("bucket_start"),
+            func.sum(c.count).label("count"),
+            func.sum(c.value_sum).label("value_sum"),
+            func.sum(c.value_sum_sq).label("value_sum_sq"),
+            func.min(c.value_min).label("value_min"),
+            func.max(c.value_max).label("value_max"),
+            func.min(c.first_ts).label("first_ts"),
+            _first(c.first_value, c.first_ts).label("first_value"),
+            func.max(c.last_ts).label("last_ts"),
+            _last(c.last_value, c.last_ts).label("last_value"),
+            func.sum(c.temp_count).label("temp_count"),
+            func.sum(c.temp_sum).label("temp_sum"),
+            func.min(c.temp_min).label("temp_min"),
+            func.max(c.temp_max).label("temp_max"),
+        )
+        .group_by(c.device_id, bucket)
+    )
+
+
+def _first(value, ts):
+    return array_agg(aggregate_order_by(value, ts.asc()))[1]
+
+
+def _last(value, ts):
+    return array_agg(aggregate_order_by(value, ts.desc()))[1]
@@ -0,0 +1,98 @@
+"""Statistical process control statistics: Welford mean/variance, EWMA and two-sided CUSUM"""
+
+from typing import NamedTuple, Optional, Sequence
+
+import numpy as np
+
+
+class SpcSummary(NamedTuple):
+    """
+    Control statistics of a run of readings, starting from empty state.
+    
+    The EWMA starts at the first value and the CUSUMs at 0. A summary merges
+    into existing state (see app.services.spc_service) using only its own
+    fields plus the run's first value.
+    """
+    n: int
+    mean: float
+    m2: float  # sum of squared deviations from mean
+    ewma: float
+    cusum_pos: float
+    cusum_neg: float
+
+
+def fold(values: Sequence[float], target: Optional[float], lam: float, k: float) -> SpcSummary:
+    """
+    Summary of a few values, oldest first, one at a time (the ingest path).
+    
+    Args:
+        values: Readings in the order they are applied
+        target: Reference of the CUSUMs (None: both stay 0)
+        lam: EWMA weight of the newest value, 0 < lam <= 1
+        k: CUSUM allowance; deviations from target up to k do not accumulate
+    """
+    n = 0
+    mean = m2 = cusum_pos = cusum_neg = 0.0
+    ewma = values[0]
+    for value in values:
+        n += 1
+        delta = value - mean
+        mean += delta / n
+        m2 += delta * (value - mean)
+        ewma += lam * (value - ewma)
+        if target is not None:
+            cusum_pos = max(0.0, cusum_pos + value - target - k)
+            cusum_neg = max(0.0, cusum_neg + target - value - k)
+    return SpcSummary(n, mean, m2, ewma, cusum_pos, cusum_neg)
+
+
+def scan(v: np.ndarray, target: Optional[float], lam: float, k: float) -> SpcSummary:
+    """
+    Same summary as fold() over a whole series, with array operations only.
+    
+    The EWMA is a dot product with geometric weights (old weights underflow
+    to 0 harmlessly). A CUSUM floored at 0 is the cumulative sum of its
+    increments minus the running minimum of that sum, so its final value
+    needs one cumsum and one min.
+    """
+    n = len(v)
+    if n == 0:
+        raise ValueError("scan() needs at least one value")
+    mean = float(v.mean())
+    m2 = float(np.square(v - mean).sum())
+    
+    weights = np.power(1.0 - lam, np.arange(n - 1, -1, -1, dtype=np.float64))
+    weights[1:] *= lam  # the first value is the starting EWMA, not a weighted update
+    ewma = float(weights @ v)
+    
+    cusum_pos = cusum_neg = 0.0
+    if target is not None:
+        cusum_pos = _cusum(v - target - k)
+        cusum_neg = _cusum(target - v - k)
+    return SpcSummary(n, mean, m2, ewma, cusum_pos, cusum_neg)
+
+
+def drift_direction(
+    target: Optional[float],
+    ewma: float,
+    cusum_pos: float,
+    cusum_neg: float,
+    h: float,
+    ewma_limit: float
+) -> Optional[str]:
+    """
+    "high" / "low" when a CUSUM exceeds h or the EWMA is more than ewma_limit
+    from target; None while in control (or without a target).
+    """
+    if target is None:
+        return None
+    if cusum_pos > h or ewma - target > ewma_limit:
+        return "high"
+    if cusum_neg > h or target - ewma > ewma_limit:
+        return "low"
+    return None
+
+
+def _cusum(increments: np.ndarray) -> float:
+    totals = np.cumsum(increments)
+    return float(totals[-1] - min(0.0, totals.min()))
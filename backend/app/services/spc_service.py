@@ -0,0 +1,213 @@
+"""Per-device statistical process control: drift detection toward / away from target_ri"""
+
+from sqlalchemy import Float, cast, func, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import os
+
+from app.db.models import Device, DeviceSpc
+from app.services.alert_service import load_series
+from app.services.spc import SpcSummary, drift_direction, fold, scan
+
+# Maintain SPC state during ingest
+SPC_ENABLED = os.getenv("SPC_ENABLED", "true").lower() == "true"
+# EWMA weight of the newest reading (smaller: smoother, slower to react)
+SPC_EWMA_LAMBDA = float(os.getenv("SPC_EWMA_LAMBDA", "0.2"))
+# Drift is flagged once the EWMA is further than this from target_ri (RI)
+SPC_EWMA_LIMIT = float(os.getenv("SPC_EWMA_LIMIT", "0.001"))
+# CUSUM allowance: deviations from target_ri up to this do not accumulate (RI)
+SPC_CUSUM_K = float(os.getenv("SPC_CUSUM_K", "0.0002"))
+# Drift is flagged once a CUSUM exceeds this (RI)
+SPC_CUSUM_H = float(os.getenv("SPC_CUSUM_H", "0.002"))
+
+# (device_id, ts, value, target_ri) of a stored reading
+SpcInput = Tuple[str, datetime, float, Optional[float]]
+
+_STATE_COLUMNS = [c for c in DeviceSpc.__table__.columns if c.key != "updated_at"]
+
+
+async def update_spc(db: AsyncSession, readings: Iterable[SpcInput]) -> None:
+    """
+    Fold newly stored RI readings into each device's SPC state.
+    
+    Readings are summarized per device in Python (fold, in ts order) and
+    merged into device_spc by one INSERT ... ON CONFLICT DO UPDATE, so
+    concurrent workers never overwrite each other's state. Must run in the
+    transaction that inserted the readings.
+    """
+    runs: Dict[str, List[Tuple[datetime, float]]] = {}
+    targets: Dict[str, Optional[float]] = {}
+    for device_id, ts, value, target in readings:
+        # Match the NUMERIC(10,4) precision of stored readings
+        runs.setdefault(device_id, []).append((ts, round(value, 4)))
+        targets[device_id] = target
+    if not runs:
+        return
+    
+    rows = []
+    # Sorted so concurrent transactions lock state rows in the same order
+    for device_id in sorted(runs):
+        run = sorted(runs[device_id], key=lambda r: r[0])
+        summary = fold([value for _, value in run], targets[device_id], SPC_EWMA_LAMBDA, SPC_CUSUM_K)
+        rows.append(_state_row(device_id, targets[device_id], summary, run[0], run[-1]))
+    params: Dict[str, Any] = {c.key: [row[c.key] for row in rows] for c in _STATE_COLUMNS}
+    params.update(lam=SPC_EWMA_LAMBDA, k=SPC_CUSUM_K)
+    await db.execute(_UPSERT_SPC, params)
+
+
+def _state_row(
+    device_id: str,
+    target: Optional[float],
+    summary: SpcSummary,
+    first: Tuple[datetime, float],
+    last: Tuple[datetime, float]
+) -> Dict[str, Any]:
+    return {
+        "device_id": device_id,
+        "target_ri": target,
+        **summary._asdict(),
+        "first_ts": first[0],
+        "first_value": first[1],
+        "last_ts": last[0],
+        "last_value": last[1],
+    }
+
+
+# Merge of an incoming summary (EXCLUDED) into stored state (t). Welford
+# counts combine with Chan's formula; the EWMA decays the stored value over
+# the incoming readings and swaps it in for the run's starting value; a
+# CUSUM after m more readings is max(old + sum of increments, fresh CUSUM).
+# A changed target restarts the CUSUMs.
+_SAME_TARGET = "t.target_ri IS NOT DISTINCT FROM EXCLUDED.target_ri"
+_MERGE = {
+    "target_ri": "EXCLUDED.target_ri",
+    "n": "t.n + EXCLUDED.n",
+    "mean": "t.mean + (EXCLUDED.mean - t.mean) * EXCLUDED.n / (t.n + EXCLUDED.n)",
+    "m2": "t.m2 + EXCLUDED.m2 + (EXCLUDED.mean - t.mean) ^ 2 * t.n * EXCLUDED.n / (t.n + EXCLUDED.n)",
+    "ewma": "EXCLUDED.ewma + power(1 - CAST(:lam AS float8), EXCLUDED.n) * (t.ewma - EXCLUDED.first_value)",
+    "cusum_pos": (
+        f"CASE WHEN {_SAME_TARGET} THEN greatest("
+        "t.cusum_pos + EXCLUDED.n * (EXCLUDED.mean - EXCLUDED.target_ri - CAST(:k AS float8)), EXCLUDED.cusum_pos"
+        ") ELSE EXCLUDED.cusum_pos END"
+    ),
+    "cusum_neg": (
+        f"CASE WHEN {_SAME_TARGET} THEN greatest("
+        "t.cusum_neg + EXCLUDED.n * (EXCLUDED.target_ri - EXCLUDED.mean - CAST(:k AS float8)), EXCLUDED.cusum_neg"
+        ") ELSE EXCLUDED.cusum_neg END"
+    ),
+    "last_ts": "greatest(t.last_ts, EXCLUDED.last_ts)",
+    "last_value": "CASE WHEN EXCLUDED.last_ts >= t.last_ts THEN EXCLUDED.last_value ELSE t.last_value END",
+    "updated_at": "EXCLUDED.updated_at",
+}
+
+
+def _upsert_spc_sql() -> str:
+    columns = ", ".join(c.key for c in _STATE_COLUMNS)
+    arrays = ", ".join(
+        f"CAST(:{c.key} AS {c.type.compile(dialect=postgresql.dialect())}[])" for c in _STATE_COLUMNS
+    )
+    merge = ", ".join(f"{key} = {expression}" for key, expression in _MERGE.items())
+    return (
+        f"INSERT INTO device_spc AS t ({columns}, updated_at) "
+        f"SELECT *, now() AT TIME ZONE 'UTC' FROM unnest({arrays}) "
+        f"ON CONFLICT (device_id) DO UPDATE SET {merge}"
+    )
+
+
+# Textual for the same reason as the rollup upsert (statement cache)
+_UPSERT_SPC = text(_upsert_spc_sql())
+
+
+async def rebuild_spc(
+    db: AsyncSession,
+    device_id: Optional[str] = None,
+    start: Optional[datetime] = None
+) -> Dict[str, int]:
+    """
+    Recompute SPC state from stored readings, in timestamp order.
+    
+    Each device's RI readings from `start` on (default: all) are loaded
+    into NumPy arrays and summarized with scan(), then replace its state
+    row. The row is locked first, so readings ingested meanwhile are merged
+    in after the rebuilt state. Commits per device.
+    """
+    query = select(Device.device_id, Device.target_ri).order_by(Device.device_id)
+    if device_id is not None:
+        query = query.where(Device.device_id == device_id)
+    devices = (await db.execute(query)).all()
+    
+    totals = {"devices": 0, "readings": 0}
+    for device_id, target in devices:
+        target = float(target) if target is not None else None
+        await db.execute(select(DeviceSpc.device_id).where(DeviceSpc.device_id == device_id).with_for_update())
+        t, v = await load_series(db, device_id, start, None)
+        if len(v) == 0:
+            await db.rollback()
+            continue
+        summary = scan(v, target, SPC_EWMA_LAMBDA, SPC_CUSUM_K)
+        row = _state_row(
+            device_id, target, summary, (_datetime(t[0]), float(v[0])), (_datetime(t[-1]), float(v[-1]))
+        )
+        row["updated_at"] = func.timezone("UTC", func.now())
+        stmt = pg_insert(DeviceSpc).values(**row)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[DeviceSpc.device_id],
+            set_={key: stmt.excluded[key] for key in row if key != "device_id"}
+        ))
+        await db.commit()
+        totals["devices"] += 1
+        totals["readings"] += len(v)
+    return totals
+
+
+# Columns of the control statistics response, for a query outer-joining devices to device_spc
+SPC_COLUMNS = (
+    Device.device_id,
+    cast(Device.target_ri, Float).label("device_target_ri"),
+    DeviceSpc.target_ri,
+    DeviceSpc.n,
+    DeviceSpc.mean,
+    DeviceSpc.m2,
+    DeviceSpc.ewma,
+    DeviceSpc.cusum_pos,
+    DeviceSpc.cusum_neg,
+    DeviceSpc.first_ts,
+    DeviceSpc.last_ts,
+    DeviceSpc.last_value,
+)
+
+
+def drifting_condition():
+    """SQL counterpart of drift_direction(), for filtering."""
+    return (DeviceSpc.target_ri.isnot(None)) & (
+        (DeviceSpc.cusum_pos > SPC_CUSUM_H)
+        | (DeviceSpc.cusum_neg > SPC_CUSUM_H)
+        | (func.abs(DeviceSpc.ewma - DeviceSpc.target_ri) > SPC_EWMA_LIMIT)
+    )
+
+
+def spc_response(row: Any) -> Dict[str, Any]:
+    """Client-facing control statistics of one device (a row of SPC_COLUMNS)."""
+    if row.n is None:
+        return {"device_id": row.device_id, "target_ri": row.device_target_ri, "n": 0, "drift": None}
+    return {
+        "device_id": row.device_id,
+        "target_ri": row.target_ri,
+        "n": row.n,
+        "mean": row.mean,
+        "stddev": (max(row.m2, 0.0) / (row.n - 1)) ** 0.5 if row.n > 1 else None,
+        "ewma": row.ewma,
+        "cusum_pos": row.cusum_pos,
+        "cusum_neg": row.cusum_neg,
+        "drift": drift_direction(row.target_ri, row.ewma, row.cusum_pos, row.cusum_neg, SPC_CUSUM_H, SPC_EWMA_LIMIT),
+        "since": row.first_ts,
+        "last_ts": row.last_ts,
+        "last_value": row.last_value,
+    }
+
+
+def _datetime(microseconds: Any) -> datetime:
+    return datetime(1970, 1, 1) + timedelta(microseconds=int(microseconds))
@@ -0,0 +1,193 @@
+"""Deadline-driven device status tracking (OK / STALE / OFFLINE)"""
+
+from sqlalchemy import String, column, select, update, values
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import heapq
+import logging
+
+from app.db.database import AsyncSessionLocal
+from app.db.models import Device
+from app.services.device_service import OK_WINDOW, STALE_WINDOW, get_device_status
+from app.services.live_hub import live_hub
+from app.services.response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+# Longest sleep between checks when nothing is due (also bounds clock drift)
+_MAX_SLEEP_S = 60.0
+
+_RANK = {"OK": 0, "STALE": 1, "OFFLINE": 2}
+
+
+def next_deadline(status: str, last_seen_at: Optional[datetime]) -> Optional[datetime]:
+    """When a device in `status` changes status next unless a reading arrives (None: never)."""
+    if last_seen_at is None or status == "OFFLINE":
+        return None
+    return last_seen_at + (OK_WINDOW if status == "OK" else STALE_WINDOW)
+
+
+class StatusTracker:
+    """
+    Keeps devices.status current without scanning devices.
+    
+    Every device sits in a min-heap keyed by its next status deadline
+    (last_seen_at + 15 min while OK, + 24 h while STALE). The background
+    task sleeps until the earliest deadline, re-evaluates only the devices
+    that are due, writes the ones whose status changed and publishes the
+    transitions, so the cost is proportional to transitions, not devices.
+    
+    Ingest reports readings with observe(); a device coming back to OK is
+    evaluated right away, other readings only move the deadline forward
+    (picked up when the old deadline fires). Status is always recomputed
+    from devices.last_seen_at under a row lock, so several API workers can
+    track the same devices without disagreeing. Deferred last_seen_at writes
+    (device_cache) lag by about a minute, well inside the 15 minute window.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, str]] = []
+        self._deadline: Dict[str, datetime] = {}  # the live heap entry of each device
+        self._status: Dict[str, str] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.evaluations = 0
+        self.transitions = 0
+
+    async def start(self) -> None:
+        """Load every device once, persist statuses that went out of date, start the task."""
+        self._wake = asyncio.Event()
+        async with AsyncSessionLocal() as db:
+            rows = await db.execute(select(Device.device_id, Device.last_seen_at, Device.status))
+            now = datetime.utcnow()
+            for device_id, last_seen_at, status in rows:
+                self._status[device_id] = status
+                if get_device_status(last_seen_at, now) != status:
+                    self._schedule(device_id, now)
+                else:
+                    self._schedule(device_id, next_deadline(status, last_seen_at))
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def observe(self, device_id: str, ts: datetime) -> None:
+        """Note a committed reading. Never blocks."""
+        status = self._status.get(device_id)
+        if status is None or _RANK[get_device_status(ts)] < _RANK[status]:
+            # New device, or one coming back (e.g. OFFLINE -> OK): evaluate now
+            self._schedule(device_id, datetime.utcnow())
+        elif device_id not in self._deadline:
+            self._schedule(device_id, next_deadline(status, ts))
+
+    def _schedule(self, device_id: str, deadline: Optional[datetime]) -> None:
+        if deadline is None:
+            self._deadline.pop(device_id, None)
+            return
+        current = self._deadline.get(device_id)
+        if current is not None and current <= deadline:
+            return
+        # An earlier deadline supersedes the old heap entry, which is skipped when popped
+        self._deadline[device_id] = deadline
+        heapq.heappush(self._heap, (deadline, device_id))
+        if self._wake is not None and self._heap[0][1] == device_id:
+            self._wake.set()
+
+    def _pop_due(self, now: datetime) -> List[str]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, device_id = heapq.heappop(self._heap)
+            if self._deadline.get(device_id) == deadline:
+                del self._deadline[device_id]
+                due.append(device_id)
+        return due
+
+    async def _run(self) -> None:
+        while True:
+            now = datetime.utcnow()
+            due = self._pop_due(now)
+            if due:
+                try:
+                    await self.evaluate(due, now)
+                except Exception:
+                    logger.exception("Status evaluation of %d device(s) failed; retrying", len(due))
+                    for device_id in due:
+                        self._schedule(device_id, now + OK_WINDOW / 15)
+                continue
+            
+            timeout = _MAX_SLEEP_S
+            if self._heap:
+                timeout = min(timeout, max((self._heap[0][0] - now).total_seconds(), 0.0))
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def evaluate(self, device_ids: List[str], now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Recompute status of the given devices from the database; returns the transitions.
+        
+        Rows are locked in device_id order, so concurrent evaluations by other
+        workers wait and then see the status already written.
+        """
+        now = now or datetime.utcnow()
+        transitions = []
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(Device.device_id, Device.last_seen_at, Device.status)
+                .where(Device.device_id.in_(sorted(device_ids)))
+                .order_by(Device.device_id)
+                .with_for_update()
+            )).all()
+            for device_id, last_seen_at, status in rows:
+                current = get_device_status(last_seen_at, now)
+                if current != status:
+                    transitions.append({
+                        "type": "status",
+                        "device_id": device_id,
+                        "status": current,
+                        "previous": status,
+                        "last_seen_at": last_seen_at.isoformat() if last_seen_at else None,
+                        "changed_at": now.isoformat(),
+                    })
+                self._status[device_id] = current
+                self._schedule(device_id, next_deadline(current, last_seen_at))
+            
+            if transitions:
+                source = values(column("device_id", String), column("status", String), name="changed").data(
+                    [(t["device_id"], t["status"]) for t in transitions]
+                )
+                await db.execute(
+                    update(Device)
+                    .where(Device.device_id == source.c.device_id)
+                    .values(status=source.c.status, status_changed_at=now)
+                )
+            await db.commit()
+        
+        self.evaluations += len(rows)
+        self.transitions += len(transitions)
+        for transition in transitions:
+            response_cache.bump(transition["device_id"])
+            live_hub.publish(transition)
+        return transitions
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tracked_devices": len(self._status),
+            "scheduled": len(self._deadline),
+            "next_deadline": self._heap[0][0].isoformat() if self._heap else None,
+            "evaluations": self.evaluations,
+            "transitions": self.transitions,
+        }
+
+
+status_tracker = StatusTracker()
@@ -0,0 +1,181 @@
+"""Compressed and binary request bodies for ingest: Content-Encoding gzip/zstd, MessagePack and CBOR"""
+
+from fastapi import HTTPException, Request, status
+from fastapi.routing import APIRoute
+from email.message import Message
+from typing import Any, Callable, Dict
+import io
+import json
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd request bodies are optional
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:  # MessagePack bodies are optional
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # CBOR bodies are optional
+    cbor2 = None
+
+# Largest request body accepted after decompression (guards against compression bombs)
+MAX_DECODED_BODY_BYTES = int(os.getenv("MAX_DECODED_BODY_BYTES", str(16 * 1024 * 1024)))
+
+# Decompression contexts are reusable; one per worker is enough for the event loop thread
+_zstd_decompressor = zstandard.ZstdDecompressor() if zstandard is not None else None
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+CBOR_MEDIA_TYPES = ("application/cbor",)
+
+
+def supported_encodings() -> Dict[str, bool]:
+    """Content codings and binary media types, and whether this server can decode them."""
+    return {
+        "gzip": True,
+        "zstd": zstandard is not None,
+        "msgpack": msgpack is not None,
+        "cbor": cbor2 is not None,
+    }
+
+
+def decompress(body: bytes, content_encoding: str) -> bytes:
+    """Undo a Content-Encoding header (codings are listed in the order they were applied)."""
+    codings = [c.strip().lower() for c in content_encoding.split(",") if c.strip()]
+    for coding in reversed(codings):
+        if coding in ("gzip", "x-gzip"):
+            body = _gunzip(body)
+        elif coding == "zstd" and zstandard is not None:
+            body = _unzstd(body)
+        elif coding != "identity":
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail=f"Unsupported Content-Encoding: {coding}"
+            )
+    return body
+
+
+def parse_body(body: bytes, media_type: str) -> Any:
+    """Decode a (decompressed) body into the plain objects a JSON body would give."""
+    if media_type in MSGPACK_MEDIA_TYPES:
+        if msgpack is None:
+            raise _unsupported_media_type(media_type)
+        # timestamp=3: the MessagePack timestamp extension decodes to an aware datetime
+        return msgpack.unpackb(body, raw=False, timestamp=3)
+    if media_type in CBOR_MEDIA_TYPES:
+        if cbor2 is None:
+            raise _unsupported_media_type(media_type)
+        # Tagged datetimes (0/1) and UUIDs (37) decode to datetime / UUID
+        return cbor2.loads(body)
+    return json.loads(body)
+
+
+def media_type_of(content_type: str) -> str:
+    message = Message()
+    message["content-type"] = content_type
+    return message.get_content_type()
+
+
+class DecodedRequest(Request):
+    """
+    A request whose body() is decompressed and whose json() also understands MessagePack and CBOR.
+    
+    FastAPI only hands JSON content types to json(), so binary bodies are
+    presented to it as application/json while parsing still follows the
+    media type the client sent.
+    """
+
+    def __init__(self, scope, receive):
+        headers = dict(scope["headers"])
+        self.media_type = media_type_of(headers.get(b"content-type", b"application/json").decode("latin-1"))
+        self.content_encoding = headers.get(b"content-encoding", b"").decode("latin-1")
+        if self.media_type in MSGPACK_MEDIA_TYPES + CBOR_MEDIA_TYPES:
+            scope = dict(scope)
+            scope["headers"] = [
+                (name, b"application/json" if name == b"content-type" else value)
+                for name, value in scope["headers"]
+            ]
+        super().__init__(scope, receive)
+
+    async def body(self) -> bytes:
+        if not hasattr(self, "_decoded_body"):
+            body = await super().body()
+            self._decoded_body = decompress(body, self.content_encoding) if self.content_encoding else body
+        return self._decoded_body
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            body = await self.body()
+            try:
+                self._json = parse_body(body, self.media_type)
+            except (HTTPException, json.JSONDecodeError):
+                raise
+            except Exception as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Malformed {self.media_type} body: {e or type(e).__name__}"
+                )
+        return self._json
+
+
+class DecodingRoute(APIRoute):
+    """Route class for ingest routers: accepts compressed and binary bodies alongside plain JSON."""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def decoding_handler(request: Request):
+            return await handler(DecodedRequest(request.scope, request.receive))
+        
+        return decoding_handler
+
+
+def _gunzip(body: bytes) -> bytes:
+    decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(body, MAX_DECODED_BODY_BYTES + 1)
+    except zlib.error as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Malformed gzip body: {e}")
+    _check_size(data)
+    if not decompressor.eof:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Malformed gzip body: truncated")
+    return data
+
+
+def _unzstd(body: bytes) -> bytes:
+    # Read in chunks: a single read(MAX_DECODED_BODY_BYTES) would allocate that much up front
+    chunks = []
+    size = 0
+    try:
+        with _zstd_decompressor.stream_reader(io.BytesIO(body)) as reader:
+            while size <= MAX_DECODED_BODY_BYTES:
+                chunk = reader.read(64 * 1024)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+    except zstandard.ZstdError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Malformed zstd body: {e}")
+    data = b"".join(chunks)
+    _check_size(data)
+    return data
+
+
+def _check_size(data: bytes) -> None:
+    if len(data) > MAX_DECODED_BODY_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Decompressed body exceeds {MAX_DECODED_BODY_BYTES} bytes"
+        )
+
+
+def _unsupported_media_type(media_type: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        detail=f"{media_type} bodies are not enabled on this server"
+    )
@@ -0,0 +1,88 @@
+"""Conditional GET (ETag / Last-Modified) and response caching for JSON endpoints"""
+
+from fastapi import Request, Response
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, NamedTuple, Optional
+from urllib.parse import urlencode
+import hashlib
+
+from app.db.database import read_replica
+from app.services.response_cache import response_cache
+
+
+class Conditional(NamedTuple):
+    key: str  # path and sorted query: one cache entry per distinct request
+    tag: str
+    headers: Dict[str, str]
+    ready: Optional[Response]  # 304 or cached 200 when the request needs no query
+
+
+def conditional_get(
+    request: Request,
+    device_id: Optional[str] = None,
+    db: Optional[AsyncSession] = None
+) -> Optional[Conditional]:
+    """
+    Validators for the current data version of a device (None: the fleet).
+    
+    Needs no database access: when If-None-Match / If-Modified-Since match,
+    or a body for this version is cached, `ready` holds the response to
+    return as is. Returns None when HTTP caching is disabled, and when the
+    response would be read on a replica (`db`) that may not have the
+    latest change yet: a body tagged with a version it does not contain
+    would be revalidated as current until the next change.
+    """
+    if not response_cache.enabled:
+        return None
+    
+    version = response_cache.version(device_id)
+    key = f"{request.url.path}?{urlencode(sorted(request.query_params.multi_items()))}"
+    digest = hashlib.blake2b(key.encode(), digest_size=6).hexdigest()
+    etag = f'"{version.tag}.{digest}"'
+    last_modified = version.modified_at.replace(microsecond=0, tzinfo=timezone.utc)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+    
+    if _not_modified(request, etag, last_modified):
+        response_cache.not_modified += 1
+        return Conditional(key, etag, headers, Response(status_code=304, headers=headers))
+    body = response_cache.get(key, etag)
+    if body is not None:
+        return Conditional(key, etag, headers, Response(body, media_type="application/json", headers=headers))
+    if db is not None and read_replica.may_miss(db, version.modified_at):
+        return None
+    return Conditional(key, etag, headers, None)
+
+
+def cached_json(conditional: Optional[Conditional], content: Dict[str, Any]) -> Response:
+    """Render `content` with orjson and the validators, and keep the body for later requests."""
+    if conditional is None:
+        return ORJSONResponse(content)
+    response = ORJSONResponse(content, headers=conditional.headers)
+    response_cache.put(conditional.key, conditional.tag, response.body)
+    return response
+
+
+def _not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison, as RFC 9110 prescribes for If-None-Match
+        candidates = {c.strip().removeprefix("W/") for c in if_none_match.split(",")}
+        return etag in candidates or "*" in candidates
+    
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified <= since
+    return False
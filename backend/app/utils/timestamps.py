@@ -0,0 +1,36 @@
+"""Timestamp normalization utilities"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import re
+
+
+def to_utc_naive(ts: Optional[datetime]) -> Optional[datetime]:
+    """
+    Convert a datetime to naive UTC.
+    
+    Timestamps are stored in TIMESTAMP (without time zone) columns as UTC.
+    Offset-aware values are converted to UTC and stripped; naive values are
+    assumed to already be UTC.
+    """
+    if ts is None or ts.tzinfo is None:
+        return ts
+    return ts.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+_INTERVAL_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+
+
+def parse_interval(spec: str) -> Optional[timedelta]:
+    """
+    Parse a compact interval such as "30s", "5m", "1h" or "7d".
+    
+    Returns None if the spec is malformed or not positive.
+    """
+    match = re.fullmatch(r"(\d+)([smhd])", spec.strip())
+    if not match:
+        return None
+    amount = int(match.group(1))
+    if amount <= 0:
+        return None
+    return timedelta(**{_INTERVAL_UNITS[match.group(2)]: amount})
@@ -0,0 +1,119 @@
+"""
+Bytes on the wire and server CPU per reading for each ingest body encoding.
+
+Encodes the same readings as JSON, MessagePack and CBOR, each plain,
+gzip- and zstd-compressed, both as single-reading bodies (POST /readings)
+and as batches (POST /readings:batch). Server CPU is the work the ingest
+routes do before touching the database: decompress, parse (the same
+functions the DecodingRoute uses) and validate into ReadingPayload.
+Encodings whose optional package is not installed are skipped.
+
+Usage (from backend/):
+    python -m benchmarks.bench_ingest_encoding [--readings 1000] [--batch-size 100] [--repeat 20]
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import gzip
+import json
+import statistics
+import time
+import uuid
+
+from app.api.readings import ReadingPayload
+from app.utils.body_decoding import cbor2, decompress, msgpack, parse_body, zstandard
+
+MEDIA_TYPES = {"json": "application/json", "msgpack": "application/msgpack", "cbor": "application/cbor"}
+
+
+def make_readings(n: int) -> List[Dict[str, Any]]:
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "device_id": "BENCH-0001",
+            "ts": start + timedelta(seconds=15 * i),
+            "value": round(1.33 + (i % 100) / 10000, 4),
+            "unit": "RI",
+            "temperature_c": round(20.0 + (i % 50) / 10, 1),
+            "event_id": uuid.uuid4(),
+        }
+        for i in range(n)
+    ]
+
+
+def serializers() -> Dict[str, Callable[[Any], bytes]]:
+    """Client-side encoders, as the device simulator writes them."""
+    def to_json(body):
+        return json.dumps(body, default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v)).encode()
+
+    def to_msgpack(body):
+        def compact(r):
+            return {**r, "event_id": r["event_id"].bytes}
+        return msgpack.packb([compact(r) for r in body] if isinstance(body, list) else compact(body), datetime=True)
+
+    def to_cbor(body):
+        return cbor2.dumps(body, datetime_as_timestamp=True)
+    
+    available = {"json": to_json}
+    if msgpack is not None:
+        available["msgpack"] = to_msgpack
+    if cbor2 is not None:
+        available["cbor"] = to_cbor
+    return available
+
+
+def compressors() -> Dict[str, Optional[Callable[[bytes], bytes]]]:
+    available = {"none": None, "gzip": gzip.compress}
+    if zstandard is not None:
+        available["zstd"] = zstandard.ZstdCompressor().compress
+    return available
+
+
+def server_cpu(bodies: List[bytes], media_type: str, coding: str, repeat: int) -> float:
+    """Median seconds to decode and validate all bodies."""
+    samples = []
+    for _ in range(repeat):
+        started = time.process_time()
+        for body in bodies:
+            data = decompress(body, coding) if coding != "none" else body
+            parsed = parse_body(data, media_type)
+            for item in parsed if isinstance(parsed, list) else (parsed,):
+                ReadingPayload.model_validate(item)
+        samples.append(time.process_time() - started)
+    return statistics.median(samples)
+
+
+def measure(readings, batch_size: int, repeat: int) -> List[Tuple[str, str, float, float, float, float]]:
+    batches = [readings[i:i + batch_size] for i in range(0, len(readings), batch_size)]
+    results = []
+    for encoding, serialize in serializers().items():
+        for coding, compress in compressors().items():
+            row = []
+            for units in (readings, batches):
+                bodies = [serialize(unit) for unit in units]
+                if compress is not None:
+                    bodies = [compress(body) for body in bodies]
+                row.append(sum(len(b) for b in bodies) / len(readings))
+                row.append(server_cpu(bodies, MEDIA_TYPES[encoding], coding, repeat) / len(readings) * 1e6)
+            results.append((encoding, coding, *row))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ingest body encoding benchmark")
+    parser.add_argument("--readings", type=int, default=1000, help="Readings encoded per run (default: 1000)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Readings per batch body (default: 100)")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed iterations per encoding (default: 20)")
+    args = parser.parse_args()
+    
+    readings = make_readings(args.readings)
+    print(f"{args.readings} readings; per reading: bytes on the wire and server CPU in µs (median of {args.repeat})")
+    print(f"{'':<20}{'single request':>22}{f'batch of {args.batch_size}':>22}")
+    print(f"{'encoding':<10}{'coding':<10}{'bytes':>11}{'µs':>11}{'bytes':>11}{'µs':>11}")
+    for encoding, coding, single_bytes, single_us, batch_bytes, batch_us in measure(readings, args.batch_size, args.repeat):
+        print(f"{encoding:<10}{coding:<10}{single_bytes:>11.1f}{single_us:>11.1f}{batch_bytes:>11.1f}{batch_us:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Serialization cost of GET /devices/{device_id}/readings per page of readings.
+
+Compares the previous response path (ORM Reading objects, Decimal -> float
+and isoformat() per row, dict returned to FastAPI, which runs
+jsonable_encoder and json.dumps) with the column-tuple + orjson path, in
+both the row and the columnar layout. No database is needed: rows are
+built in memory, so only the Python-side cost after the query is measured.
+
+Usage (from backend/):
+    python -m benchmarks.bench_serialization [--rows 1000] [--repeat 200]
+"""
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Callable, List, Tuple
+import argparse
+import statistics
+import time
+
+from app.db.models import Reading
+
+FIELDS = ("id", "ts", "value", "unit", "temperature_c")
+
+
+def make_rows(n: int) -> List[Tuple]:
+    start = datetime(2026, 1, 1)
+    return [
+        (i, start + timedelta(seconds=15 * i), 1.33 + (i % 100) / 10000, "RI", 20.0 + (i % 50) / 10)
+        for i in range(n)
+    ]
+
+
+def orm_path(rows: List[Tuple]) -> bytes:
+    # What scalars(select(Reading)) hands back: mapped instances with Decimal numerics
+    readings = [
+        Reading(id=i, ts=ts, value=Decimal(f"{v:.4f}"), unit=u, temperature_c=Decimal(f"{t:.2f}"))
+        for i, ts, v, u, t in rows
+    ]
+    content = {
+        "device_id": "BENCH",
+        "readings": [
+            {
+                "id": r.id,
+                "ts": r.ts.isoformat(),
+                "value": float(r.value),
+                "unit": r.unit,
+                "temperature_c": float(r.temperature_c) if r.temperature_c else None
+            }
+            for r in readings
+        ],
+        "next_cursor": None
+    }
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def tuple_rows_path(rows: List[Tuple]) -> bytes:
+    return ORJSONResponse({
+        "device_id": "BENCH",
+        "readings": [dict(zip(FIELDS, row)) for row in rows],
+        "next_cursor": None
+    }).body
+
+
+def tuple_columns_path(rows: List[Tuple]) -> bytes:
+    return ORJSONResponse({
+        "device_id": "BENCH",
+        "readings": {field: list(values) for field, values in zip(FIELDS, zip(*rows))},
+        "next_cursor": None
+    }).body
+
+
+def measure(fn: Callable[[List[Tuple]], bytes], rows: List[Tuple], repeat: int) -> Tuple[float, int]:
+    """Median milliseconds per call, and the body size."""
+    size = len(fn(rows))  # warm-up
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(rows)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reading history serialization benchmark")
+    parser.add_argument("--rows", type=int, default=1000, help="Readings per response (default: 1000)")
+    parser.add_argument("--repeat", type=int, default=200, help="Timed iterations per path (default: 200)")
+    args = parser.parse_args()
+    
+    rows = make_rows(args.rows)
+    baseline = None
+    print(f"{args.rows} readings per response, median of {args.repeat} runs")
+    print(f"{'path':<28}{'ms':>10}{'bytes':>10}{'speedup':>10}")
+    for name, fn in (
+        ("orm + jsonable_encoder", orm_path),
+        ("tuples + orjson (rows)", tuple_rows_path),
+        ("tuples + orjson (columns)", tuple_columns_path),
+    ):
+        ms, size = measure(fn, rows, args.repeat)
+        baseline = baseline or ms
+        print(f"{name:<28}{ms:>10.3f}{size:>10}{baseline / ms:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
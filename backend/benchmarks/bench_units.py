@@ -0,0 +1,68 @@
+"""
+Cost of RI / Brix conversion and temperature compensation at query time.
+
+Converts a synthetic series (a slow random walk in RI with a few Brix
+readings mixed in, temperatures around 20 °C, some missing) with
+app.services.units: the array path alone (convert) and from fetched
+result columns, including building the arrays and the lists handed back
+to the response (convert_columns). No database is needed.
+
+Usage (from backend/):
+    python -m benchmarks.bench_units [--rows 100000] [--repeat 20]
+"""
+
+from typing import Callable
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from app.services.units import convert, convert_columns
+
+
+def median_ms(run: Callable[[], object], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Unit conversion benchmark")
+    parser.add_argument("--rows", type=int, default=100_000, help="Readings converted per run (default: 100000)")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed iterations per case (default: 20)")
+    args = parser.parse_args()
+    
+    rng = np.random.default_rng(0)
+    n = args.rows
+    values = np.clip(1.36 + np.cumsum(rng.normal(0, 0.0002, n)), 1.333, 1.45)
+    units = np.full(n, "RI")
+    units[::50] = "Brix"
+    values[::50] = 10.0
+    temperatures = 20.0 + np.cumsum(rng.normal(0, 0.05, n))
+    temperatures[::10] = np.nan
+    
+    value_list = values.tolist()
+    unit_list = units.tolist()
+    temperature_list = [None if t != t else t for t in temperatures.tolist()]
+    
+    print(f"{n} readings, median of {args.repeat} (ms)")
+    print(f"{'case':<28}{'arrays':>10}{'columns':>10}")
+    for label, unit, compensate in (
+        ("to Brix", "Brix", False),
+        ("to RI", "RI", False),
+        ("compensate", None, True),
+        ("to Brix + compensate", "Brix", True),
+    ):
+        arrays = median_ms(lambda: convert(values, units, temperatures, unit, compensate), args.repeat)
+        columns = median_ms(
+            lambda: convert_columns(value_list, unit_list, temperature_list, unit, compensate), args.repeat
+        )
+        print(f"{label:<28}{arrays:>10.2f}{columns:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
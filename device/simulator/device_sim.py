@@ -17,6 +17,46 @@ from pathlib import Path
 from typing import Optional
 import uuid
 
+from segment_queue import SegmentQueue
+from wire_format import COMPRESSIONS, ENCODINGS, check_available, encode_body
+
+# Single-file queue written by earlier versions; imported into the queue directory on startup
+LEGACY_QUEUE_FILE = "queue.jsonl"
+
+# Longest Retry-After waited out before a reading is queued instead
+MAX_RETRY_AFTER_S = 60.0
+
+
+def retry_after(response) -> Optional[float]:
+    """Seconds a 429 (rate limited / shedding load) or 503 response asks to wait, if it says."""
+    if response.status_code not in (429, 503):
+        return None
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None  # absent, or an HTTP date, which the server never sends
+
+
+def generate_reading(device_id: str) -> dict:
+    """Generate a realistic refractometry reading."""
+    # Refractometers measure Refractive Index (RI) as the primary unit
+    # RI is a dimensionless number typically in the range 1.3300-1.3400 for liquids
+    # Brix is a derived/converted value, not a direct measurement
+    value = round(random.uniform(1.3300, 1.3400), 4)
+    unit = "RI"
+    
+    temperature = round(random.uniform(20.0, 30.0), 1)
+    event_id = str(uuid.uuid4())
+    
+    return {
+        "device_id": device_id,
+        "ts": datetime.now(timezone.utc).isoformat(),
+        "value": value,
+        "unit": unit,
+        "temperature_c": temperature,
+        "event_id": event_id
+    }
+
 
 class DeviceSimulator:
     def __init__(
@@ -27,7 +67,12 @@ class DeviceSimulator:
         jitter: float = 0.0,
         failure_rate: float = 0.0,
         api_key: Optional[str] = None,
-        queue_file: str = "queue.jsonl"
+        queue_dir: str = "queue",
+        batch_size: int = 100,
+        segment_bytes: int = 1 << 20,
+        encoding: str = "json",
+        compression: str = "none",
+        retries: int = 3
     ):
         self.device_id = device_id
         self.server_url = server_url.rstrip('/')
@@ -35,79 +80,87 @@ class DeviceSimulator:
         self.jitter = jitter
         self.failure_rate = failure_rate
         self.api_key = api_key
-        self.queue_file = Path(queue_file)
+        self.queue = SegmentQueue(queue_dir, segment_bytes=segment_bytes)
+        self.batch_size = batch_size
+        check_available(encoding, compression)
+        self.encoding = encoding
+        self.compression = compression
+        self.retries = retries
         self.session = requests.Session()
         
         if api_key:
             self.session.headers.update({"X-API-Key": api_key})
-        
-        self.session.headers.update({"Content-Type": "application/json"})
     
     def generate_reading(self) -> dict:
         """Generate a realistic refractometry reading."""
-        # Refractometers measure Refractive Index (RI) as the primary unit
-        # RI is a dimensionless number typically in the range 1.3300-1.3400 for liquids
-        # Brix is a derived/converted value, not a direct measurement
-        value = round(random.uniform(1.3300, 1.3400), 4)
-        unit = "RI"
-        
-        temperature = round(random.uniform(20.0, 30.0), 1)
-        event_id = str(uuid.uuid4())
-        
-        return {
-            "device_id": self.device_id,
-            "ts": datetime.now(timezone.utc).isoformat(),
-            "value": value,
-            "unit": unit,
-            "temperature_c": temperature,
-            "event_id": event_id
-        }
+        return generate_reading(self.device_id)
     
     def queue_reading(self, reading: dict) -> None:
-        """Append reading to queue file."""
-        with open(self.queue_file, 'a') as f:
-            f.write(json.dumps(reading) + '\n')
-        print(f"  [QUEUED] Reading queued to {self.queue_file}")
+        """Append reading to the on-disk queue."""
+        self.queue.append(reading)
+        print(f"  [QUEUED] Reading queued to {self.queue.directory} ({len(self.queue)} pending)")
+    
+    def import_legacy_queue(self, path: Path) -> int:
+        """Move readings from a single-file queue into the segment queue, line by line."""
+        imported = 0
+        with open(path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    self.queue.append(json.loads(line))
+                    imported += 1
+        path.unlink()
+        print(f"  [QUEUE] Imported {imported} reading(s) from {path}")
+        return imported
     
     def flush_queue(self) -> int:
-        """Flush queued readings to server."""
-        if not self.queue_file.exists():
-            return 0
-        
-        flushed = 0
-        failed = []
-        
-        with open(self.queue_file, 'r') as f:
-            lines = f.readlines()
+        """
+        Flush queued readings to server in batches, oldest first.
         
-        if not lines:
+        Batches are read from disk as they are sent, and the checkpoint
+        advances after each accepted batch, so memory use does not grow
+        with the backlog and an interrupted flush resumes where it stopped.
+        """
+        if not len(self.queue):
             return 0
         
-        print(f"  [FLUSH] Attempting to flush {len(lines)} queued reading(s)...")
+        print(f"  [FLUSH] Attempting to flush {len(self.queue)} queued reading(s)...")
         
-        for line in lines:
-            reading = json.loads(line.strip())
-            if self._send_reading(reading, queue_on_failure=False):
-                flushed += 1
-            else:
-                failed.append(line)
+        flushed = 0
+        for readings, position in self.queue.batches(self.batch_size):
+            # Stop at the first failure: later batches would fail too and must stay in order
+            if not self._send_batch(readings):
+                break
+            self.queue.commit(position)
+            flushed += len(readings)
         
-        # Rewrite queue with failed readings
-        if failed:
-            with open(self.queue_file, 'w') as f:
-                f.writelines(failed)
-            print(f"  [FLUSH] {flushed} sent, {len(failed)} remain in queue")
+        if len(self.queue):
+            print(f"  [FLUSH] {flushed} sent, {len(self.queue)} remain in queue")
         else:
-            self.queue_file.unlink()
             print(f"  [FLUSH] All {flushed} queued readings sent successfully")
         
         return flushed
     
+    def _post(self, path: str, body, timeout: float) -> requests.Response:
+        """
+        POST an encoded body, waiting out Retry-After up to `retries` times.
+        
+        A throttled (429) or overloaded (503) server says when to come back;
+        retrying then keeps the reading live instead of queueing it, and
+        never sooner keeps the device from adding to the load.
+        """
+        data, headers = encode_body(body, self.encoding, self.compression)
+        for attempt in range(self.retries + 1):
+            response = self.session.post(f"{self.server_url}{path}", data=data, headers=headers, timeout=timeout)
+            wait = retry_after(response)
+            if wait is None or wait > MAX_RETRY_AFTER_S or attempt == self.retries:
+                return response
+            print(f"  [RETRY] HTTP {response.status_code}, retrying in {wait:g}s")
+            time.sleep(wait)
+    
     def _send_reading(self, reading: dict, queue_on_failure: bool = True) -> bool:
         """Send a single reading to the server."""
         try:
-            url = f"{self.server_url}/api/v1/readings"
-            response = self.session.post(url, json=reading, timeout=5)
+            response = self._post("/api/v1/readings", reading, timeout=5)
             
             if response.status_code == 201:
                 print(f"  [SENT] {reading['value']} {reading['unit']} @ {reading['ts']}")
@@ -124,6 +177,28 @@ class DeviceSimulator:
                 self.queue_reading(reading)
             return False
     
+    def _send_batch(self, readings: list) -> bool:
+        """Send queued readings in one batch request."""
+        try:
+            response = self._post("/api/v1/readings:batch", readings, timeout=30)
+            
+            if response.status_code == 200:
+                body = response.json()
+                print(f"  [BATCH] {body['created']} created, {body['duplicate']} duplicate, "
+                      f"{body['rejected']} rejected")
+                # Rejected readings fail validation and would be rejected again on retry
+                for result in body["results"]:
+                    if result["status"] == "rejected":
+                        print(f"  [REJECTED] #{result['index']}: {result['reason']}")
+                return True
+            else:
+                print(f"  [ERROR] HTTP {response.status_code}: {response.text}")
+                return False
+        
+        except requests.exceptions.RequestException as e:
+            print(f"  [ERROR] Connection failed: {e}")
+            return False
+    
     def run(self):
         """Main simulation loop."""
         print(f"🚀 Device Simulator Starting")
@@ -132,10 +207,15 @@ class DeviceSimulator:
         print(f"   Interval: {self.interval_seconds}s")
         print(f"   Jitter: ±{self.jitter * 100:.0f}%")
         print(f"   Failure Rate: {self.failure_rate * 100:.1f}%")
+        print(f"   Encoding: {self.encoding}, compression: {self.compression}")
         print()
         
+        legacy_queue = Path(LEGACY_QUEUE_FILE)
+        if legacy_queue.exists():
+            self.import_legacy_queue(legacy_queue)
+        
         # Flush any existing queue on startup
-        if self.queue_file.exists():
+        if len(self.queue):
             self.flush_queue()
             print()
         
@@ -152,7 +232,9 @@ class DeviceSimulator:
                 
                 # Generate and send reading
                 reading = self.generate_reading()
-                self._send_reading(reading)
+                if self._send_reading(reading) and len(self.queue):
+                    # Server is reachable again: send what was queued while it was not
+                    self.flush_queue()
                 
                 # Calculate next interval with jitter
                 jitter_amount = random.uniform(-self.jitter, self.jitter)
@@ -164,10 +246,10 @@ class DeviceSimulator:
         except KeyboardInterrupt:
             print()
             print("🛑 Simulator stopped by user")
-            if self.queue_file.exists():
-                queue_size = len(self.queue_file.read_text().strip().split('\n'))
-                if queue_size > 0:
-                    print(f"   {queue_size} reading(s) remain in queue: {self.queue_file}")
+            if len(self.queue):
+                print(f"   {len(self.queue)} reading(s) remain in queue: {self.queue.directory}")
+        finally:
+            self.queue.close()
 
 
 def main():
@@ -178,22 +260,30 @@ def main():
 Examples:
   # Basic usage (15 second interval)
   python device_sim.py --device-id demo-001
-
+  
   # Demo mode (2 second interval for fast demo)
   python device_sim.py --device-id demo-001 --interval-seconds 2
-
+  
   # Production-like (15 minute interval)
   python device_sim.py --device-id prod-001 --interval-seconds 900
-
+  
   # With jitter and failure simulation
   python device_sim.py --device-id test-001 --interval-seconds 5 --jitter 0.1 --failure-rate 0.05
+  
+  # Compact encoding for metered links (needs msgpack and zstandard)
+  python device_sim.py --device-id demo-001 --encoding msgpack --compress zstd
+  
+  # Number of readings waiting in the store-and-forward queue
+  python device_sim.py --queue-status
+  
+  # Fleet mode: 5000 virtual devices, 500 readings/s in total, for one minute
+  python device_sim.py --devices 5000 --rate 500 --duration 60
         """
     )
     
     parser.add_argument(
         "--device-id",
-        required=True,
-        help="Device identifier"
+        help="Device identifier (fleet mode: device id prefix, default: sim)"
     )
     
     parser.add_argument(
@@ -229,13 +319,120 @@ Examples:
     )
     
     parser.add_argument(
-        "--queue-file",
-        default="queue.jsonl",
-        help="Queue file path (default: queue.jsonl)"
+        "--encoding",
+        choices=ENCODINGS,
+        default="json",
+        help="Request body encoding; msgpack and cbor are more compact (default: json)"
+    )
+    
+    parser.add_argument(
+        "--compress",
+        choices=COMPRESSIONS,
+        default="none",
+        help="Compress request bodies (Content-Encoding; default: none)"
+    )
+    
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="Times a request refused with 429/503 is retried after its Retry-After before queueing (default: 3)"
+    )
+    
+    parser.add_argument(
+        "--queue-dir",
+        default="queue",
+        help="Directory holding the store-and-forward queue (default: queue)"
+    )
+    
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=100,
+        help="Queued readings sent per batch request when flushing (default: 100)"
+    )
+    
+    parser.add_argument(
+        "--segment-bytes",
+        type=int,
+        default=1 << 20,
+        help="Size at which the queue starts a new segment file (default: 1048576)"
+    )
+    
+    parser.add_argument(
+        "--queue-status",
+        action="store_true",
+        help="Print the number of queued readings in --queue-dir and exit"
+    )
+    
+    fleet = parser.add_argument_group("fleet mode")
+    
+    fleet.add_argument(
+        "--devices",
+        type=int,
+        default=0,
+        help="Simulate this many devices in one process (fleet mode)"
+    )
+    
+    fleet.add_argument(
+        "--rate",
+        type=float,
+        help="Target readings per second across the fleet (overrides --interval-seconds)"
+    )
+    
+    fleet.add_argument(
+        "--duration",
+        type=float,
+        default=60,
+        help="Seconds to run before reporting (0: until Ctrl+C, default: 60)"
+    )
+    
+    fleet.add_argument(
+        "--max-connections",
+        type=int,
+        default=100,
+        help="Size of the shared HTTP connection pool (default: 100)"
+    )
+    
+    fleet.add_argument(
+        "--use-batch",
+        action="store_true",
+        help="Send readings from all devices through shared batch requests of up to --batch-size"
+    )
+    
+    fleet.add_argument(
+        "--batch-wait-ms",
+        type=int,
+        default=100,
+        help="With --use-batch, longest wait to fill a batch (default: 100)"
+    )
+    
+    fleet.add_argument(
+        "--max-queue",
+        type=int,
+        default=10000,
+        help="Queued readings kept in memory per virtual device (default: 10000)"
     )
     
     args = parser.parse_args()
     
+    if args.queue_status:
+        queue = SegmentQueue(args.queue_dir)
+        print(f"{len(queue)} reading(s) queued in {queue.directory}")
+        return
+    if args.devices > 0:
+        # Imported here so single-device mode only needs requests
+        from fleet_sim import run_fleet
+        run_fleet(args)
+        return
+    if not args.device_id:
+        parser.error("--device-id is required unless --devices is given")
+    
+    try:
+        check_available(args.encoding, args.compress)
+    except ImportError as e:
+        parser.error(str(e))
+    
     simulator = DeviceSimulator(
         device_id=args.device_id,
         server_url=args.server_url,
@@ -243,7 +440,12 @@ Examples:
         jitter=args.jitter,
         failure_rate=args.failure_rate,
         api_key=args.api_key,
-        queue_file=args.queue_file
+        queue_dir=args.queue_dir,
+        batch_size=args.batch_size,
+        segment_bytes=args.segment_bytes,
+        encoding=args.encoding,
+        compression=args.compress,
+        retries=args.retries
     )
     
     simulator.run()
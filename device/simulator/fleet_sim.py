@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Fleet mode: thousands of virtual devices in one asyncio event loop
+
+Every virtual device keeps the single-device semantics (interval with
+jitter, simulated failures, store-and-forward queue flushed through the
+batch endpoint after the next successful send), but all of them share one
+connection-pooled HTTP client. At the end the achieved request rate and
+latency percentiles are reported for capacity planning.
+
+Run through device_sim.py, e.g.:
+    python device_sim.py --devices 5000 --rate 500 --duration 60
+"""
+
+import asyncio
+import random
+import time
+from collections import Counter, deque
+from typing import Deque, List, Optional
+
+import httpx
+
+from device_sim import MAX_RETRY_AFTER_S, generate_reading, retry_after
+
+
+class FleetStats:
+    """Request outcomes and latencies across the fleet."""
+
+    def __init__(self):
+        self.statuses: Counter = Counter()
+        self.latencies_ms: List[float] = []
+        self.readings_sent = 0
+        self.readings_queued = 0
+        self.readings_skipped = 0
+        self.retries = 0  # requests repeated after a 429/503 Retry-After
+        self.max_lag_s = 0.0  # how far sends fell behind schedule (client or server saturated)
+        self.started = time.perf_counter()
+
+    def record(self, status: str, latency_ms: float) -> None:
+        self.statuses[status] += 1
+        self.latencies_ms.append(latency_ms)
+
+    @property
+    def requests(self) -> int:
+        return sum(self.statuses.values())
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies_ms:
+            return None
+        ordered = sorted(self.latencies_ms)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class VirtualDevice:
+    """One simulated device; its queue lives in memory."""
+
+    def __init__(self, fleet: "Fleet", device_id: str, interval: float):
+        self.fleet = fleet
+        self.device_id = device_id
+        self.interval = interval
+        self.queue: Deque[dict] = deque(maxlen=fleet.max_queue)
+
+    async def run(self, stop_at: float) -> None:
+        loop = asyncio.get_running_loop()
+        # Spread the first readings over one interval so the fleet does not start in lockstep
+        next_at = loop.time() + random.uniform(0, self.interval)
+        while True:
+            await asyncio.sleep(max(0.0, min(next_at, stop_at) - loop.time()))
+            now = loop.time()
+            if now >= stop_at:
+                return
+            self.fleet.stats.max_lag_s = max(self.fleet.stats.max_lag_s, now - next_at)
+            
+            if random.random() < self.fleet.failure_rate:
+                self.fleet.stats.readings_skipped += 1
+            else:
+                reading = generate_reading(self.device_id)
+                if await self.fleet.send(reading):
+                    if self.queue:
+                        await self.flush_queue()
+                else:
+                    self.queue.append(reading)
+                    self.fleet.stats.readings_queued += 1
+            
+            jitter_amount = random.uniform(-self.fleet.jitter, self.fleet.jitter)
+            next_at += self.interval * (1 + jitter_amount)
+
+    async def flush_queue(self) -> None:
+        """Send queued readings in batches; a failed batch stays queued."""
+        while self.queue:
+            chunk = [self.queue[i] for i in range(min(self.fleet.batch_size, len(self.queue)))]
+            if not await self.fleet.send_batch(chunk):
+                return
+            for _ in chunk:
+                self.queue.popleft()
+
+
+class Fleet:
+    def __init__(
+        self,
+        server_url: str,
+        devices: int,
+        interval_seconds: float,
+        device_prefix: str = "sim",
+        jitter: float = 0.0,
+        failure_rate: float = 0.0,
+        api_key: Optional[str] = None,
+        batch_size: int = 100,
+        max_queue: int = 10000,
+        max_connections: int = 100,
+        use_batch: bool = False,
+        batch_wait_ms: int = 100,
+        retries: int = 3
+    ):
+        self.server_url = server_url.rstrip('/')
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.max_connections = max_connections
+        self.use_batch = use_batch
+        self.batch_wait = batch_wait_ms / 1000
+        self.retries = retries
+        self.headers = {"X-API-Key": api_key} if api_key else {}
+        self.stats = FleetStats()
+        self.devices = [
+            VirtualDevice(self, f"{device_prefix}-{i:05d}", interval_seconds)
+            for i in range(devices)
+        ]
+        self.client: Optional[httpx.AsyncClient] = None
+        self._outbox: Optional[asyncio.Queue] = None
+
+    async def send(self, reading: dict) -> bool:
+        """Store one reading; through the shared batcher with --use-batch."""
+        if self._outbox is None:
+            ok = await self._post("/api/v1/readings", reading, (201, 202))
+            if ok:
+                self.stats.readings_sent += 1
+            return ok
+        done = asyncio.get_running_loop().create_future()
+        await self._outbox.put((reading, done))
+        return await done
+
+    async def send_batch(self, readings: List[dict]) -> bool:
+        ok = await self._post("/api/v1/readings:batch", readings, (200,))
+        if ok:
+            self.stats.readings_sent += len(readings)
+        return ok
+
+    async def _post(self, path: str, body, accepted) -> bool:
+        """POST body; a 429/503 with Retry-After is waited out and retried up to `retries` times."""
+        for attempt in range(self.retries + 1):
+            started = time.perf_counter()
+            wait = None
+            try:
+                response = await self.client.post(path, json=body)
+                status = str(response.status_code)
+                ok = response.status_code in accepted
+                wait = retry_after(response)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+                ok = False
+            self.stats.record(status, (time.perf_counter() - started) * 1000)
+            if wait is None or wait > MAX_RETRY_AFTER_S or attempt == self.retries:
+                return ok
+            self.stats.retries += 1
+            await asyncio.sleep(wait)
+
+    async def _run_batcher(self) -> None:
+        """Gateway-style sender: readings from all devices share batch requests."""
+        loop = asyncio.get_running_loop()
+        in_flight = set()
+        while True:
+            batch = [await self._outbox.get()]
+            deadline = loop.time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._outbox.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self._send_gathered(batch))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+    async def _send_gathered(self, batch) -> None:
+        ok = await self.send_batch([reading for reading, _ in batch])
+        for _, done in batch:
+            if not done.done():
+                done.set_result(ok)
+
+    async def run(self, duration: float) -> FleetStats:
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        async with httpx.AsyncClient(
+            base_url=self.server_url, headers=self.headers, limits=limits, timeout=30
+        ) as self.client:
+            batcher = None
+            if self.use_batch:
+                self._outbox = asyncio.Queue()
+                batcher = asyncio.create_task(self._run_batcher())
+            self.stats.started = time.perf_counter()
+            stop_at = asyncio.get_running_loop().time() + duration if duration > 0 else float("inf")
+            reporter = asyncio.create_task(self._report_progress())
+            try:
+                await asyncio.gather(*(device.run(stop_at) for device in self.devices))
+            finally:
+                reporter.cancel()
+                if batcher:
+                    batcher.cancel()
+        return self.stats
+
+    async def _report_progress(self, every: float = 10.0) -> None:
+        last = 0
+        while True:
+            await asyncio.sleep(every)
+            requests = self.stats.requests
+            print(f"  [FLEET] {(requests - last) / every:.0f} req/s, {requests} requests, "
+                  f"{self.queued()} reading(s) queued")
+            last = requests
+
+    def queued(self) -> int:
+        return sum(len(device.queue) for device in self.devices)
+
+
+def print_report(fleet: Fleet) -> None:
+    stats = fleet.stats
+    elapsed = time.perf_counter() - stats.started
+    print()
+    print("📊 Fleet Report")
+    print(f"   Devices: {len(fleet.devices)}")
+    print(f"   Elapsed: {elapsed:.1f}s")
+    print(f"   Requests: {stats.requests} ({stats.requests / elapsed:.1f} req/s)")
+    print(f"   Readings sent: {stats.readings_sent} ({stats.readings_sent / elapsed:.1f} readings/s)")
+    print(f"   Readings skipped (simulated failures): {stats.readings_skipped}")
+    print(f"   Readings queued on failure: {stats.readings_queued}, still queued: {fleet.queued()}")
+    print(f"   Responses: {dict(sorted(stats.statuses.items()))}")
+    print(f"   Retries after Retry-After: {stats.retries}")
+    if stats.latencies_ms:
+        print(f"   Latency ms: p50 {stats.percentile(50):.1f}, p95 {stats.percentile(95):.1f}, "
+              f"p99 {stats.percentile(99):.1f}, max {max(stats.latencies_ms):.1f}")
+    print(f"   Max schedule lag: {stats.max_lag_s:.2f}s")
+
+
+def run_fleet(args) -> None:
+    interval = args.devices / args.rate if args.rate else args.interval_seconds
+    fleet = Fleet(
+        server_url=args.server_url,
+        devices=args.devices,
+        interval_seconds=interval,
+        device_prefix=args.device_id or "sim",
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        api_key=args.api_key,
+        batch_size=args.batch_size,
+        max_queue=args.max_queue,
+        max_connections=args.max_connections,
+        use_batch=args.use_batch,
+        batch_wait_ms=args.batch_wait_ms,
+        retries=args.retries
+    )
+    print(f"🚀 Fleet Simulator Starting")
+    print(f"   Devices: {args.devices} ({fleet.devices[0].device_id} ...)")
+    print(f"   Server: {fleet.server_url}")
+    print(f"   Interval per device: {interval:.2f}s (~{args.devices / interval:.0f} readings/s)")
+    print(f"   Duration: {f'{args.duration:.0f}s' if args.duration > 0 else 'until Ctrl+C'}")
+    print(f"   Endpoint: {'batch (shared)' if args.use_batch else 'single reading'}")
+    print()
+    try:
+        asyncio.run(fleet.run(args.duration))
+    except KeyboardInterrupt:
+        print()
+        print("🛑 Fleet stopped by user")
+    print_report(fleet)
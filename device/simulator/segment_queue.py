@@ -0,0 +1,178 @@
+"""
+Durable store-and-forward queue: append-only JSONL segments plus a committed-offset checkpoint
+
+Layout of the queue directory:
+    00000000000000000000.jsonl   segment; the name is the index of its first record
+    00000000000000001873.jsonl   next segment, started when the previous one was full
+    checkpoint.json              {"index": ..., "segment": ..., "offset": ...} of the
+                                 first record not yet delivered
+
+Appends only ever write to the end of the newest segment. Delivery reads
+records from the checkpoint onwards in batches and, once the server has
+accepted a batch, moves the checkpoint past it (written to a temporary
+file, fsynced and renamed over the old one, so it is either the old or
+the new position after a crash). Segments entirely before the checkpoint
+are then deleted. Nothing is ever rewritten, so a crash can at worst
+resend the last batch, which the server deduplicates by event_id.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+CHECKPOINT = "checkpoint.json"
+SEGMENT_SUFFIX = ".jsonl"
+
+
+class Position(NamedTuple):
+    index: int  # records before this position, counted since the queue was created
+    segment: int  # first-record index (name) of the segment holding it
+    offset: int  # byte offset within that segment
+
+
+class SegmentQueue:
+    def __init__(self, directory: str, segment_bytes: int = 1 << 20, fsync: bool = True):
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._committed = self._read_checkpoint()
+        self._remove_consumed_segments()
+        self._tail_segment, self._tail_records, self._tail_bytes = self._recover_tail()
+        self._file = None
+
+    def __len__(self) -> int:
+        """Records appended but not yet committed. O(1)."""
+        return self._tail_segment + self._tail_records - self._committed.index
+
+    def append(self, record: dict) -> None:
+        line = (json.dumps(record) + "\n").encode()
+        if self._tail_bytes and self._tail_bytes + len(line) > self.segment_bytes:
+            self._close()
+            self._tail_segment += self._tail_records
+            self._tail_records = self._tail_bytes = 0
+        if self._file is None:
+            self._file = open(self._segment_path(self._tail_segment), "ab")
+        self._file.write(line)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._tail_records += 1
+        self._tail_bytes += len(line)
+
+    def read(self, limit: int, start: Optional[Position] = None) -> Tuple[List[dict], Position]:
+        """
+        Up to `limit` records from `start` (default: the checkpoint), and the position after them.
+        
+        Reads segment files sequentially; memory is bounded by `limit`,
+        not by the queue depth.
+        """
+        position = start or self._committed
+        records: List[dict] = []
+        for segment in self._segments_from(position.segment):
+            offset = position.offset if segment == position.segment else 0
+            index = position.index if segment == position.segment else segment
+            with open(self._segment_path(segment), "rb") as f:
+                f.seek(offset)
+                while len(records) < limit:
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        break  # end of segment (or a write still in progress)
+                    offset += len(line)
+                    index += 1
+                    records.append(json.loads(line))
+            position = Position(index, segment, offset)
+            if len(records) >= limit:
+                break
+        return records, position
+
+    def batches(self, size: int) -> Iterator[Tuple[List[dict], Position]]:
+        """Stream the queue from the checkpoint in batches; nothing is committed."""
+        position = self._committed
+        while True:
+            records, position = self.read(size, position)
+            if not records:
+                return
+            yield records, position
+
+    def commit(self, position: Position) -> None:
+        """Mark everything before `position` as delivered and drop consumed segments."""
+        if position.index <= self._committed.index:
+            return
+        tmp = self.directory / (CHECKPOINT + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(position._asdict(), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.directory / CHECKPOINT)
+        self._fsync_directory()
+        self._committed = position
+        self._remove_consumed_segments()
+
+    def close(self) -> None:
+        self._close()
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.directory / f"{segment:020d}{SEGMENT_SUFFIX}"
+
+    def _segments(self) -> List[int]:
+        return sorted(int(p.stem) for p in self.directory.glob("*" + SEGMENT_SUFFIX) if p.stem.isdigit())
+
+    def _segments_from(self, first: int) -> List[int]:
+        return [s for s in self._segments() if s >= first]
+
+    def _read_checkpoint(self) -> Position:
+        try:
+            with open(self.directory / CHECKPOINT) as f:
+                return Position(**json.load(f))
+        except FileNotFoundError:
+            segments = self._segments()
+            first = segments[0] if segments else 0
+            return Position(first, first, 0)
+
+    def _remove_consumed_segments(self) -> None:
+        # Also finishes a deletion interrupted by a crash after the checkpoint was written
+        removed = False
+        for segment in self._segments():
+            if segment >= self._committed.segment:
+                break
+            self._segment_path(segment).unlink()
+            removed = True
+        if removed:
+            self._fsync_directory()
+
+    def _recover_tail(self) -> Tuple[int, int, int]:
+        """
+        Find the newest segment and count its records.
+        
+        Only the newest segment is scanned (at most segment_bytes); a
+        partial last line left by a crash mid-append is cut off.
+        """
+        segments = self._segments()
+        if not segments:
+            return self._committed.segment, 0, 0
+        tail = segments[-1]
+        path = self._segment_path(tail)
+        with open(path, "rb") as f:
+            data = f.read()
+        complete = data.rfind(b"\n") + 1
+        if complete < len(data):
+            with open(path, "r+b") as f:
+                f.truncate(complete)
+                os.fsync(f.fileno())
+        return tail, data.count(b"\n", 0, complete), complete
+
+    def _fsync_directory(self) -> None:
+        if not self.fsync or os.name != "posix":
+            return
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
@@ -0,0 +1,86 @@
+"""
+Request body encodings for sending readings over metered links
+
+json     plain JSON (default)
+msgpack  MessagePack; ts as a timestamp extension, event_id as 16 raw bytes
+cbor     CBOR; ts as a tagged epoch timestamp, event_id as a tagged UUID
+
+Any of them can additionally be compressed with gzip or zstd
+(Content-Encoding). msgpack, cbor2 and zstandard are optional packages;
+the backend needs the same ones installed to accept these bodies.
+"""
+
+import gzip
+import json
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Tuple
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ENCODINGS = ("json", "msgpack", "cbor")
+COMPRESSIONS = ("none", "gzip", "zstd")
+
+CONTENT_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+    "cbor": "application/cbor",
+}
+
+
+def check_available(encoding: str, compression: str) -> None:
+    """Raise ImportError early if the package an encoding needs is missing."""
+    missing = {
+        "msgpack": msgpack is None and encoding == "msgpack",
+        "cbor2": cbor2 is None and encoding == "cbor",
+        "zstandard": zstandard is None and compression == "zstd",
+    }
+    for package, is_missing in missing.items():
+        if is_missing:
+            raise ImportError(f"--encoding {encoding} --compress {compression} needs: pip install {package}")
+
+
+def encode_body(body: Any, encoding: str = "json", compression: str = "none") -> Tuple[bytes, Dict[str, str]]:
+    """Serialize a reading (dict) or batch (list of dicts); returns the body and its headers."""
+    if encoding == "msgpack":
+        data = msgpack.packb(_compact(body, uuid_bytes=True), datetime=True)
+    elif encoding == "cbor":
+        data = cbor2.dumps(_compact(body, uuid_bytes=False), datetime_as_timestamp=True)
+    else:
+        data = json.dumps(body).encode()
+    
+    headers = {"Content-Type": CONTENT_TYPES[encoding]}
+    if compression == "gzip":
+        data = gzip.compress(data)
+        headers["Content-Encoding"] = "gzip"
+    elif compression == "zstd":
+        data = zstandard.ZstdCompressor().compress(data)
+        headers["Content-Encoding"] = "zstd"
+    return data, headers
+
+
+def _compact(body: Any, uuid_bytes: bool) -> Any:
+    """Native binary types for the fields JSON has to spell out as strings."""
+    if isinstance(body, list):
+        return [_compact(item, uuid_bytes) for item in body]
+    reading = dict(body)
+    if isinstance(reading.get("ts"), str):
+        ts = datetime.fromisoformat(reading["ts"].replace("Z", "+00:00"))
+        reading["ts"] = ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+    if isinstance(reading.get("event_id"), str):
+        event_id = uuid.UUID(reading["event_id"])
+        reading["event_id"] = event_id.bytes if uuid_bytes else event_id
+    return reading
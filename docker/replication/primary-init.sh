@@ -0,0 +1,11 @@
+#!/bin/sh
+# Runs once, when the primary's data volume is first initialized (docker-entrypoint-initdb.d):
+# creates the role the postgres-replica service streams WAL as (docker compose --profile replica).
+set -e
+
+psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<EOSQL
+CREATE ROLE replicator WITH REPLICATION LOGIN PASSWORD '${POSTGRES_REPLICATION_PASSWORD:-replicator_dev}';
+EOSQL
+
+# The image's pg_hba.conf only allows replication connections from localhost
+echo "host replication replicator all scram-sha-256" >> "$PGDATA/pg_hba.conf"